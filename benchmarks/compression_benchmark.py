@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Bandwidth benchmark of the kernel to frontend task payloads
+
+Compares, for the task messages of a recorded trace, the bytes sent to
+the frontend as per-message JSON, as columnar batches and as compressed
+columnar batches, along with the kernel CPU time of each encoding.
+
+Both the comm messages, read by JupyterLab and Notebook, and the display
+updates, read by the VS Code renderer, go through iopub and the websocket
+to every frontend, so the bytes of both are counted: one display update
+per task message with per-message JSON, one per batch with columnar
+batches.
+
+Record a trace by starting the kernel with SPARKMONITOR_TRACE_FILE set
+to a path; every listener message is appended to it, one per line.
+Without a trace a synthetic stage is generated.
+
+Usage:
+    python benchmarks/compression_benchmark.py [trace.jsonl] [--tasks N]
+        [--batch N] [--mbps N]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import time
+
+from sparkmonitor.columnar import TASK_MSGTYPES, TaskBatch
+from sparkmonitor.compression import compress_buffers, lz4_imported
+
+
+def synthetic_trace(num_tasks, num_executors=50):
+    """Task end messages shaped like those of the listener"""
+    start = int(time.time() * 1000)
+    for i in range(num_tasks):
+        executor = random.randrange(num_executors)
+        launch = start + i * 3
+        duration = random.randint(50, 5000)
+        yield {
+            'msgtype': 'sparkTaskEnd', 'appId': 'app-20240101000000-0001',
+            'launchTime': launch, 'finishTime': launch + duration,
+            'taskId': i, 'stageId': 3, 'taskType': 'ResultTask', 'stageAttemptId': 0,
+            'index': i, 'attemptNumber': 0, 'executorId': str(executor),
+            'host': 'worker-%03d.cluster.example.com' % executor, 'status': 'SUCCESS',
+            'speculative': False, 'errorMessage': None,
+            'metrics': {
+                'shuffleReadTime': random.randint(0, 100), 'shuffleWriteTime': random.randint(0, 50),
+                'serializationTime': 1, 'deserializationTime': random.randint(0, 20),
+                'gettingResultTime': 0, 'executorComputingTime': duration - 30,
+                'schedulerDelay': random.randint(0, 30), 'resultSize': random.randint(1000, 3000),
+                'jvmGCTime': random.randint(0, 100), 'memoryBytesSpilled': 0,
+                'diskBytesSpilled': 0, 'peakExecutionMemory': 0,
+                'shuffleReadTimeProportion': 1.5, 'schedulerDelayProportion': 0.4,
+            },
+            'emitTime': launch + duration + 500,
+        }
+
+
+def read_trace(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def display_size(payload):
+    """Bytes of the content of a display_data or update_display_data message"""
+    return len(json.dumps({
+        'data': {'application/vnd.sparkmonitor+json': payload},
+        'metadata': {},
+        'transient': {'display_id': 'run-00000000-0000-0000-0000-000000000000'},
+    }))
+
+
+def measure_json(messages):
+    """Bytes the kernel sent before columnar batches, a comm message and a display update per task"""
+    start = time.perf_counter()
+    commSize = 0
+    displaySize = 0
+    for data in messages:
+        wrapper = {'msgtype': 'fromscala', 'msg': json.dumps(data, indent=2)}
+        commSize += len(json.dumps(wrapper))
+        displaySize += display_size(wrapper)
+    return commSize, displaySize, time.perf_counter() - start
+
+
+def measure_columnar(messages, batch_size, codec):
+    """Bytes of the batches sent to the comm and of their display updates"""
+    start = time.perf_counter()
+    sizes = [0, 0]
+    batch = TaskBatch()
+    tasks = []
+
+    def flush():
+        msg, buffers = batch.pack()
+        buffers = compress_buffers(msg, buffers, codec)
+        sizes[0] += len(json.dumps(msg)) + sum(len(b) for b in buffers)
+        sizes[1] += display_size({'msgtype': 'fromscalatasks', 'tasks': tasks})
+        batch.reset()
+        del tasks[:]
+
+    for data in messages:
+        batch.add(data)
+        tasks.append(data)
+        if len(batch) >= batch_size:
+            flush()
+    if len(batch):
+        flush()
+    return sizes[0], sizes[1], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', nargs='?', help='Trace recorded with SPARKMONITOR_TRACE_FILE')
+    parser.add_argument('--tasks', type=int, default=50000, help='Tasks of the synthetic trace')
+    parser.add_argument('--batch', type=int, default=250, help='Task messages per batch')
+    parser.add_argument('--mbps', type=float, default=10.0, help='Link bandwidth in Mbit/s')
+    args = parser.parse_args()
+
+    source = read_trace(args.trace) if args.trace else synthetic_trace(args.tasks)
+    messages = [m for m in source if m.get('msgtype') in TASK_MSGTYPES]
+    print('%d task messages, batches of %d, %.0f Mbit/s link' % (len(messages), args.batch, args.mbps))
+
+    results = [('json per message', measure_json(messages)),
+               ('columnar', measure_columnar(messages, args.batch, None)),
+               ('columnar + zlib', measure_columnar(messages, args.batch, 'deflate'))]
+    if lz4_imported:
+        results.append(('columnar + lz4', measure_columnar(messages, args.batch, 'lz4')))
+
+    baseline = sum(results[0][1][:2])
+    print('%-20s %12s %12s %12s %8s %12s %12s' % (
+        'encoding', 'comm bytes', 'display', 'total', 'ratio', 'cpu (ms)', 'link (s)'))
+    for name, (commSize, displaySize, seconds) in results:
+        size = commSize + displaySize
+        print('%-20s %12d %12d %12d %7.1fx %12.1f %12.2f' % (
+            name, commSize, displaySize, size, baseline / float(size), seconds * 1000,
+            size * 8 / (args.mbps * 1e6)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Throughput and latency benchmark of the listener to kernel transports
+
+Compares loopback TCP with Unix domain sockets for the listener to
+kernel connection. A client thread writes listener-shaped messages
+delimited by ;EOD: and the server reads them the way the kernel
+extension does: 64 KiB reads, incremental UTF-8 decoding and splitting.
+
+Throughput is measured with a stream of task messages, latency with
+small messages answered by the server one at a time.
+
+Usage:
+    python benchmarks/transport_benchmark.py [--messages N] [--pings N]
+"""
+from __future__ import print_function
+
+import argparse
+import codecs
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+MESSAGE = json.dumps({
+    'msgtype': 'sparkTaskEnd', 'appId': 'app-20240101000000-0001',
+    'launchTime': 1704067200000, 'finishTime': 1704067201234, 'taskId': 123456,
+    'stageId': 3, 'taskType': 'ResultTask', 'stageAttemptId': 0, 'index': 1234,
+    'attemptNumber': 0, 'executorId': '17', 'host': 'worker-017.cluster.example.com',
+    'status': 'SUCCESS', 'speculative': False, 'errorMessage': None,
+    'metrics': {'shuffleReadTime': 12, 'shuffleWriteTime': 3, 'serializationTime': 1,
+                'deserializationTime': 8, 'gettingResultTime': 0,
+                'executorComputingTime': 1190, 'schedulerDelay': 20,
+                'resultSize': 2100, 'jvmGCTime': 35, 'memoryBytesSpilled': 0,
+                'diskBytesSpilled': 0, 'peakExecutionMemory': 0},
+    'emitTime': 1704067201734,
+}, indent=2) + ';EOD:'
+
+
+def listen(family):
+    """Return a listening server socket and the address to connect to"""
+    if family == socket.AF_UNIX:
+        directory = tempfile.mkdtemp(prefix='sparkmonitor-bench-')
+        address = os.path.join(directory, 'kernel.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('localhost', 0))
+        address = server.getsockname()
+    server.listen(1)
+    return server, address
+
+
+def read_messages(client, count, reply=False):
+    """Read count messages like ListenerConnection.run"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    received = 0
+    while received < count:
+        data = client.recv(65536)
+        if not data:
+            break
+        pending += decoder.decode(data)
+        pieces = pending.split(';EOD:')
+        pending = pieces[-1]
+        received += len(pieces) - 1
+        if reply and len(pieces) > 1:
+            client.sendall(b'k')
+    return received
+
+
+def measure_throughput(family, num_messages):
+    server, address = listen(family)
+    payload = MESSAGE.encode('utf-8')
+
+    def write():
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        for _ in range(num_messages):
+            sock.sendall(payload)
+        sock.close()
+
+    writer = threading.Thread(target=write)
+    start = time.perf_counter()
+    writer.start()
+    client, _ = server.accept()
+    received = read_messages(client, num_messages)
+    seconds = time.perf_counter() - start
+    writer.join()
+    client.close()
+    cleanup(server, family, address)
+    assert received == num_messages
+    return seconds, len(payload) * num_messages
+
+
+def measure_latency(family, num_pings):
+    server, address = listen(family)
+    payload = '{"msgtype": "sparkStageActive", "stageId": 3};EOD:'.encode('utf-8')
+    thread = threading.Thread(target=lambda: read_messages(server.accept()[0], num_pings, reply=True))
+    thread.start()
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+    if family != socket.AF_UNIX:
+        # The listener writes each message with a flush, like TCP_NODELAY
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    samples = []
+    for _ in range(num_pings):
+        start = time.perf_counter()
+        sock.sendall(payload)
+        sock.recv(1)
+        samples.append(time.perf_counter() - start)
+    sock.close()
+    thread.join()
+    cleanup(server, family, address)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def cleanup(server, family, address):
+    server.close()
+    if family == socket.AF_UNIX:
+        shutil.rmtree(os.path.dirname(address), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000, help='Task messages of the throughput test')
+    parser.add_argument('--pings', type=int, default=20000, help='Round trips of the latency test')
+    args = parser.parse_args()
+
+    transports = [('tcp', socket.AF_INET)]
+    if hasattr(socket, 'AF_UNIX'):
+        transports.append(('unix', socket.AF_UNIX))
+    print('%d messages of %d bytes, %d round trips' % (args.messages, len(MESSAGE), args.pings))
+    print('%-8s %12s %12s %14s %14s' % ('transport', 'MB/s', 'msgs/s', 'rtt p50 (us)', 'rtt p99 (us)'))
+    for name, family in transports:
+        seconds, size = measure_throughput(family, args.messages)
+        p50, p99 = measure_latency(family, args.pings)
+        print('%-8s %12.1f %12.0f %14.1f %14.1f' % (
+            name, size / seconds / 1e6, args.messages / seconds, p50 * 1e6, p99 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import org.apache.spark._
 import org.apache.spark.TaskEndReason
 import org.apache.spark.JobExecutionStatus
 import org.apache.spark.SparkContext
+import org.apache.spark.executor.TaskMetrics
 import sparkmonitor.listener.UIData._
 import scala.collection.mutable
 import scala.collection.mutable.{ HashMap, HashSet, LinkedHashMap, ListBuffer }
@@ -37,19 +38,34 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
   logger.info("Started SparkListener for Jupyter Notebook")
   val port = scala.util.Properties.envOrElse("SPARKMONITOR_KERNEL_PORT", "ERRORNOTFOUND")
   logger.info("Port obtained from environment: " + port)
+  /** Path of the Unix domain socket of the kernel, if it offers one. TCP is used otherwise. */
+  val socketPath = scala.util.Properties.envOrElse("SPARKMONITOR_KERNEL_SOCKET", "")
   var socket: Socket = null
+  var channel: java.nio.channels.SocketChannel = null
   var onStageStatusActiveTask: TimerTask = null
-  val sparkTasksQueue: BlockingQueue[String] = new LinkedBlockingQueue[String]()
+  val sparkTasksQueue: BlockingQueue[JObject] = new LinkedBlockingQueue[JObject]()
   var out: OutputStreamWriter = null
-  val sparkStageActiveTasksMaxMessages: Integer = 250
-  val sparkStageActiveRate: Long = 1000L // 1s
+  /** Stream of the control messages sent by the kernel. */
+  var in: InputStream = null
+  // Both can be changed at runtime by the kernel, see onControlMessage
+  @volatile var sparkStageActiveTasksMaxMessages: Int = 250
+  @volatile var sparkStageActiveRate: Long = 1000L // 1s
+  val stageUpdateTimer = new Timer()
+  /** Local property set by the kernel extension to the id of the cell execution that submits the job. */
+  val runIdProperty = "sparkmonitor.runId"
 
   logger.info("Starting Connection")
   startConnection()
 
-  /** Send a string message to the kernel using the socket. */
-  def send(msg: String): Unit = {
+  /**
+   * Send a JSON message to the kernel using the socket.
+   *
+   * Every message is stamped with the time it is written to the socket so the kernel can measure the lag behind Spark,
+   * and with the application id so the kernel can tell apart several applications connected at the same time.
+   */
+  def send(json: JObject): Unit = {
     try {
+      val msg = pretty(render(json ~ ("appId" -> appId) ~ ("emitTime" -> System.currentTimeMillis)))
       out.write(msg + ";EOD:")
       out.flush()
     } catch {
@@ -60,21 +76,144 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
   /** Start the socket connection to the kernel and start the send task. The kernel is the server already waiting for connections.*/
   def startConnection(): Unit = {
     try {
-      socket = new Socket("localhost", port.toInt)
-      out = new OutputStreamWriter(socket.getOutputStream())
+      val (output, input) = connectUnixSocket().getOrElse {
+        socket = new Socket("localhost", port.toInt)
+        (socket.getOutputStream(), socket.getInputStream())
+      }
+      out = new OutputStreamWriter(output)
+      in = input
+      scheduleStageUpdates()
+    } catch {
+      case exception: Throwable => logger.error("Exception creating socket: ", exception)
+    }
+  }
 
-      val t = new Timer()
+  /** Start, or restart at a new rate, the periodic updates of the active stages. */
+  def scheduleStageUpdates(): Unit = {
+    if (onStageStatusActiveTask != null) {
+      onStageStatusActiveTask.cancel()
+    }
+    onStageStatusActiveTask = new TimerTask {
+      def run() = {
+        onStageStatusActive()
+      }
+    }
+    stageUpdateTimer.schedule(onStageStatusActiveTask, sparkStageActiveRate, sparkStageActiveRate)
+  }
 
-      if (onStageStatusActiveTask == null) {
-        onStageStatusActiveTask = new TimerTask {
-          def run() = {
-            onStageStatusActive()
+  /**
+   * Read the control messages of the kernel in a background thread until the connection is closed.
+   *
+   * Control messages are JSON objects ended with ;EOD: like the messages sent to the kernel. The kernel writes them
+   * in ASCII, so a read never splits a character.
+   */
+  def startControlReader(): Unit = {
+    if (in == null) {
+      return
+    }
+    val reader = new Thread("sparkmonitor-control") {
+      override def run(): Unit = {
+        val buffer = new Array[Byte](4096)
+        val pending = new StringBuilder
+        try {
+          var n = in.read(buffer)
+          while (n >= 0) {
+            pending.append(new String(buffer, 0, n, java.nio.charset.StandardCharsets.US_ASCII))
+            var end = pending.indexOf(";EOD:")
+            while (end >= 0) {
+              onControlMessage(pending.substring(0, end))
+              pending.delete(0, end + 5)
+              end = pending.indexOf(";EOD:")
+            }
+            n = in.read(buffer)
+          }
+        } catch {
+          case exception: Throwable => logger.info("Control channel closed: " + exception)
+        }
+      }
+    }
+    reader.setDaemon(true)
+    reader.start()
+  }
+
+  /**
+   * Apply a control message of the kernel, which changes the detail sent to it at runtime.
+   *
+   * The kernel lowers the detail while nobody looks at it, options missing from the message are left unchanged.
+   * A task whose start was sent always has its end sent, whatever the options when it ends.
+   */
+  def onControlMessage(msg: String): Unit = synchronized {
+    implicit val formats: Formats = DefaultFormats
+    try {
+      val json = parse(msg)
+      if ((json \ "msgtype").extractOpt[String].contains("control")) {
+        (json \ "taskSampleRate").extractOpt[Int].foreach(rate => taskSampleRate = math.max(1, rate))
+        (json \ "taskReservoirSize").extractOpt[Int].foreach(size => taskReservoirSize = math.max(0, size))
+        (json \ "taskDetail").extractOpt[String].foreach(detail => taskDetail = detail)
+        (json \ "metricDetail").extractOpt[String].foreach(detail => metricDetail = detail)
+        (json \ "taskEventsPerTick").extractOpt[Int].foreach(n => sparkStageActiveTasksMaxMessages = math.max(1, n))
+        (json \ "executorMetricsRate").extractOpt[Long].foreach(rate => executorMetricsRate = math.max(0L, rate))
+        (json \ "stageActiveRate").extractOpt[Long].foreach { rate =>
+          if (rate > 0 && rate != sparkStageActiveRate) {
+            sparkStageActiveRate = rate
+            scheduleStageUpdates()
           }
         }
+        logger.info("Control message applied: " + msg)
       }
-      t.schedule(onStageStatusActiveTask, sparkStageActiveRate, sparkStageActiveRate)
     } catch {
-      case exception: Throwable => logger.error("Exception creating socket: ", exception)
+      case exception: Throwable => logger.error("Exception applying control message: ", exception)
+    }
+  }
+
+  /**
+   * Connect to the kernel through its Unix domain socket, which avoids the loopback TCP stack.
+   *
+   * Unix domain socket channels are available from Java 16, on older JVMs the listener falls back to TCP.
+   * Their classes are looked up by reflection so that the listener builds and loads on Java 8 and 11.
+   */
+  def connectUnixSocket(): Option[(OutputStream, InputStream)] = {
+    if (socketPath.isEmpty) {
+      return None
+    }
+    try {
+      val unix = java.net.StandardProtocolFamily.valueOf("UNIX")
+      val address = Class.forName("java.net.UnixDomainSocketAddress")
+        .getMethod("of", classOf[String])
+        .invoke(null, socketPath)
+        .asInstanceOf[SocketAddress]
+      channel = classOf[java.nio.channels.SocketChannel]
+        .getMethod("open", classOf[ProtocolFamily])
+        .invoke(null, unix)
+        .asInstanceOf[java.nio.channels.SocketChannel]
+      channel.connect(address)
+      logger.info("Connected to the kernel through Unix socket " + socketPath)
+      // Channels.newInputStream would hold the channel lock while waiting, and block the writes
+      val input = new InputStream {
+        override def read(): Int = {
+          val b = new Array[Byte](1)
+          if (read(b, 0, 1) < 0) -1 else b(0) & 0xff
+        }
+        override def read(b: Array[Byte], off: Int, len: Int): Int =
+          channel.read(java.nio.ByteBuffer.wrap(b, off, len))
+      }
+      Some((java.nio.channels.Channels.newOutputStream(channel), input))
+    } catch {
+      case _: IllegalArgumentException | _: ClassNotFoundException | _: NoSuchMethodException =>
+        logger.info("Unix domain sockets need Java 16 or later, using TCP")
+        closeChannel()
+        None
+      case exception: Throwable =>
+        logger.info("Could not connect to Unix socket " + socketPath + ", using TCP: " + exception)
+        closeChannel()
+        None
+    }
+  }
+
+  private def closeChannel(): Unit = {
+    if (channel != null) {
+      try channel.close() catch { case _: IOException => }
+      channel = null
     }
   }
 
@@ -82,8 +221,9 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
   def closeConnection(): Unit = {
     logger.info("Closing Connection")
     out.close()
-    socket.close()
+    if (channel != null) channel.close() else socket.close()
     onStageStatusActiveTask.cancel()
+    stageUpdateTimer.cancel()
   }
 
   type JobId = Int
@@ -94,7 +234,31 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
   //Application
   @volatile var startTime = -1L
   @volatile var endTime = -1L
-  var appId: String = ""
+  // The application id is known from the conf before onApplicationStart in client mode
+  var appId: String = conf.get("spark.app.id", "")
+
+  // Task sampling: the records of only some tasks are sent, task counts and duration sums stay exact
+  /** Send the records of one task in taskSampleRate, chosen by task index. */
+  @volatile var taskSampleRate: Int = math.max(1, conf.getInt("spark.sparkmonitor.taskSampleRate", 1))
+  /** Send the records of the n-th task of a stage with probability K / n for this K, 0 to disable.
+   *  Sent records cannot be evicted, a stage of n tasks sends about K * (1 + ln(n / K)). */
+  @volatile var taskReservoirSize: Int = math.max(0, conf.getInt("spark.sparkmonitor.taskReservoirSize", 0))
+  def taskSampling: Boolean = taskSampleRate > 1 || taskReservoirSize > 0
+  /**
+   * Level of task detail sent to the kernel: "full" sends the task records, "aggregate" only sends the per-stage task
+   * summaries with the stage updates, so that the traffic depends on the number of stages and not of tasks.
+   */
+  @volatile var taskDetail: String = conf.get("spark.sparkmonitor.taskDetail", "full")
+  /**
+   * Level of the task metrics sent: "full", or "basic" without the proportions of the task time, which can be
+   * derived from the other metrics.
+   */
+  @volatile var metricDetail: String = conf.get("spark.sparkmonitor.metricDetail", "full")
+  /** Smallest interval in ms between two memory samples sent for an executor, 0 to send none. */
+  @volatile var executorMetricsRate: Long = math.max(0L, conf.getLong("spark.sparkmonitor.executorMetricsRate", 5000L))
+
+  // The options above are set from the conf first, the kernel can change them from now on
+  startControlReader()
 
   //Jobs
   val activeJobs = new HashMap[JobId, JobUIData]
@@ -128,6 +292,22 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
   @volatile var totalCores: Int = 0
   @volatile var numExecutors: Int = 0
 
+  /** Executor memory metrics sent with the memory samples, and their JSON fields. */
+  val executorMemoryMetrics = Array(
+    "JVMHeapMemory" -> "jvmHeapMemory",
+    "JVMOffHeapMemory" -> "jvmOffHeapMemory",
+    "OnHeapExecutionMemory" -> "onHeapExecutionMemory",
+    "OffHeapExecutionMemory" -> "offHeapExecutionMemory",
+    "OnHeapStorageMemory" -> "onHeapStorageMemory",
+    "OffHeapStorageMemory" -> "offHeapStorageMemory",
+    "MinorGCTime" -> "minorGCTime",
+    "MajorGCTime" -> "majorGCTime")
+  /** Peaks of the memory metrics of each executor since its last sample sent, GC times are totals. */
+  val executorMemoryPeaks = new HashMap[String, Array[Long]]
+  val executorMetricsSentTime = new HashMap[String, Long]
+  /** Memory shared by execution and storage, from the block manager of each executor. */
+  val executorMaxMemory = new HashMap[String, Long]
+
   /**
    * Called when a spark application starts.
    *
@@ -139,12 +319,11 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     logger.info("Application Started: " + appId + "  ...Start Time: " + appStarted.time)
     val json = ("msgtype" -> "sparkApplicationStart") ~
       ("startTime" -> startTime) ~
-      ("appId" -> appId) ~
       ("appAttemptId" -> appStarted.appAttemptId.getOrElse("null")) ~
       ("appName" -> appStarted.appName) ~
       ("sparkUser" -> appStarted.sparkUser)
 
-    send(pretty(render(json)))
+    send(json)
   }
 
   /**
@@ -158,7 +337,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     val json = ("msgtype" -> "sparkApplicationEnd") ~
       ("endTime" -> endTime)
 
-    send(pretty(render(json)))
+    send(json)
     closeConnection()
   }
 
@@ -171,6 +350,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
       ("attemptId" -> stageInfo.attemptNumber) ~
       ("name" -> stageInfo.name) ~
       ("numTasks" -> stageInfo.numTasks) ~
+      ("parentIds" -> stageInfo.parentIds) ~
       ("completionTime" -> completionTime) ~
       ("submissionTime" -> submissionTime))
   }
@@ -187,6 +367,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
       props <- Option(jobStart.properties);
       group <- Option(props.getProperty("spark.jobGroup.id"))
     ) yield group
+    val runId = Option(jobStart.properties).flatMap(p => Option(p.getProperty(runIdProperty)))
 
     val jobData: JobUIData =
       new JobUIData(
@@ -221,6 +402,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     val name = jobStart.properties.getProperty("callSite.short", "null")
     val json = ("msgtype" -> "sparkJobStart") ~
       ("jobGroup" -> jobGroup.getOrElse("null")) ~
+      ("runId" -> runId.getOrElse("null")) ~
       ("jobId" -> jobStart.jobId) ~
       ("status" -> "RUNNING") ~
       ("submissionTime" -> Option(jobStart.time).filter(_ >= 0)) ~
@@ -228,12 +410,11 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
       ("stageInfos" -> stageinfojson) ~
       ("numTasks" -> jobData.numTasks) ~
       ("totalCores" -> totalCores) ~
-      ("appId" -> appId) ~
       ("numExecutors" -> numExecutors) ~
       ("name" -> name)
     logger.info("Job Start: " + jobStart.jobId)
     logger.debug(pretty(render(json)))
-    send(pretty(render(json)))
+    send(json)
   }
 
   /** Called when a job ends. */
@@ -285,7 +466,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     logger.info("Job End: " + jobEnd.jobId)
     logger.debug(pretty(render(json)))
 
-    send(pretty(render(json)))
+    send(json)
   }
 
   /** Called when a stage is completed. */
@@ -298,6 +479,7 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     })
     var status = "UNKNOWN"
     activeStages.remove(stage.stageId)
+    stageData.sentTasks.clear()
     if (stage.failureReason.isEmpty) {
       completedStages += stage
       numCompletedStages += 1
@@ -335,12 +517,15 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
       ("numTasks" -> stage.numTasks) ~
       ("numFailedTasks" -> stageData.numFailedTasks) ~
       ("numCompletedTasks" -> stageData.numCompletedTasks) ~
+      ("taskDurationSum" -> stageData.taskDurationSum) ~
+      ("taskSampling" -> taskSampling) ~
       ("status" -> status) ~
-      ("jobIds" -> jobIds)
+      ("jobIds" -> jobIds) ~
+      ("taskSummary" -> stageData.taskSummary.toJson)
 
     logger.info("Stage Completed: " + stage.stageId)
     logger.debug(pretty(render(json)))
-    send(pretty(render(json)))
+    send(json)
   }
 
   /** Called when a stage is submitted for execution. */
@@ -366,7 +551,9 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     val activeJobsDependentOnStage = stageIdToActiveJobIds.get(stage.stageId)
     val jobIds = activeJobsDependentOnStage
     val submissionTime: Long = stage.submissionTime.getOrElse(-1)
+    val runId = Option(stageSubmitted.properties).flatMap(p => Option(p.getProperty(runIdProperty)))
     val json = ("msgtype" -> "sparkStageSubmitted") ~
+      ("runId" -> runId.getOrElse("null")) ~
       ("stageId" -> stage.stageId) ~
       ("stageAttemptId" -> stage.attemptNumber) ~
       ("name" -> stage.name) ~
@@ -376,31 +563,41 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
       ("jobIds" -> jobIds)
     logger.info("Stage Submitted: " + stage.stageId)
     logger.debug(pretty(render(json)))
-    send(pretty(render(json)))
+    send(json)
   }
 
   /** Called when scheduled stage tasks update was requested */
   def onStageStatusActive(): Unit = {
-    // Update on status of active stages
-    for ((stageId, stageInfo) <- activeStages) {
-      val stageData = stageIdToData.getOrElseUpdate((stageInfo.stageId, stageInfo.attemptNumber), new StageUIData)
-      val jobIds = stageIdToActiveJobIds.get(stageInfo.stageId)
+    // Update on status of active stages, built under the lock of the callbacks updating them
+    val updates = synchronized {
+      activeStages.values.toList.map { stageInfo =>
+        val stageData = stageIdToData.getOrElseUpdate((stageInfo.stageId, stageInfo.attemptNumber), new StageUIData)
+        val jobIds = stageIdToActiveJobIds.get(stageInfo.stageId)
       
-      val json = ("msgtype" -> "sparkStageActive") ~
-        ("stageId" -> stageInfo.stageId) ~
-        ("stageAttemptId" -> stageInfo.attemptNumber) ~
-        ("name" -> stageInfo.name) ~
-        ("parentIds" -> stageInfo.parentIds) ~
-        ("numTasks" -> stageInfo.numTasks) ~
-        ("numActiveTasks" -> stageData.numActiveTasks) ~
-        ("numFailedTasks" -> stageData.numFailedTasks) ~
-        ("numCompletedTasks" -> stageData.numCompletedTasks) ~
-        ("jobIds" -> jobIds)
-
-      logger.info("Stage Update: " + stageInfo.stageId)
-      logger.debug(pretty(render(json)))
-      send(pretty(render(json)))
+        val json = ("msgtype" -> "sparkStageActive") ~
+          ("stageId" -> stageInfo.stageId) ~
+          ("stageAttemptId" -> stageInfo.attemptNumber) ~
+          ("name" -> stageInfo.name) ~
+          ("parentIds" -> stageInfo.parentIds) ~
+          ("numTasks" -> stageInfo.numTasks) ~
+          ("numActiveTasks" -> stageData.numActiveTasks) ~
+          ("numFailedTasks" -> stageData.numFailedTasks) ~
+          ("numCompletedTasks" -> stageData.numCompletedTasks) ~
+          ("taskDurationSum" -> stageData.taskDurationSum) ~
+          ("taskSampling" -> taskSampling) ~
+          ("jobIds" -> jobIds)
+
+        logger.info("Stage Update: " + stageInfo.stageId)
+        logger.debug(pretty(render(json)))
+        // The summary is only sent again when tasks ended since the last update
+        if (stageData.taskSummary.changed) {
+          json ~ ("taskSummary" -> stageData.taskSummary.toJson)
+        } else {
+          json
+        }
+      }
     }
+    updates.foreach(send)
 
     // Emit sparkStageActiveTasksMaxMessages spark tasks details from queue to frontend
     var count: Integer = 0
@@ -414,15 +611,49 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     }
   }
 
+  /**
+   * Decide whether the records of a starting task are sent.
+   *
+   * Returns the weight of the task, the inverse of its probability to be sent, or 0 if it is not sent.
+   */
+  def sampleTaskStart(stageData: StageUIData, taskInfo: TaskInfo): Double = {
+    stageData.numStartedTasks += 1
+    if (!taskSampling) {
+      return 1.0
+    }
+    val weight = if (taskReservoirSize > 0) {
+      // As reservoir sampling admits the n-th task, with probability K / n, without evictions
+      val n = stageData.numStartedTasks
+      if (n <= taskReservoirSize || scala.util.Random.nextDouble() * n < taskReservoirSize) {
+        math.max(1.0, n.toDouble / taskReservoirSize)
+      } else {
+        0.0
+      }
+    } else if (taskInfo.index % taskSampleRate == 0) {
+      taskSampleRate.toDouble
+    } else {
+      0.0
+    }
+    weight
+  }
+
   /** Called when a task is started. */
   override def onTaskStart(taskStart: SparkListenerTaskStart): Unit = synchronized {
     val taskInfo = taskStart.taskInfo
+    var weight = 0.0
     if (taskInfo != null) {
       val stageData = stageIdToData.getOrElseUpdate((taskStart.stageId, taskStart.stageAttemptId), {
         logger.info("Task start for unknown stage " + taskStart.stageId)
         new StageUIData
       })
       stageData.numActiveTasks += 1
+      weight = sampleTaskStart(stageData, taskInfo)
+      if (weight > 0 && taskDetail != "aggregate") {
+        // The end of a task is sent if and only if its start was
+        stageData.sentTasks(taskInfo.taskId) = weight
+      } else {
+        weight = 0.0
+      }
     }
     var jobjson = ("jobdata" -> "taskstart")
     for (
@@ -459,7 +690,9 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     logger.debug(pretty(render(json)))
 
     // Buffer the message for periodic flushing
-    sparkTasksQueue.put(pretty(render(json)))
+    if (weight > 0) {
+      sparkTasksQueue.put(if (weight != 1.0) json ~ ("sampleWeight" -> weight) else json)
+    }
   }
 
   /** Called when a task is ended. */
@@ -469,12 +702,15 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     // completion event is for. Let's just drop it here. This means we might have some speculation
     // tasks on the web ui that's never marked as complete.
     var errorMessage: Option[String] = None
+    var weight = 0.0
     if (info != null && taskEnd.stageAttemptId != -1) {
       val stageData = stageIdToData.getOrElseUpdate((taskEnd.stageId, taskEnd.stageAttemptId), {
         logger.info("Task end for unknown stage " + taskEnd.stageId)
         new StageUIData
       })
       stageData.numActiveTasks -= 1
+      stageData.taskDurationSum += math.max(0L, info.finishTime - info.launchTime)
+      weight = stageData.sentTasks.remove(info.taskId).getOrElse(0.0)
       errorMessage = taskEnd.reason match {
         case org.apache.spark.Success =>
           stageData.completedIndices.add(info.index)
@@ -535,6 +771,9 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
         shuffleWriteTimeProportion - serializationTimeProportion -
         deserializationTimeProportion - gettingResultTimeProportion, 0)
 
+    val io = new TaskIO
+    metricsOpt.foreach(io.read)
+
     val schedulerDelayProportionPos = 0
     val deserializationTimeProportionPos = schedulerDelayProportionPos + schedulerDelayProportion
     val shuffleReadTimeProportionPos = deserializationTimeProportionPos + deserializationTimeProportion
@@ -551,26 +790,38 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
         ("gettingResultTime" -> gettingResultTime) ~
         ("executorComputingTime" -> executorComputingTime) ~
         ("schedulerDelay" -> schedulerDelay) ~
-        ("shuffleReadTimeProportion" -> shuffleReadTimeProportion) ~
-        ("shuffleWriteTimeProportion" -> shuffleWriteTimeProportion) ~
-        ("serializationTimeProportion" -> serializationTimeProportion) ~
-        ("deserializationTimeProportion" -> deserializationTimeProportion) ~
-        ("gettingResultTimeProportion" -> gettingResultTimeProportion) ~
-        ("executorComputingTimeProportion" -> executorComputingTimeProportion) ~
-        ("schedulerDelayProportion" -> schedulerDelayProportion) ~
-        ("shuffleReadTimeProportionPos" -> shuffleReadTimeProportionPos) ~
-        ("shuffleWriteTimeProportionPos" -> shuffleWriteTimeProportionPos) ~
-        ("serializationTimeProportionPos" -> serializationTimeProportionPos) ~
-        ("deserializationTimeProportionPos" -> deserializationTimeProportionPos) ~
-        ("gettingResultTimeProportionPos" -> gettingResultTimeProportionPos) ~
-        ("executorComputingTimeProportionPos" -> executorRuntimeProportionPos) ~
-        ("schedulerDelayProportionPos" -> schedulerDelayProportionPos) ~
         ("resultSize" -> metricsOpt.map(_.resultSize).getOrElse(0L)) ~
         ("jvmGCTime" -> metricsOpt.map(_.jvmGCTime).getOrElse(0L)) ~
         ("memoryBytesSpilled" -> metricsOpt.map(_.memoryBytesSpilled).getOrElse(0L)) ~
         ("diskBytesSpilled" -> metricsOpt.map(_.diskBytesSpilled).getOrElse(0L)) ~
         ("peakExecutionMemory" -> metricsOpt.map(_.peakExecutionMemory).getOrElse(0L)) ~
         ("test" -> info.gettingResultTime)
+      if (metricDetail == "full") {
+        // Bytes and records of the task, their stage totals are always in the task summary
+        jsonMetrics = jsonMetrics ~
+          ("inputBytes" -> io.inputBytes) ~
+          ("inputRecords" -> io.inputRecords) ~
+          ("outputBytes" -> io.outputBytes) ~
+          ("outputRecords" -> io.outputRecords) ~
+          ("shuffleReadBytes" -> io.shuffleReadBytes) ~
+          ("shuffleReadRecords" -> io.shuffleReadRecords) ~
+          ("shuffleWriteBytes" -> io.shuffleWriteBytes) ~
+          ("shuffleWriteRecords" -> io.shuffleWriteRecords) ~
+          ("shuffleReadTimeProportion" -> shuffleReadTimeProportion) ~
+          ("shuffleWriteTimeProportion" -> shuffleWriteTimeProportion) ~
+          ("serializationTimeProportion" -> serializationTimeProportion) ~
+          ("deserializationTimeProportion" -> deserializationTimeProportion) ~
+          ("gettingResultTimeProportion" -> gettingResultTimeProportion) ~
+          ("executorComputingTimeProportion" -> executorComputingTimeProportion) ~
+          ("schedulerDelayProportion" -> schedulerDelayProportion) ~
+          ("shuffleReadTimeProportionPos" -> shuffleReadTimeProportionPos) ~
+          ("shuffleWriteTimeProportionPos" -> shuffleWriteTimeProportionPos) ~
+          ("serializationTimeProportionPos" -> serializationTimeProportionPos) ~
+          ("deserializationTimeProportionPos" -> deserializationTimeProportionPos) ~
+          ("gettingResultTimeProportionPos" -> gettingResultTimeProportionPos) ~
+          ("executorComputingTimeProportionPos" -> executorRuntimeProportionPos) ~
+          ("schedulerDelayProportionPos" -> schedulerDelayProportionPos)
+      }
     }
     val json = ("msgtype" -> "sparkTaskEnd") ~
       ("launchTime" -> info.launchTime) ~
@@ -591,8 +842,24 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     logger.info("Task Ended: " + info.taskId)
     logger.debug(pretty(render(json)))
 
+    if (info != null) {
+      for (stageData <- stageIdToData.get((taskEnd.stageId, taskEnd.stageAttemptId))) {
+        stageData.taskSummary.add(
+          info.executorId,
+          errorMessage.isDefined,
+          totalExecutionTime,
+          metricsOpt.map(_.jvmGCTime).getOrElse(0L),
+          metricsOpt.map(_.shuffleReadMetrics.totalBytesRead).getOrElse(0L),
+          metricsOpt.map(m => m.memoryBytesSpilled + m.diskBytesSpilled).getOrElse(0L),
+          metricsOpt.map(_.resultSize).getOrElse(0L),
+          io)
+      }
+    }
+
     // Buffer the message for periodic flushing
-    sparkTasksQueue.put(pretty(render(json)))
+    if (weight > 0) {
+      sparkTasksQueue.put(if (weight != 1.0) json ~ ("sampleWeight" -> weight) else json)
+    }
   }
 
   /** If stored stages data is too large, remove and garbage collect old stages */
@@ -649,13 +916,16 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
 
     logger.info("Executor Added: " + executorAdded.executorId)
     logger.debug(pretty(render(json)))
-    send(pretty(render(json)))
+    send(json)
   }
 
   /** Called when an executor is removed. */
   override def onExecutorRemoved(executorRemoved: SparkListenerExecutorRemoved): Unit = synchronized {
     totalCores -= executorCores.getOrElse(executorRemoved.executorId, 0)
     numExecutors -= 1
+    executorMemoryPeaks.remove(executorRemoved.executorId)
+    executorMetricsSentTime.remove(executorRemoved.executorId)
+    executorMaxMemory.remove(executorRemoved.executorId)
     val json = ("msgtype" -> "sparkExecutorRemoved") ~
       ("executorId" -> executorRemoved.executorId) ~
       ("time" -> executorRemoved.time) ~
@@ -664,7 +934,45 @@ class JupyterSparkMonitorListener(conf: SparkConf) extends SparkListener {
     logger.info("Executor Removed: " + executorRemoved.executorId)
     logger.debug(pretty(render(json)))
 
-    send(pretty(render(json)))
+    send(json)
+  }
+
+  /** Called when a block manager is added, gives the memory its executor shares between execution and storage. */
+  override def onBlockManagerAdded(blockManagerAdded: SparkListenerBlockManagerAdded): Unit = synchronized {
+    executorMaxMemory(blockManagerAdded.blockManagerId.executorId) = blockManagerAdded.maxMem
+  }
+
+  /**
+   * Called with the heartbeats of the executors and the driver.
+   *
+   * The heartbeats carry the peak memory of the executor since the previous heartbeat, for each of its running stages.
+   * The peaks are kept until a sample of the executor is sent, at most one every executorMetricsRate ms, so that no
+   * peak between two samples is lost.
+   */
+  override def onExecutorMetricsUpdate(update: SparkListenerExecutorMetricsUpdate): Unit = synchronized {
+    if (executorMetricsRate > 0 && update.executorUpdates.nonEmpty) {
+      val executorId = update.execId
+      val peaks = executorMemoryPeaks.getOrElseUpdate(executorId, new Array[Long](executorMemoryMetrics.length))
+      for (metrics <- update.executorUpdates.values; i <- executorMemoryMetrics.indices) {
+        peaks(i) = math.max(peaks(i), metrics.getMetricValue(executorMemoryMetrics(i)._1))
+      }
+      val now = System.currentTimeMillis
+      if (now - executorMetricsSentTime.getOrElse(executorId, 0L) >= executorMetricsRate) {
+        executorMetricsSentTime(executorId) = now
+        executorMemoryPeaks.remove(executorId)
+        val memoryConf = if (executorId == "driver") "spark.driver.memory" else "spark.executor.memory"
+        val json = executorMemoryMetrics.indices.foldLeft(
+          ("msgtype" -> "sparkExecutorMetrics") ~
+            ("executorId" -> executorId) ~
+            ("time" -> now) ~
+            ("maxHeapMemory" -> conf.getSizeAsBytes(memoryConf, "1g")) ~
+            ("maxMemory" -> executorMaxMemory.getOrElse(executorId, 0L))) {
+          (json, i) => json ~ (executorMemoryMetrics(i)._2 -> peaks(i))
+        }
+        logger.debug(pretty(render(json)))
+        send(json)
+      }
+    }
   }
 }
 
@@ -706,6 +1014,163 @@ object UIData {
     var completedIndices = new HashSet[Int]()
     var numFailedTasks: Int = _
     var description: Option[String] = None
+    var numStartedTasks: Int = _
+    var taskDurationSum: Long = _
+    /** Weights of the running tasks whose start was sent, by task id */
+    val sentTasks = new HashMap[Long, Double]
+    val taskSummary = new StageTaskSummary
+  }
+
+  /**
+   * Mergeable histogram of non negative values with logarithmic bins.
+   *
+   * Value v is counted in bin ceil(log(v) / log(gamma)), so quantiles have a relative error under (gamma - 1) / 2
+   * whatever the number of values. Histograms with the same gamma are merged by adding their bins.
+   */
+  class LogHistogram(val gamma: Double = 1.1) {
+    private val logGamma = math.log(gamma)
+    var count: Long = 0
+    var sum: Double = 0
+    var min: Double = Double.MaxValue
+    var max: Double = 0
+    /** Number of values equal to zero, which have no logarithmic bin */
+    var zeros: Long = 0
+    val bins = new HashMap[Int, Long]
+
+    def add(value: Double): Unit = {
+      count += 1
+      sum += value
+      min = math.min(min, value)
+      max = math.max(max, value)
+      if (value <= 0) {
+        zeros += 1
+      } else {
+        val bin = math.ceil(math.log(value) / logGamma).toInt
+        bins(bin) = bins.getOrElse(bin, 0L) + 1
+      }
+    }
+
+    /** Bins are sent as a dense list of counts starting at bin "offset". */
+    def toJson: JObject = {
+      val offset = if (bins.isEmpty) 0 else bins.keys.min
+      val last = if (bins.isEmpty) -1 else bins.keys.max
+      ("count" -> count) ~
+        ("sum" -> sum) ~
+        ("min" -> (if (count > 0) min else 0.0)) ~
+        ("max" -> max) ~
+        ("zeros" -> zeros) ~
+        ("gamma" -> gamma) ~
+        ("offset" -> offset) ~
+        ("bins" -> (offset to last).map(bin => bins.getOrElse(bin, 0L)).toList)
+    }
+  }
+
+  /** Bytes and records read and written by tasks, summed over the tasks of a stage. */
+  class TaskIO {
+    var inputBytes: Long = _
+    var inputRecords: Long = _
+    var outputBytes: Long = _
+    var outputRecords: Long = _
+    var shuffleReadBytes: Long = _
+    var shuffleReadRecords: Long = _
+    var shuffleWriteBytes: Long = _
+    var shuffleWriteRecords: Long = _
+
+    def read(metrics: TaskMetrics): Unit = {
+      inputBytes = metrics.inputMetrics.bytesRead
+      inputRecords = metrics.inputMetrics.recordsRead
+      outputBytes = metrics.outputMetrics.bytesWritten
+      outputRecords = metrics.outputMetrics.recordsWritten
+      shuffleReadBytes = metrics.shuffleReadMetrics.totalBytesRead
+      shuffleReadRecords = metrics.shuffleReadMetrics.recordsRead
+      shuffleWriteBytes = metrics.shuffleWriteMetrics.bytesWritten
+      shuffleWriteRecords = metrics.shuffleWriteMetrics.recordsWritten
+    }
+
+    def add(other: TaskIO): Unit = {
+      inputBytes += other.inputBytes
+      inputRecords += other.inputRecords
+      outputBytes += other.outputBytes
+      outputRecords += other.outputRecords
+      shuffleReadBytes += other.shuffleReadBytes
+      shuffleReadRecords += other.shuffleReadRecords
+      shuffleWriteBytes += other.shuffleWriteBytes
+      shuffleWriteRecords += other.shuffleWriteRecords
+    }
+
+    def toJson: JObject =
+      ("inputBytes" -> inputBytes) ~
+        ("inputRecords" -> inputRecords) ~
+        ("outputBytes" -> outputBytes) ~
+        ("outputRecords" -> outputRecords) ~
+        ("shuffleReadBytes" -> shuffleReadBytes) ~
+        ("shuffleReadRecords" -> shuffleReadRecords) ~
+        ("shuffleWriteBytes" -> shuffleWriteBytes) ~
+        ("shuffleWriteRecords" -> shuffleWriteRecords)
+  }
+
+  /** Task counts of one executor in a stage. */
+  class ExecutorTaskCounts {
+    var numTasks: Long = _
+    var numFailedTasks: Long = _
+    var durationSum: Long = _
+    /** Bytes read from the input and shuffle, and written to the output and shuffle */
+    var bytesRead: Long = _
+    var bytesWritten: Long = _
+  }
+
+  /**
+   * Summary of the ended tasks of a stage.
+   *
+   * Sent with the stage updates instead of, or along with, the task records. Its size depends on the spread of the
+   * values and on the number of executors, not on the number of tasks.
+   */
+  class StageTaskSummary {
+    val duration = new LogHistogram
+    val jvmGCTime = new LogHistogram
+    val shuffleReadBytes = new LogHistogram
+    val bytesSpilled = new LogHistogram
+    val resultSize = new LogHistogram
+    val io = new TaskIO
+    val executors = new HashMap[String, ExecutorTaskCounts]
+    /** Whether tasks ended since the summary was last sent */
+    var changed = false
+
+    def add(executorId: String, failed: Boolean, duration: Long, jvmGCTime: Long, shuffleReadBytes: Long,
+        bytesSpilled: Long, resultSize: Long, io: TaskIO): Unit = {
+      this.duration.add(duration)
+      this.jvmGCTime.add(jvmGCTime)
+      this.shuffleReadBytes.add(shuffleReadBytes)
+      this.bytesSpilled.add(bytesSpilled)
+      this.resultSize.add(resultSize)
+      this.io.add(io)
+      val counts = executors.getOrElseUpdate(executorId, new ExecutorTaskCounts)
+      counts.numTasks += 1
+      counts.durationSum += duration
+      counts.bytesRead += io.inputBytes + io.shuffleReadBytes
+      counts.bytesWritten += io.outputBytes + io.shuffleWriteBytes
+      if (failed) {
+        counts.numFailedTasks += 1
+      }
+      changed = true
+    }
+
+    def toJson: JObject = {
+      changed = false
+      ("duration" -> duration.toJson) ~
+        ("jvmGCTime" -> jvmGCTime.toJson) ~
+        ("shuffleReadBytes" -> shuffleReadBytes.toJson) ~
+        ("bytesSpilled" -> bytesSpilled.toJson) ~
+        ("resultSize" -> resultSize.toJson) ~
+        ("io" -> io.toJson) ~
+        ("executors" -> executors.map { case (executorId, counts) =>
+          executorId -> (("numTasks" -> counts.numTasks) ~
+            ("numFailedTasks" -> counts.numFailedTasks) ~
+            ("durationSum" -> counts.durationSum) ~
+            ("bytesRead" -> counts.bytesRead) ~
+            ("bytesWritten" -> counts.bytesWritten))
+        }.toMap)
+    }
   }
 
   /**
@@ -7,6 +7,30 @@ from __future__ import unicode_literals
 
 from ._version import __version__ 
 
+
+def on(event, fn, filter=None):
+    """Call fn with each listener event of a type, see kernelextension.subscribe"""
+    from .kernelextension import subscribe
+    return subscribe(event, fn, filter)
+
+
+def off(subscription):
+    """Cancel a subscription returned by on()"""
+    subscription.cancel()
+
+
+def start_session_log(path=None):
+    """Log the listener messages from now on for export(), see kernelextension.start_session_log"""
+    from .kernelextension import start_session_log as start
+    return start(path)
+
+
+def export(path, format='parquet', appId=None, **kwargs):
+    """Export the monitored jobs, stages, tasks and executor events, see kernelextension.export"""
+    from .kernelextension import export as export_session
+    return export_session(path, format, appId, **kwargs)
+
+
 def _jupyter_nbextension_paths():
     """Used by 'jupyter nbextension' command to install frontend extension"""
     return [dict(
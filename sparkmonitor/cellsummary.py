@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Cell Summaries
+
+The live monitor of a cell is published as one display output, updated
+with every listener message, which the VS Code renderer reads. Once the
+jobs of a cell execution end, that output is replaced by a compact
+summary of the execution, so that the saved notebook holds one small
+document per cell rather than the last of many event updates. Frontends
+render the monitor of a reopened notebook from the summary.
+
+Summary document, times in ms:
+
+    {'msgtype': 'summary', 'version': 1, 'runId', 'cellId', 'startTime',
+     'endTime', 'applications': [{appId, appName, appAttemptId,
+     numExecutors, totalCores}], 'jobs': [{appId, jobId, name, status,
+     submissionTime, completionTime, numTasks, numCompletedTasks,
+     numFailedTasks, stageIds, criticalPath, driverBottleneck}], 'stages': [{appId, stageId, attemptId,
+     name, status, numTasks, numCompletedTasks, numFailedTasks,
+     submissionTime, completionTime, duration, throughput}], 'taskSeries': {time,
+     numActiveTasks, numCores}, 'regression', 'utilisation'}
+
+duration holds quantiles of the task durations of the stage when the
+listener sends task summaries. The task series is the number of running
+tasks of the cell sampled at each stage update, downsampled to a bounded
+number of points, and is left out with SPARKMONITOR_SUMMARY_POINTS=0.
+The regression and utilisation notices of the execution are included
+as sent to the frontends, and the critical path analysis and driver
+bottleneck notice of each job with the job.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import time
+from threading import Lock
+
+from .routing import BoundedDict
+from .summaries import LogHistogram
+from .throughput import IO_KINDS, stage_throughput
+
+SUMMARY_VERSION = 1
+
+# Notices about one job of a run, kept with the job rather than the run
+JOB_NOTICES = ('criticalPath', 'driverBottleneck')
+
+# Largest number of points of the task series of a summary
+DEFAULT_POINTS = int(os.environ.get('SPARKMONITOR_SUMMARY_POINTS', 100))
+
+
+class TaskSeries:
+    """Running tasks over time in at most maxPoints points
+
+    When full, pairs of neighbouring points are merged, keeping the largest
+    number of running tasks, so that peaks survive the downsampling.
+    """
+
+    __slots__ = ('maxPoints', 'points')
+
+    def __init__(self, maxPoints=DEFAULT_POINTS):
+        self.maxPoints = maxPoints
+        self.points = []
+
+    def add(self, time, numActiveTasks, numCores):
+        if not self.maxPoints:
+            return
+        if self.points and self.points[-1][1:] == [numActiveTasks, numCores]:
+            return
+        self.points.append([time, numActiveTasks, numCores])
+        if len(self.points) > self.maxPoints:
+            merged = []
+            for i in range(0, len(self.points) - 1, 2):
+                first, second = self.points[i], self.points[i + 1]
+                merged.append([first[0], max(first[1], second[1]), second[2]])
+            if len(self.points) % 2:
+                merged.append(self.points[-1])
+            self.points = merged
+
+    def to_dict(self):
+        return {
+            'time': [p[0] for p in self.points],
+            'numActiveTasks': [p[1] for p in self.points],
+            'numCores': [p[2] for p in self.points],
+        }
+
+
+class CellRunSummary:
+    """Jobs and stages of one cell execution, accumulated as messages arrive"""
+
+    def __init__(self, runId, cellId=None, maxPoints=DEFAULT_POINTS):
+        """Constructor"""
+        self.runId = runId
+        self.cellId = cellId
+        self.startTime = time.time() * 1000
+        self.endTime = None
+        self.jobs = {}
+        self.stages = {}
+        self.runningJobs = set()
+        self.series = TaskSeries(maxPoints)
+        # Notices about the run by msgtype, such as its regression
+        self.notices = {}
+
+    def _stage(self, appId, stageId, attemptId=0):
+        key = (appId, stageId, attemptId)
+        stage = self.stages.get(key)
+        if stage is None:
+            stage = self.stages[key] = {
+                'appId': appId,
+                'stageId': stageId,
+                'attemptId': attemptId,
+                'name': None,
+                'status': 'PENDING',
+                'numTasks': 0,
+                'numActiveTasks': 0,
+                'numCompletedTasks': 0,
+                'numFailedTasks': 0,
+                'submissionTime': None,
+                'completionTime': None,
+            }
+        return stage
+
+    def on_job_start(self, data, appId):
+        jobId = data.get('jobId')
+        stageIds = []
+        for stageId, info in (data.get('stageInfos') or {}).items():
+            stage = self._stage(appId, int(stageId), info.get('attemptId', 0))
+            stage['name'] = info.get('name')
+            stage['numTasks'] = info.get('numTasks', 0)
+            stageIds.append(int(stageId))
+        self.jobs[(appId, jobId)] = {
+            'appId': appId,
+            'jobId': jobId,
+            'name': data.get('name'),
+            'status': data.get('status', 'RUNNING'),
+            'submissionTime': data.get('submissionTime'),
+            'completionTime': None,
+            'stageIds': sorted(stageIds),
+        }
+        self.runningJobs.add((appId, jobId))
+
+    def on_job_end(self, data, appId):
+        job = self.jobs.get((appId, data.get('jobId')))
+        self.runningJobs.discard((appId, data.get('jobId')))
+        if job is None:
+            return
+        job['status'] = data.get('status')
+        job['completionTime'] = data.get('completionTime')
+        for stage in self.stages.values():
+            if stage['appId'] == appId and stage['stageId'] in job['stageIds'] \
+                    and stage['status'] == 'PENDING':
+                stage['status'] = 'SKIPPED'
+
+    def on_stage(self, data, appId):
+        msgtype = data.get('msgtype')
+        stage = self._stage(appId, data.get('stageId'), data.get('stageAttemptId', 0))
+        stage['name'] = data.get('name', stage['name'])
+        stage['numTasks'] = data.get('numTasks', stage['numTasks'])
+        if msgtype == 'sparkStageSubmitted':
+            stage['status'] = 'RUNNING'
+            stage['submissionTime'] = data.get('submissionTime')
+        elif msgtype == 'sparkStageActive':
+            stage['numActiveTasks'] = data.get('numActiveTasks', 0)
+            stage['numCompletedTasks'] = data.get('numCompletedTasks', 0)
+            stage['numFailedTasks'] = data.get('numFailedTasks', 0)
+        elif msgtype == 'sparkStageCompleted':
+            stage['status'] = data.get('status')
+            stage['numActiveTasks'] = 0
+            stage['numCompletedTasks'] = data.get('numCompletedTasks', 0)
+            stage['numFailedTasks'] = data.get('numFailedTasks', 0)
+            stage['submissionTime'] = data.get('submissionTime', stage['submissionTime'])
+            stage['completionTime'] = data.get('completionTime')
+            summary = data.get('taskSummary') or {}
+            if summary.get('duration'):
+                duration = LogHistogram.from_json(summary['duration']).to_dict()
+                stage['duration'] = {k: duration[k] for k in ('mean', 'p50', 'p90', 'max')}
+            throughput = stage_throughput(data)
+            if throughput is not None:
+                stage['throughput'] = dict(
+                    (kind, {k: throughput[kind][k] for k in ('bytes', 'records', 'bytesPerSecond')})
+                    for kind in IO_KINDS)
+
+    def numActiveTasks(self):
+        return sum(stage['numActiveTasks'] for stage in self.stages.values())
+
+    def to_dict(self, applications, cores):
+        jobs = sorted(self.jobs.values(), key=lambda job: (str(job['appId']), job['jobId']))
+        stages = sorted(self.stages.values(),
+                        key=lambda s: (str(s['appId']), s['stageId'], s['attemptId']))
+        for job in jobs:
+            jobStages = [s for s in stages if s['appId'] == job['appId'] and
+                         s['stageId'] in job['stageIds'] and s['status'] != 'SKIPPED']
+            job['numTasks'] = sum(s['numTasks'] for s in jobStages)
+            job['numCompletedTasks'] = sum(s['numCompletedTasks'] for s in jobStages)
+            job['numFailedTasks'] = sum(s['numFailedTasks'] for s in jobStages)
+        apps = []
+        for appId in sorted(set(job['appId'] for job in jobs), key=str):
+            app = applications.get(appId) or {}
+            numExecutors, totalCores = cores.get(appId, (0, 0))
+            apps.append({
+                'appId': appId,
+                'appName': app.get('appName'),
+                'appAttemptId': app.get('appAttemptId'),
+                'numExecutors': numExecutors,
+                'totalCores': totalCores,
+            })
+        summary = {
+            'msgtype': 'summary',
+            'version': SUMMARY_VERSION,
+            'runId': self.runId,
+            'cellId': self.cellId,
+            'startTime': self.startTime,
+            'endTime': self.endTime,
+            'applications': apps,
+            'jobs': jobs,
+            'stages': [{k: v for k, v in s.items() if k != 'numActiveTasks'} for s in stages],
+        }
+        if self.series.points:
+            summary['taskSeries'] = self.series.to_dict()
+        summary.update(self.notices)
+        return summary
+
+
+class CellSummaries:
+    """Builds the summary of each cell execution and decides how its output is published"""
+
+    def __init__(self, publish, applications, maxPoints=DEFAULT_POINTS, maxsize=100):
+        """Constructor
+
+        publish(summary, displayId) replaces the live output of a cell with
+        its summary. applications is the dict of the Spark applications
+        seen by the kernel, by appId.
+        """
+        self.publish = publish
+        self.applications = applications
+        self.maxPoints = maxPoints
+        self.runs = BoundedDict(maxsize)
+        # Summaries already published, by run id, their output is not updated anymore
+        self.finished = BoundedDict(maxsize)
+        # Display ids with a live output
+        self.displayed = BoundedDict(10 * maxsize)
+        self.cores = {}
+        self.lock = Lock()
+
+    def start_run(self, runId, cellId=None):
+        with self.lock:
+            self.runs[runId] = CellRunSummary(runId, cellId, self.maxPoints)
+
+    def display_mode(self, displayId):
+        """Return False to create the live output of displayId, True to
+        update it, or None when it already holds the summary."""
+        if displayId is None:
+            return False
+        with self.lock:
+            if displayId in self.finished:
+                return None
+            if displayId in self.displayed:
+                return True
+            self.displayed[displayId] = True
+            return False
+
+    def on_message(self, data, runId, appId=None):
+        """Account a listener message routed to a cell execution"""
+        msgtype = data.get('msgtype')
+        if msgtype in ('sparkJobStart', 'sparkExecutorAdded', 'sparkExecutorRemoved'):
+            if data.get('totalCores') is not None:
+                numExecutors = self.cores.get(appId, (0, 0))[0]
+                self.cores[appId] = (data.get('numExecutors', numExecutors), data['totalCores'])
+        run = self.runs.get(runId)
+        if run is None:
+            return
+        if msgtype == 'sparkJobStart':
+            run.on_job_start(data, appId)
+        elif msgtype == 'sparkJobEnd':
+            run.on_job_end(data, appId)
+            if run.endTime is not None and not run.runningJobs:
+                self._finish(runId)
+        elif msgtype in ('sparkStageSubmitted', 'sparkStageActive', 'sparkStageCompleted'):
+            run.on_stage(data, appId)
+            if msgtype != 'sparkStageSubmitted':
+                run.series.add(data.get('emitTime') or time.time() * 1000,
+                               run.numActiveTasks(), self.cores.get(appId, (0, 0))[1])
+
+    def end_run(self, runId):
+        """Called after a cell is executed, the summary is published once its jobs end"""
+        run = self.runs.get(runId)
+        if run is None:
+            return
+        run.endTime = time.time() * 1000
+        if not run.runningJobs:
+            self._finish(runId)
+
+    def on_notice(self, notice):
+        """Include a notice about a run, such as a regression, in its summary
+
+        Returns True if the summary was already published and is published
+        again with the notice.
+        """
+        runId = notice.get('runId')
+        with self.lock:
+            run = self.runs.get(runId)
+            summary = self.finished.get(runId)
+        if notice['msgtype'] in JOB_NOTICES:
+            jobKey = (notice.get('appId'), notice.get('jobId'))
+            if summary is not None:
+                for job in summary['jobs']:
+                    if (job['appId'], job['jobId']) == jobKey:
+                        job[notice['msgtype']] = notice
+                        self.publish(summary, runId)
+                        return True
+            elif run is not None and jobKey in run.jobs:
+                run.jobs[jobKey][notice['msgtype']] = notice
+            return False
+        if summary is not None:
+            summary[notice['msgtype']] = notice
+            self.publish(summary, runId)
+            return True
+        if run is not None:
+            run.notices[notice['msgtype']] = notice
+        return False
+
+    def _finish(self, runId):
+        with self.lock:
+            run = self.runs.pop(runId, None)
+            if run is None or not run.jobs:
+                return
+            run.endTime = max(run.endTime or 0, max(job['completionTime'] or 0
+                                                    for job in run.jobs.values()))
+            summary = run.to_dict(self.applications, self.cores)
+            self.finished[runId] = summary
+        self.publish(summary, runId)
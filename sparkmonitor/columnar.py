@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Columnar Task Batches
+
+Packs sparkTaskStart/sparkTaskEnd messages into typed columns sent as
+binary comm buffers, so that task data is neither encoded as JSON twice
+by the kernel nor parsed twice by the browser. Every column is a raw
+little-endian array, which the frontends wrap in typed arrays.
+
+Times are sent as float64 rather than int64, millisecond timestamps are
+exact in a float64 and JavaScript reads them without BigInt conversion.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sys
+import time
+from array import array
+
+TASK_MSGTYPES = ('sparkTaskStart', 'sparkTaskEnd')
+
+# Column name, array typecode and JavaScript typed array name
+TASK_COLUMNS = (
+    ('isEnd', 'B', 'Uint8Array'),
+    ('taskId', 'd', 'Float64Array'),
+    ('stageId', 'i', 'Int32Array'),
+    ('stageAttemptId', 'i', 'Int32Array'),
+    ('index', 'i', 'Int32Array'),
+    ('attemptNumber', 'i', 'Int32Array'),
+    ('launchTime', 'd', 'Float64Array'),
+    ('finishTime', 'd', 'Float64Array'),
+    ('speculative', 'B', 'Uint8Array'),
+    ('weight', 'd', 'Float64Array'),
+)
+
+# Interned string columns, sent as int32 indices into the strings table
+STRING_COLUMNS = ('executorId', 'host', 'status', 'taskType')
+
+# Task end metrics, sent as float64, missing values are NaN
+METRIC_COLUMNS = (
+    'shuffleReadTime', 'shuffleWriteTime', 'serializationTime',
+    'deserializationTime', 'gettingResultTime', 'executorComputingTime',
+    'schedulerDelay', 'resultSize', 'jvmGCTime', 'memoryBytesSpilled',
+    'diskBytesSpilled', 'peakExecutionMemory',
+)
+
+NAN = float('nan')
+
+
+class TaskBatch:
+    """Accumulates task messages as columns"""
+
+    def __init__(self):
+        """Constructor"""
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.columns = [array(typecode) for _, typecode, _ in TASK_COLUMNS]
+        self.stringColumns = [array('i') for _ in STRING_COLUMNS]
+        self.metricColumns = [array('d') for _ in METRIC_COLUMNS]
+        self.strings = []
+        self.stringIndex = {}
+        self.errors = {}
+        self.started = time.time()
+
+    def __len__(self):
+        return self.count
+
+    def _intern(self, value):
+        value = '' if value is None else str(value)
+        index = self.stringIndex.get(value)
+        if index is None:
+            index = self.stringIndex[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def add(self, data):
+        """Append a parsed task message"""
+        isEnd = data.get('msgtype') == 'sparkTaskEnd'
+        values = (
+            isEnd,
+            data.get('taskId', -1),
+            data.get('stageId', -1),
+            data.get('stageAttemptId', -1),
+            data.get('index', -1),
+            data.get('attemptNumber', -1),
+            data.get('launchTime') or 0,
+            data.get('finishTime') or 0,
+            bool(data.get('speculative')),
+            data.get('weight', 1),
+        )
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        for column, name in zip(self.stringColumns, STRING_COLUMNS):
+            column.append(self._intern(data.get(name)))
+        metrics = data.get('metrics') or {}
+        for column, name in zip(self.metricColumns, METRIC_COLUMNS):
+            value = metrics.get(name)
+            column.append(value if isinstance(value, (int, float)) else NAN)
+        if not self.count:
+            self.started = time.time()
+        error = data.get('errorMessage')
+        if error:
+            self.errors[self.count] = error
+        self.count += 1
+
+    def pack(self):
+        """Return the batch as a comm message and its list of buffers"""
+        columns = []
+        buffers = []
+        arrays = (
+            [(name, jstype, col) for (name, _, jstype), col in zip(TASK_COLUMNS, self.columns)] +
+            [(name, 'Int32Array', col) for name, col in zip(STRING_COLUMNS, self.stringColumns)] +
+            [(name, 'Float64Array', col) for name, col in zip(METRIC_COLUMNS, self.metricColumns)]
+        )
+        for name, jstype, col in arrays:
+            if sys.byteorder == 'big':
+                col = array(col.typecode, col)
+                col.byteswap()
+            columns.append({'name': name, 'type': jstype})
+            buffers.append(col.tobytes())
+        msg = {
+            'msgtype': 'taskbatch',
+            'count': self.count,
+            'columns': columns,
+            'strings': self.strings,
+            'stringColumns': list(STRING_COLUMNS),
+            'errors': self.errors,
+        }
+        return msg, buffers
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Comm Compression
+
+Compresses the binary buffers of large batched comm messages before they
+go through ZMQ and the Jupyter server websocket. Small payloads are sent
+as they are, compression is only worth it for large stages on slow links.
+
+Frontends announce the codecs they can decode when opening the comm.
+Browsers inflate zlib natively with DecompressionStream('deflate'); lz4
+is used when the python lz4 package is installed and a frontend accepts it.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import zlib
+
+try:
+    import lz4.frame
+    lz4_imported = True
+except ImportError:
+    lz4_imported = False
+
+# Payloads smaller than this many bytes are not compressed
+DEFAULT_THRESHOLD = int(os.environ.get('SPARKMONITOR_COMPRESSION_THRESHOLD', 32 * 1024))
+
+# Buffers compressing worse than this are sent uncompressed
+MAX_RATIO = 0.9
+
+
+def choose_codec(accepted):
+    """Return the best codec among those a frontend accepts, or None"""
+    accepted = accepted or []
+    if lz4_imported and 'lz4' in accepted:
+        return 'lz4'
+    if 'deflate' in accepted:
+        return 'deflate'
+    return None
+
+
+def zlib_level(size):
+    """Trade ratio for speed on the largest payloads"""
+    if size > 8 * 1024 * 1024:
+        return 1
+    if size > 1024 * 1024:
+        return 3
+    return 6
+
+
+def compress_buffers(msg, buffers, codec, threshold=DEFAULT_THRESHOLD):
+    """Compress the buffers of a message in place if they are large enough
+
+    Sets msg['compression'] to the codec and msg['compressed'] to a flag
+    per buffer. Returns the (possibly) compressed list of buffers.
+    """
+    if codec is None or not buffers:
+        return buffers
+    size = sum(len(b) for b in buffers)
+    if size < threshold:
+        return buffers
+    level = zlib_level(size)
+    result = []
+    flags = []
+    for buf in buffers:
+        if codec == 'lz4':
+            packed = lz4.frame.compress(buf)
+        else:
+            packed = zlib.compress(buf, level)
+        if len(packed) < len(buf) * MAX_RATIO:
+            result.append(packed)
+            flags.append(True)
+        else:
+            result.append(buf)
+            flags.append(False)
+    if any(flags):
+        msg['compression'] = codec
+        msg['compressed'] = flags
+        return result
+    return buffers
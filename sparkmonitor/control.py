@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Listener Control
+
+Changes the detail sent by the Spark listeners at runtime. The kernel
+writes control messages to the listener sockets, JSON objects ended with
+;EOD: like the listener messages, which the listener applies to the
+messages it sends from then on:
+
+    {"msgtype": "control", "taskDetail": "aggregate", "stageActiveRate": 2000}
+
+The options come from three sources. The frontends report the views open
+in their cell displays, and the task records are only requested while a
+task chart is shown, the only view using them, or while a consumer in the
+kernel needs them: callbacks subscribed to task events, a tracer
+exporting task spans or the session log. The CPU governor lowers
+the detail while the extension uses more CPU than its budget, whatever
+the views. Options set through the Python API take precedence over both. An option no longer requested
+is set back to the listener default, overriding the Spark configuration.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from threading import Lock
+
+# Options of the listener and their allowed values, or their type
+LISTENER_OPTIONS = {
+    # Send the records of one task in taskSampleRate
+    'taskSampleRate': int,
+    # Send the records of the n-th task of a stage with probability K / n for this K, 0 to disable
+    'taskReservoirSize': int,
+    # Send the task records, or only the per-stage task summaries
+    'taskDetail': ('full', 'aggregate'),
+    # Send the proportions of the task time with the task metrics or not
+    'metricDetail': ('full', 'basic'),
+    # Interval of the stage updates in ms, task records are sent with them
+    'stageActiveRate': int,
+    # Largest number of task records sent with each stage update
+    'taskEventsPerTick': int,
+    # Smallest interval between two memory samples of an executor in ms, 0 to disable them
+    'executorMetricsRate': int,
+}
+
+# Defaults of the listener, sent when an option is no longer requested
+DEFAULT_OPTIONS = {
+    'taskSampleRate': 1,
+    'taskReservoirSize': 0,
+    'taskDetail': 'full',
+    'metricDetail': 'full',
+    'stageActiveRate': 1000,
+    'taskEventsPerTick': 250,
+    'executorMetricsRate': 5000,
+}
+
+# Views of the cell displays needing the task records
+TASK_VIEWS = ('taskchart',)
+
+
+def validate_options(options):
+    """Raise ValueError on an unknown option or value"""
+    for name, value in options.items():
+        allowed = LISTENER_OPTIONS.get(name)
+        if allowed is None:
+            raise ValueError('Unknown listener option %s, expected one of %s'
+                             % (name, ', '.join(sorted(LISTENER_OPTIONS))))
+        if allowed is int:
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError('%s must be a non negative integer' % name)
+        elif value not in allowed:
+            raise ValueError('%s must be one of %s' % (name, ', '.join(allowed)))
+
+
+class ListenerControl:
+    """Options requested from the listeners, from the frontend views and the API"""
+
+    def __init__(self, send):
+        """Constructor
+
+        send is called with a control message for all connected listeners.
+        """
+        self.send = send
+        self.user = {}
+        self.views = {}
+        self.governed = {}
+        self.consumers = set()
+        self.sent = {}
+        self.lock = Lock()
+
+    def set_options(self, **options):
+        """Set listener options, None resets an option to its default"""
+        validate_options({k: v for k, v in options.items() if v is not None})
+        with self.lock:
+            for name, value in options.items():
+                if value is None:
+                    self.user.pop(name, None)
+                else:
+                    self.user[name] = value
+            self._apply()
+
+    def on_views(self, clientId, views):
+        """Called with the views open in the cell displays of a frontend"""
+        with self.lock:
+            self.views[clientId] = set(views or ())
+            self._apply()
+
+    def set_governed(self, options):
+        """Called with the options of the level of detail set by the CPU governor"""
+        with self.lock:
+            self.governed = dict(options)
+            self._apply()
+
+    def set_task_consumer(self, name, active):
+        """Called when a consumer of the task records in the kernel starts or stops needing them"""
+        with self.lock:
+            if active == (name in self.consumers):
+                return
+            if active:
+                self.consumers.add(name)
+            else:
+                self.consumers.discard(name)
+            self._apply()
+
+    def forget_client(self, clientId):
+        """Called when the comm of a frontend is closed"""
+        with self.lock:
+            if self.views.pop(clientId, None) is not None:
+                self._apply()
+
+    def options(self):
+        """Return the options requested from the listeners"""
+        options = {}
+        if self.consumers:
+            options['taskDetail'] = 'full'
+        elif self.views:
+            # Only pay for the task records while someone looks at them
+            open_views = set().union(*self.views.values())
+            looked_at = any(view in open_views for view in TASK_VIEWS)
+            options['taskDetail'] = 'full' if looked_at else 'aggregate'
+        options.update(self.governed)
+        options.update(self.user)
+        return options
+
+    def on_connect(self, send):
+        """Send the current options to a new listener connection"""
+        with self.lock:
+            if self.sent:
+                send(dict(self.sent, msgtype='control'))
+
+    def _apply(self):
+        options = self.options()
+        for name in self.sent:
+            options.setdefault(name, DEFAULT_OPTIONS[name])
+        changed = {k: v for k, v in options.items() if self.sent.get(k) != v}
+        if not changed:
+            return
+        self.sent.update(changed)
+        changed['msgtype'] = 'control'
+        self.send(changed)
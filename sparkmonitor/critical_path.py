@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Critical Path Analysis
+
+Builds the stage dependency graph of each job from the parentIds of its
+stages and, when the job ends, finds the chain of stages which set its
+duration and how much each other stage could have been delayed.
+
+With d(s) the duration of stage s, from its first submission to its last
+completion and 0 for stages skipped or run by an earlier job, the
+earliest finish of a stage is EF(s) = d(s) + max(EF(p)) over its parents
+p, and the critical path ends at the stage with the latest EF, going
+back through the parent with the latest EF. The latest finish of a stage
+not delaying the job is LF(s) = min(LF(c) - d(c)) over its children c,
+or the length of the critical path for stages without children, and its
+slack is LF(s) - EF(s). Stages of the critical path have no slack; the
+longest of them are reported as the bottlenecks of the job, with their
+share of the critical path.
+
+Times are in ms, as sent by the listener.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from threading import Lock
+
+from .routing import BoundedDict
+
+# Largest number of bottleneck stages reported per job
+MAX_BOTTLENECKS = 3
+
+
+class StageNode:
+    """Times and parents of a stage, shared by the jobs using it"""
+
+    __slots__ = ('stageId', 'name', 'parentIds', 'submissionTime', 'completionTime')
+
+    def __init__(self, stageId):
+        self.stageId = stageId
+        self.name = None
+        self.parentIds = ()
+        self.submissionTime = None
+        self.completionTime = None
+
+    def update(self, data):
+        self.name = data.get('name', self.name)
+        if data.get('parentIds') is not None:
+            self.parentIds = tuple(data['parentIds'])
+        submissionTime = data.get('submissionTime')
+        if submissionTime is not None and submissionTime >= 0:
+            # Retried stages count from their first attempt
+            if self.submissionTime is None or submissionTime < self.submissionTime:
+                self.submissionTime = submissionTime
+        completionTime = data.get('completionTime')
+        if completionTime is not None and completionTime >= 0:
+            self.completionTime = max(self.completionTime or 0, completionTime)
+
+    def duration(self, jobSubmissionTime=None):
+        """Duration of the stage in a job, 0 if the job reused its output"""
+        if self.submissionTime is None or self.completionTime is None:
+            return 0
+        if jobSubmissionTime is not None and self.submissionTime < jobSubmissionTime:
+            return 0
+        return max(0, self.completionTime - self.submissionTime)
+
+
+def topological_order(stageIds, parents):
+    """Stage ids ordered so that parents come before their children"""
+    children = dict((stageId, []) for stageId in stageIds)
+    indegree = dict((stageId, 0) for stageId in stageIds)
+    for stageId in stageIds:
+        for parentId in parents[stageId]:
+            children[parentId].append(stageId)
+            indegree[stageId] += 1
+    ready = sorted(s for s in stageIds if not indegree[s])
+    order = []
+    while ready:
+        stageId = ready.pop()
+        order.append(stageId)
+        for childId in children[stageId]:
+            indegree[childId] -= 1
+            if not indegree[childId]:
+                ready.append(childId)
+    return order, children
+
+
+def critical_path(durations, parentIds):
+    """Analyse the stages of a job, given their durations and parents by stage id
+
+    Returns the critical path as a list of stage ids, its length and a
+    dict of (duration, slack) by stage id.
+    """
+    stageIds = list(durations)
+    parents = dict((s, [p for p in parentIds[s] if p in durations]) for s in stageIds)
+    order, children = topological_order(stageIds, parents)
+    earliest = {}
+    previous = {}
+    for stageId in order:
+        start, previous[stageId] = 0, None
+        for parentId in parents[stageId]:
+            if earliest[parentId] > start or previous[stageId] is None:
+                start, previous[stageId] = earliest[parentId], parentId
+        earliest[stageId] = start + durations[stageId]
+    if not earliest:
+        return [], 0, {}
+    length = max(earliest.values())
+    # Among stages ending last, the latest one ends the path
+    stageId = max(earliest, key=lambda s: (earliest[s], s))
+    path = []
+    while stageId is not None:
+        path.append(stageId)
+        stageId = previous[stageId]
+    path.reverse()
+    latest = {}
+    for stageId in reversed(order):
+        latest[stageId] = min([latest[c] - durations[c] for c in children[stageId]] or [length])
+    analysis = dict((s, (durations[s], max(0, latest[s] - earliest[s]))) for s in order)
+    return path, length, analysis
+
+
+class CriticalPathAnalyzer:
+    """Stage graphs of the running jobs, analysed when each job ends"""
+
+    def __init__(self, notify=None, maxsize=100, maxStages=10000):
+        """Constructor
+
+        notify is called with the analysis of each ended job. The analyses
+        of the last maxsize jobs are kept.
+        """
+        self.notify = notify
+        self.stages = BoundedDict(maxStages)
+        # Submission time and stage ids of the running jobs, by (appId, jobId)
+        self.jobs = BoundedDict(maxsize)
+        self.reports = BoundedDict(maxsize)
+        self.lastJob = None
+        self.lock = Lock()
+
+    def _stage(self, appId, stageId):
+        key = (appId, stageId)
+        stage = self.stages.get(key)
+        if stage is None:
+            stage = self.stages[key] = StageNode(stageId)
+        return stage
+
+    def on_message(self, data, runId=None, appId=None, cellId=None):
+        """Account a listener message"""
+        msgtype = data.get('msgtype')
+        report = None
+        with self.lock:
+            if msgtype == 'sparkJobStart':
+                stageIds = []
+                for stageId, info in (data.get('stageInfos') or {}).items():
+                    self._stage(appId, int(stageId)).update(info)
+                    stageIds.append(int(stageId))
+                self.jobs[(appId, data.get('jobId'))] = (data.get('submissionTime'), stageIds)
+            elif msgtype in ('sparkStageSubmitted', 'sparkStageCompleted'):
+                self._stage(appId, data.get('stageId')).update(data)
+            elif msgtype == 'sparkJobEnd':
+                job = self.jobs.pop((appId, data.get('jobId')), None)
+                if job is None:
+                    return
+                report = self._analyse(data, job, runId, appId, cellId)
+                self.reports[(appId, data.get('jobId'))] = report
+                self.lastJob = (appId, data.get('jobId'))
+        if report is not None and self.notify is not None:
+            self.notify(report)
+
+    def _analyse(self, data, job, runId, appId, cellId):
+        submissionTime, stageIds = job
+        stages = dict((stageId, self._stage(appId, stageId)) for stageId in stageIds)
+        path, length, analysis = critical_path(
+            dict((s, stage.duration(submissionTime)) for s, stage in stages.items()),
+            dict((s, stage.parentIds) for s, stage in stages.items()))
+        onPath = set(path)
+        bottlenecks = sorted(path, key=lambda s: -analysis[s][0])[:MAX_BOTTLENECKS]
+        return {
+            'msgtype': 'criticalPath',
+            'runId': runId,
+            'cellId': cellId,
+            'appId': appId,
+            'jobId': data.get('jobId'),
+            'pathDuration': length,
+            'criticalPath': path,
+            'stages': [{
+                'stageId': stageId,
+                'name': stages[stageId].name,
+                'duration': analysis[stageId][0],
+                'slack': analysis[stageId][1],
+                'critical': stageId in onPath,
+            } for stageId in sorted(analysis)],
+            'bottlenecks': [{
+                'stageId': stageId,
+                'name': stages[stageId].name,
+                'duration': analysis[stageId][0],
+                'share': analysis[stageId][0] / length if length else 0,
+            } for stageId in bottlenecks if analysis[stageId][0] > 0],
+        }
+
+    def report(self, jobId=None, appId=None):
+        """Return the analysis of an ended job, the last one by default"""
+        with self.lock:
+            if jobId is None:
+                return self.reports.get(self.lastJob)
+            if appId is None:
+                for key in reversed(self.reports):
+                    if key[1] == jobId:
+                        return self.reports[key]
+                return None
+            return self.reports.get((appId, jobId))
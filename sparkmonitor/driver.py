@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Driver Bottleneck Detection
+
+Large collect() or toPandas() calls send the output of their last stage
+to the driver, which can take longer than computing it or exhaust the
+driver memory. The result tasks report their result size, the time the
+driver spent fetching results too large to be sent with the task status,
+and the time spent serialising them on the executors.
+
+Running totals of these are kept per stage, from the task end events,
+weighted by their sampling weight, and from the exact result size of the
+task summaries of the stage updates. When the bytes sent to the driver or
+the time spent getting and serialising the results cross their limits, a
+driverBottleneck notice about the job of the stage is sent, and sent again
+with the final totals when the stage completes.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+from threading import Lock
+
+from .routing import BoundedDict
+
+# Limits of the results of a stage, in bytes and seconds
+DEFAULT_MAX_RESULT_BYTES = int(os.environ.get('SPARKMONITOR_DRIVER_RESULT_BYTES', 256 * 1024 * 1024))
+DEFAULT_MAX_RESULT_TIME = float(os.environ.get('SPARKMONITOR_DRIVER_RESULT_SECONDS', 10))
+
+
+class StageResults:
+    """Running totals of the results a stage sends to the driver"""
+
+    __slots__ = ('stageId', 'stageAttemptId', 'name', 'jobIds', 'runId', 'resultBytes',
+                 'exactBytes', 'gettingResultTime', 'serializationTime', 'numTasks', 'warned')
+
+    def __init__(self, stageId, stageAttemptId):
+        self.stageId = stageId
+        self.stageAttemptId = stageAttemptId
+        self.name = None
+        self.jobIds = []
+        self.runId = None
+        self.resultBytes = 0.0
+        # Sum of the result sizes from the task summary, exact if known
+        self.exactBytes = None
+        self.gettingResultTime = 0.0
+        self.serializationTime = 0.0
+        self.numTasks = 0
+        self.warned = False
+
+    def bytes(self):
+        return self.exactBytes if self.exactBytes is not None else self.resultBytes
+
+    def resultTime(self):
+        """Time spent getting and serialising the results, in ms"""
+        return self.gettingResultTime + self.serializationTime
+
+
+class DriverBottleneckDetector:
+    """Warns about the stages sending too much data to the driver"""
+
+    def __init__(self, notify=None, maxResultBytes=DEFAULT_MAX_RESULT_BYTES,
+                 maxResultTime=DEFAULT_MAX_RESULT_TIME, maxsize=1000):
+        """Constructor
+
+        notify is called with the notices, maxResultTime is in seconds.
+        """
+        self.notify = notify
+        self.maxResultBytes = maxResultBytes
+        self.maxResultTime = maxResultTime
+        self.stages = BoundedDict(maxsize)
+        self.reports = BoundedDict(maxsize)
+        self.lastJob = None
+        self.lock = Lock()
+
+    def _stage(self, data, appId):
+        key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+        stage = self.stages.get(key)
+        if stage is None:
+            stage = self.stages[key] = StageResults(data.get('stageId'), data.get('stageAttemptId'))
+        return stage
+
+    def on_message(self, data, runId=None, appId=None, cellId=None):
+        """Account a listener message"""
+        msgtype = data.get('msgtype')
+        if msgtype not in ('sparkStageSubmitted', 'sparkStageActive', 'sparkStageCompleted',
+                           'sparkTaskEnd'):
+            return
+        notice = None
+        with self.lock:
+            stage = self._stage(data, appId)
+            if runId:
+                stage.runId = runId
+            if msgtype == 'sparkTaskEnd':
+                metrics = data.get('metrics') or {}
+                weight = data.get('sampleWeight', 1)
+                stage.resultBytes += metrics.get('resultSize', 0) * weight
+                stage.gettingResultTime += metrics.get('gettingResultTime', 0) * weight
+                stage.serializationTime += metrics.get('serializationTime', 0) * weight
+                stage.numTasks += weight
+            else:
+                stage.name = data.get('name', stage.name)
+                stage.jobIds = data.get('jobIds') or stage.jobIds
+                summary = (data.get('taskSummary') or {}).get('resultSize')
+                if summary is not None:
+                    stage.exactBytes = summary.get('sum')
+            exceeded = self._exceeded(stage)
+            if exceeded and (not stage.warned or msgtype == 'sparkStageCompleted'):
+                stage.warned = True
+                notice = self._notice(stage, exceeded, appId, cellId)
+                self.reports[(appId, notice['jobId'])] = notice
+                self.lastJob = (appId, notice['jobId'])
+            if msgtype == 'sparkStageCompleted':
+                del self.stages[(appId, stage.stageId, stage.stageAttemptId)]
+        if notice is not None and self.notify is not None:
+            self.notify(notice)
+
+    def _exceeded(self, stage):
+        exceeded = []
+        if self.maxResultBytes and stage.bytes() >= self.maxResultBytes:
+            exceeded.append('resultBytes')
+        if self.maxResultTime and stage.resultTime() >= self.maxResultTime * 1000:
+            exceeded.append('resultTime')
+        return exceeded
+
+    def _notice(self, stage, exceeded, appId, cellId):
+        return {
+            'msgtype': 'driverBottleneck',
+            'runId': stage.runId,
+            'cellId': cellId,
+            'appId': appId,
+            'jobId': stage.jobIds[0] if stage.jobIds else None,
+            'jobIds': [{'appId': appId, 'jobId': jobId} for jobId in stage.jobIds],
+            'stageId': stage.stageId,
+            'stageAttemptId': stage.stageAttemptId,
+            'name': stage.name,
+            'exceeded': exceeded,
+            'resultBytes': stage.bytes(),
+            'gettingResultTime': stage.gettingResultTime,
+            'serializationTime': stage.serializationTime,
+            'sampledTasks': stage.numTasks,
+            'maxResultBytes': self.maxResultBytes,
+            'maxResultTime': self.maxResultTime,
+        }
+
+    def report(self, jobId=None, appId=None):
+        """Return the last notice about a job, the last job warned about by default"""
+        with self.lock:
+            if jobId is None:
+                return self.reports.get(self.lastJob)
+            if appId is None:
+                for key in reversed(self.reports):
+                    if key[1] == jobId:
+                        return self.reports[key]
+                return None
+            return self.reports.get((appId, jobId))
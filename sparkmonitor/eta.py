@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Completion Time Estimates
+
+Predicts when running stages and jobs complete from the tasks left, the
+distribution of the task durations seen so far and the number of task
+slots (executor cores).
+
+With R tasks left, P slots, and task durations of mean m and standard
+deviation s measured on n tasks, the time left is estimated as R * m / P.
+Its uncertainty combines the spread of the durations of the tasks left,
+sqrt(R) * s / P, and that of the estimated mean, R * s / sqrt(n) / P.
+Running tasks are counted as half done.
+
+Every listener message is accounted in constant time, job estimates are
+kept up to date with running totals rather than by scanning their stages.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import math
+import time
+
+from .routing import BoundedDict
+
+# Two-sided 90% interval of a normal distribution
+DEFAULT_Z = 1.645
+
+
+class RunningStats:
+    """Weighted mean and variance, updated in constant time (Welford)"""
+
+    __slots__ = ('weight', 'count', 'mean', 'm2')
+
+    def __init__(self):
+        self.weight = 0.0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value, weight=1.0):
+        self.count += 1
+        self.weight += weight
+        delta = value - self.mean
+        self.mean += delta * weight / self.weight
+        self.m2 += weight * delta * (value - self.mean)
+
+    @property
+    def std(self):
+        if self.count < 2:
+            # A single task says nothing of the spread, assume exponential durations
+            return self.mean
+        return math.sqrt(self.m2 / self.weight)
+
+
+class StageProgress:
+    """Progress of the current attempt of a stage"""
+
+    __slots__ = ('attemptId', 'numTasks', 'numCompleted', 'numActive',
+                 'durationSum', 'durations', 'jobIds', 'done')
+
+    def __init__(self, numTasks=0):
+        self.attemptId = 0
+        self.numTasks = numTasks
+        self.numCompleted = 0
+        self.numActive = 0
+        self.durationSum = 0
+        self.durations = RunningStats()
+        self.jobIds = ()
+        self.done = False
+
+    @property
+    def remaining(self):
+        return 0 if self.done else max(0, self.numTasks - self.numCompleted)
+
+
+class JobProgress:
+    """Tasks left in a job and durations of its tasks"""
+
+    __slots__ = ('remaining', 'durations')
+
+    def __init__(self, remaining=0):
+        self.remaining = remaining
+        self.durations = RunningStats()
+
+
+class EtaEstimator:
+    """Streaming completion time estimates of stages and jobs"""
+
+    def __init__(self, z=DEFAULT_Z, maxsize=10000):
+        """Constructor
+
+        z sets the width of the confidence interval, maxsize bounds the
+        number of stages and jobs kept.
+        """
+        self.z = z
+        self.stages = BoundedDict(maxsize)
+        self.jobs = BoundedDict(maxsize)
+        self.cores = {}
+
+    def on_message(self, data, appId=None):
+        """Account a parsed listener message
+
+        Returns the estimates to send with sparkStageActive and
+        sparkStageCompleted messages, None for other messages.
+        """
+        msgtype = data.get('msgtype')
+        if msgtype == 'sparkTaskEnd':
+            self._on_task_end(data, appId)
+        elif msgtype == 'sparkStageActive':
+            return self._on_stage_active(data, appId)
+        elif msgtype == 'sparkStageSubmitted':
+            self._on_stage_submitted(data, appId)
+        elif msgtype == 'sparkStageCompleted':
+            return self._on_stage_completed(data, appId)
+        elif msgtype == 'sparkJobStart':
+            self._on_job_start(data, appId)
+        elif msgtype == 'sparkJobEnd':
+            self.jobs.pop((appId, data.get('jobId')), None)
+        elif msgtype in ('sparkExecutorAdded', 'sparkExecutorRemoved'):
+            self.cores[appId] = data.get('totalCores', 0)
+        return None
+
+    def _stage(self, appId, stageId):
+        stage = self.stages.get((appId, stageId))
+        if stage is None:
+            stage = self.stages[(appId, stageId)] = StageProgress()
+        return stage
+
+    def _on_job_start(self, data, appId):
+        if data.get('totalCores'):
+            self.cores[appId] = data['totalCores']
+        job = JobProgress()
+        for stageId, info in (data.get('stageInfos') or {}).items():
+            if info.get('completionTime', -1) != -1:
+                continue  # Computed by an earlier job, will be skipped
+            stage = self._stage(appId, int(stageId))
+            stage.numTasks = info.get('numTasks', 0)
+            stage.jobIds = stage.jobIds + (data.get('jobId'),)
+            job.remaining += stage.remaining
+        self.jobs[(appId, data.get('jobId'))] = job
+
+    def _on_stage_submitted(self, data, appId):
+        stage = self._stage(appId, data.get('stageId'))
+        if data.get('stageAttemptId', 0) != stage.attemptId:
+            # A retry runs the missing partitions again
+            self._move_remaining(appId, stage, 0)
+            stage.attemptId = data.get('stageAttemptId', 0)
+            stage.numCompleted = 0
+            stage.done = False
+            stage.numTasks = data.get('numTasks', stage.numTasks)
+            self._move_remaining(appId, stage, stage.remaining, old=0)
+        if data.get('jobIds'):
+            stage.jobIds = tuple(data['jobIds'])
+
+    def _move_remaining(self, appId, stage, new, old=None):
+        """Report a change of the tasks left in a stage to its jobs"""
+        delta = new - (stage.remaining if old is None else old)
+        if not delta:
+            return
+        for jobId in stage.jobIds:
+            job = self.jobs.get((appId, jobId))
+            if job is not None:
+                job.remaining = max(0, job.remaining + delta)
+
+    def _on_task_end(self, data, appId):
+        finishTime = data.get('finishTime') or 0
+        launchTime = data.get('launchTime') or 0
+        if finishTime <= launchTime:
+            return
+        duration = finishTime - launchTime
+        weight = data.get('weight') or data.get('sampleWeight') or 1
+        stage = self._stage(appId, data.get('stageId'))
+        stage.durations.add(duration, weight)
+        for jobId in stage.jobIds:
+            job = self.jobs.get((appId, jobId))
+            if job is not None:
+                job.durations.add(duration, weight)
+
+    def _update_counts(self, data, appId):
+        stage = self._stage(appId, data.get('stageId'))
+        remaining = max(0, data.get('numTasks', stage.numTasks) - data.get('numCompletedTasks', 0))
+        self._move_remaining(appId, stage, remaining)
+        stage.numTasks = data.get('numTasks', stage.numTasks)
+        stage.numCompleted = data.get('numCompletedTasks', 0)
+        stage.numActive = data.get('numActiveTasks', 0)
+        stage.durationSum = data.get('taskDurationSum', stage.durationSum)
+        if data.get('jobIds'):
+            stage.jobIds = tuple(data['jobIds'])
+        return stage
+
+    def _on_stage_active(self, data, appId):
+        stage = self._update_counts(data, appId)
+        return {
+            'stage': self.estimate(stage.remaining, stage.numActive,
+                                   self._durations(stage), self.cores.get(appId, 0)),
+            'jobs': self._job_estimates(appId, stage),
+        }
+
+    def _on_stage_completed(self, data, appId):
+        stage = self._stage(appId, data.get('stageId'))
+        self._move_remaining(appId, stage, 0)
+        stage.done = True
+        stage.numActive = 0
+        return {
+            'stage': None,
+            'jobs': self._job_estimates(appId, stage),
+        }
+
+    def _durations(self, stage):
+        """Duration stats of a stage, from its task ends or its duration sum"""
+        if stage.durations.count or not stage.durationSum or not stage.numCompleted:
+            return stage.durations
+        # Task records are not sent in aggregate mode, the listener sends the sum
+        stats = RunningStats()
+        stats.add(float(stage.durationSum) / stage.numCompleted, stage.numCompleted)
+        return stats
+
+    def _job_estimates(self, appId, stage):
+        estimates = {}
+        for jobId in stage.jobIds:
+            job = self.jobs.get((appId, jobId))
+            if job is None:
+                continue
+            durations = job.durations if job.durations.count else self._durations(stage)
+            estimates[jobId] = self.estimate(job.remaining, stage.numActive, durations,
+                                             self.cores.get(appId, 0))
+        return estimates
+
+    def estimate(self, remaining, numActive, durations, cores):
+        """Return the estimated time left in ms and its confidence interval
+
+        Returns None while no task duration is known.
+        """
+        now = time.time() * 1000
+        if not remaining:
+            return {'remaining': 0, 'low': 0, 'high': 0, 'completionTime': now}
+        if not durations.count:
+            return None
+        running = min(numActive, remaining)
+        slots = max(1, min(remaining, max(cores, numActive)))
+        mean = durations.mean
+        std = durations.std
+        work = (remaining - running * 0.5) * mean
+        spread = math.sqrt(remaining * std ** 2 + (remaining * std) ** 2 / durations.count)
+        left = work / slots
+        margin = self.z * spread / slots
+        return {
+            'remaining': left,
+            'low': max(0.0, left - margin),
+            'high': left + margin,
+            'completionTime': now + left,
+        }
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Event Subscriptions
+
+Lets Python code in the kernel react to the listener events, for example
+to cancel a job group when a stage spills too much or to record stage
+metrics:
+
+    import sparkmonitor
+
+    def on_spill(event):
+        if event.taskSummary['bytesSpilled']['sum'] > 10e9:
+            spark.sparkContext.cancelJobGroup('etl')
+
+    sparkmonitor.on('stageCompleted', on_spill, filter={'status': 'COMPLETED'})
+
+Subscriptions are indexed by event type, so an event nobody subscribed
+to costs a dict lookup. Filters given as a dict of field values are
+checked on the socket thread and only matching events are queued, other
+filters are functions of the event called with the callback. Callbacks
+run in order on a worker thread, off the socket thread, so slow callbacks
+do not delay the monitoring; when more than maxPending events wait for
+them, new events are dropped and counted.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+# Event types and the listener messages they correspond to
+EVENT_TYPES = {
+    'applicationStart': 'sparkApplicationStart',
+    'applicationEnd': 'sparkApplicationEnd',
+    'jobStart': 'sparkJobStart',
+    'jobEnd': 'sparkJobEnd',
+    'stageSubmitted': 'sparkStageSubmitted',
+    'stageActive': 'sparkStageActive',
+    'stageCompleted': 'sparkStageCompleted',
+    'taskStart': 'sparkTaskStart',
+    'taskEnd': 'sparkTaskEnd',
+    'executorAdded': 'sparkExecutorAdded',
+    'executorRemoved': 'sparkExecutorRemoved',
+    'executorMetrics': 'sparkExecutorMetrics',
+}
+
+EVENT_NAMES = dict((msgtype, type) for type, msgtype in EVENT_TYPES.items())
+
+# Listener messages only sent with the full task detail
+TASK_MSGTYPES = ('sparkTaskStart', 'sparkTaskEnd')
+
+# Largest number of events waiting for the callbacks
+DEFAULT_MAX_PENDING = 10000
+
+
+class SparkEvent:
+    """A listener event, its fields are available as attributes or items"""
+
+    __slots__ = ('type', 'appId', 'runId', 'cellId', 'data')
+
+    def __init__(self, type, data, appId=None, runId=None, cellId=None):
+        """Constructor, data is copied as the kernel keeps updating the message"""
+        self.type = type
+        self.data = dict(data)
+        self.appId = appId
+        self.runId = runId
+        self.cellId = cellId
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def get(self, name, default=None):
+        return self.data.get(name, default)
+
+    def __repr__(self):
+        return 'SparkEvent(%r, %r)' % (self.type, self.data)
+
+
+class Subscription:
+    """A callback subscribed to an event type, cancel() unsubscribes it"""
+
+    def __init__(self, dispatcher, type, fn, filter=None):
+        """Constructor"""
+        self.dispatcher = dispatcher
+        self.type = type
+        self.fn = fn
+        self.fields = filter if isinstance(filter, dict) else None
+        self.predicate = filter if callable(filter) else None
+        self.active = True
+
+    def matches(self, data, appId):
+        """Check the field filter, on the socket thread"""
+        for name, value in self.fields.items():
+            actual = appId if name == 'appId' else data.get(name)
+            if actual != value:
+                return False
+        return True
+
+    def cancel(self):
+        self.dispatcher.unsubscribe(self)
+
+
+def event_msgtype(type):
+    """Listener msgtype of an event type, raises ValueError if unknown"""
+    if type in EVENT_TYPES:
+        return EVENT_TYPES[type]
+    if type in EVENT_TYPES.values():
+        return type
+    raise ValueError('Unknown event type %s, expected one of %s'
+                     % (type, ', '.join(sorted(EVENT_TYPES))))
+
+
+class EventDispatcher:
+    """Calls the subscribed callbacks with the listener events, on a worker thread"""
+
+    def __init__(self, metrics, cellOf=None, maxPending=DEFAULT_MAX_PENDING,
+                 onTaskSubscriptions=None):
+        """Constructor
+
+        cellOf returns the frontend cell id of a run id. onTaskSubscriptions
+        is called with whether callbacks are subscribed to task events when
+        the first one subscribes and when the last one unsubscribes.
+        """
+        self.cellOf = cellOf
+        self.onTaskSubscriptions = onTaskSubscriptions
+        self.subscriptions = {}
+        self.maxPending = maxPending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = Lock()
+        self.dispatched = metrics.counter(
+            'events_dispatched', 'Listener events queued for subscribed callbacks')
+        self.dropped = metrics.counter(
+            'events_dropped', 'Listener events dropped because callbacks fell behind')
+        self.failed = metrics.counter(
+            'event_callback_errors', 'Subscribed callbacks which raised an exception')
+        metrics.gauge('events_pending', 'Listener events waiting for the callbacks',
+                      fn=lambda: self.pending)
+
+    def subscribe(self, type, fn, filter=None):
+        if not callable(fn):
+            raise TypeError('The callback must be callable')
+        if filter is not None and not isinstance(filter, dict) and not callable(filter):
+            raise TypeError('filter must be a dict of field values or a function of the event')
+        msgtype = event_msgtype(type)
+        subscription = Subscription(self, msgtype, fn, filter)
+        with self.lock:
+            # Copied so that dispatch reads the lists without the lock
+            self.subscriptions[msgtype] = self.subscriptions.get(msgtype, ()) + (subscription,)
+        if msgtype in TASK_MSGTYPES:
+            self._task_subscriptions_changed()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscription.active = False
+            remaining = tuple(s for s in self.subscriptions.get(subscription.type, ())
+                              if s is not subscription)
+            if remaining:
+                self.subscriptions[subscription.type] = remaining
+            else:
+                self.subscriptions.pop(subscription.type, None)
+        if subscription.type in TASK_MSGTYPES:
+            self._task_subscriptions_changed()
+
+    def _task_subscriptions_changed(self):
+        if self.onTaskSubscriptions is not None:
+            subscribed = any(msgtype in self.subscriptions for msgtype in TASK_MSGTYPES)
+            self.onTaskSubscriptions(subscribed)
+
+    def dispatch(self, data, appId=None, runId=None):
+        """Queue a listener message for the callbacks subscribed to its type"""
+        msgtype = data.get('msgtype')
+        subscriptions = self.subscriptions.get(msgtype)
+        if not subscriptions:
+            return
+        matching = [s for s in subscriptions if s.fields is None or s.matches(data, appId)]
+        if not matching:
+            return
+        if self.pending >= self.maxPending:
+            self.dropped.inc()
+            return
+        with self.lock:
+            self.pending += 1
+        self.dispatched.inc()
+        cellId = self.cellOf(runId) if self.cellOf and runId else None
+        event = SparkEvent(EVENT_NAMES[msgtype], data, appId, runId, cellId)
+        self.executor.submit(self._run, matching, event)
+
+    def _run(self, subscriptions, event):
+        try:
+            for subscription in subscriptions:
+                if not subscription.active:
+                    continue
+                try:
+                    if subscription.predicate is None or subscription.predicate(event):
+                        subscription.fn(event)
+                except Exception as e:
+                    self.failed.inc()
+                    logger.warn('SparkMonitor event callback %r failed: %s', subscription.fn, e)
+        finally:
+            with self.lock:
+                self.pending -= 1
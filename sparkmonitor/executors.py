@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Executor Memory
+
+The listener samples the memory of each executor and of the driver from
+their heartbeats, at most once every executorMetricsRate ms: the peaks
+since the previous sample of the JVM heap, the JVM off-heap memory and
+the execution and storage memory, with the limit of the heap from the
+Spark configuration, and the total time the executor spent in GC.
+
+A bounded series of the samples is kept per executor. From two samples
+follows the fraction of the time the executor spent in GC between them,
+which rises when its tasks produce garbage faster than it is collected,
+usually before the executor runs out of memory.
+
+An executorAlert notice is sent when the heap of an executor gets close
+to its limit or its GC fraction crosses its limit, and sent again with
+active False once it falls back well below the limit, so that alerts do
+not flap around their threshold.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+from collections import deque
+from threading import Lock
+
+from .routing import BoundedDict
+
+# Limits of the used fraction of the heap and of the time spent in GC
+DEFAULT_MAX_HEAP_FRACTION = float(os.environ.get('SPARKMONITOR_EXECUTOR_HEAP_FRACTION', 0.9))
+DEFAULT_MAX_GC_FRACTION = float(os.environ.get('SPARKMONITOR_EXECUTOR_GC_FRACTION', 0.1))
+
+# An alert ends when its value falls below this fraction of its limit
+CLEAR_RATIO = 0.8
+
+# Samples kept per executor, 30 minutes at the default rate of the listener
+SERIES_LENGTH = 360
+
+
+class ExecutorMemory:
+    """Memory samples of one executor and its active alerts"""
+
+    __slots__ = ('executorId', 'samples', 'alerts', 'removed')
+
+    def __init__(self, executorId, maxlen=SERIES_LENGTH):
+        self.executorId = executorId
+        self.samples = deque(maxlen=maxlen)
+        self.alerts = {}
+        self.removed = False
+
+    def to_dict(self):
+        return {
+            'executorId': self.executorId,
+            'samples': list(self.samples),
+            'alerts': sorted(self.alerts),
+            'removed': self.removed,
+        }
+
+
+def memory_sample(data, previous=None):
+    """Sample of a sparkExecutorMetrics message, with the GC fraction since the previous one"""
+    maxHeap = data.get('maxHeapMemory') or 0
+    heap = data.get('jvmHeapMemory', 0)
+    gcTime = data.get('minorGCTime', 0) + data.get('majorGCTime', 0)
+    gcFraction = None
+    if previous is not None and data.get('time', 0) > previous['time']:
+        # GC times are totals since the executor started
+        gcFraction = max(0.0, float(gcTime - previous['gcTime']) / (data['time'] - previous['time']))
+    return {
+        'time': data.get('time'),
+        'heapMemory': heap,
+        'maxHeapMemory': maxHeap,
+        'heapFraction': float(heap) / maxHeap if maxHeap else None,
+        'offHeapMemory': data.get('jvmOffHeapMemory', 0),
+        'executionMemory': data.get('onHeapExecutionMemory', 0) + data.get('offHeapExecutionMemory', 0),
+        'storageMemory': data.get('onHeapStorageMemory', 0) + data.get('offHeapStorageMemory', 0),
+        'maxMemory': data.get('maxMemory', 0),
+        'gcTime': gcTime,
+        'gcFraction': gcFraction,
+    }
+
+
+class ExecutorMemoryMonitor:
+    """Keeps the memory series of the executors and alerts about their memory and GC"""
+
+    def __init__(self, notify=None, maxHeapFraction=DEFAULT_MAX_HEAP_FRACTION,
+                 maxGcFraction=DEFAULT_MAX_GC_FRACTION, maxsize=1000):
+        """Constructor
+
+        notify is called with the alerts and their ends.
+        """
+        self.notify = notify
+        self.limits = {'heap': maxHeapFraction, 'gc': maxGcFraction}
+        self.executors = BoundedDict(maxsize)
+        self.lastApp = None
+        self.lock = Lock()
+
+    def on_message(self, data, appId=None):
+        """Account a listener message"""
+        msgtype = data.get('msgtype')
+        if msgtype not in ('sparkExecutorMetrics', 'sparkExecutorRemoved'):
+            return
+        key = (appId, data.get('executorId'))
+        notices = []
+        with self.lock:
+            executor = self.executors.get(key)
+            if msgtype == 'sparkExecutorRemoved':
+                if executor is not None:
+                    executor.removed = True
+                    for kind in list(executor.alerts):
+                        notices.append(self._end(executor, kind, appId, data.get('time')))
+            else:
+                if executor is None:
+                    executor = self.executors[key] = ExecutorMemory(data.get('executorId'))
+                executor.removed = False
+                previous = executor.samples[-1] if executor.samples else None
+                sample = memory_sample(data, previous)
+                executor.samples.append(sample)
+                self.lastApp = appId
+                notices = self._check(executor, sample, appId)
+        if self.notify is not None:
+            for notice in notices:
+                self.notify(notice)
+
+    def _check(self, executor, sample, appId):
+        notices = []
+        values = {'heap': sample['heapFraction'], 'gc': sample['gcFraction']}
+        for kind, value in values.items():
+            limit = self.limits[kind]
+            if value is None or not limit:
+                continue
+            if kind not in executor.alerts and value >= limit:
+                executor.alerts[kind] = sample['time']
+                notices.append(self._notice(executor, kind, True, appId, sample))
+            elif kind in executor.alerts and value < limit * CLEAR_RATIO:
+                notices.append(self._end(executor, kind, appId, sample['time']))
+        return notices
+
+    def _end(self, executor, kind, appId, time):
+        startTime = executor.alerts.pop(kind)
+        notice = self._notice(executor, kind, False, appId, executor.samples[-1])
+        notice['startTime'] = startTime
+        notice['time'] = time or notice['time']
+        return notice
+
+    def _notice(self, executor, kind, active, appId, sample):
+        return {
+            'msgtype': 'executorAlert',
+            'appId': appId,
+            'executorId': executor.executorId,
+            'kind': kind,
+            'active': active,
+            'time': sample['time'],
+            'startTime': sample['time'],
+            'heapMemory': sample['heapMemory'],
+            'maxHeapMemory': sample['maxHeapMemory'],
+            'heapFraction': sample['heapFraction'],
+            'gcFraction': sample['gcFraction'],
+            'limit': self.limits[kind],
+        }
+
+    def report(self, appId=None):
+        """Return the memory series of the executors of an application, the last one sampled by default"""
+        with self.lock:
+            if appId is None:
+                appId = self.lastApp
+            return dict((executorId, executor.to_dict())
+                        for (app, executorId), executor in self.executors.items() if app == appId)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Frontend Fan-out
+
+Sends the messages of the kernel to every open frontend comm. Several
+browser tabs showing the notebook, or the peers of a collaborative
+JupyterLab session, each open their own comm.
+
+Messages are encoded and compressed once and appended to a shared ring
+buffer. Each comm has its own cursor in the ring and its own sender
+thread, so a slow comm only delays itself. When the ring overwrites the
+messages a comm has not read yet, the comm gets a snapshot instead: the
+latest state messages of the applications, executors, jobs and stages,
+in the order they were sent, and continues from the newest message. A comm
+opened late reads the ring from its start, or a snapshot once the ring
+has overwritten messages.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from threading import Condition, Thread
+
+from .compression import choose_codec
+from .routing import BoundedDict
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+# Messages kept in the ring buffer, and bytes of their binary buffers
+DEFAULT_CAPACITY = int(os.environ.get('SPARKMONITOR_RING_SIZE', 4096))
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Largest number of messages a sender thread takes from the ring at once
+MAX_READ = 256
+
+
+def state_key(data, appId=None):
+    """Key of the state a listener message updates, None for task messages
+
+    A snapshot holds the latest message of each key. The second item is
+    False when the message ends the state, which is then left out.
+    """
+    msgtype = data.get('msgtype')
+    if msgtype in ('sparkJobStart', 'sparkJobEnd'):
+        return (msgtype, appId, data.get('jobId')), True
+    if msgtype == 'sparkStageSubmitted':
+        return (msgtype, appId, data.get('stageId'), data.get('stageAttemptId')), True
+    if msgtype in ('sparkStageActive', 'sparkStageCompleted'):
+        return ('stageStatus', appId, data.get('stageId'), data.get('stageAttemptId')), True
+    if msgtype in ('sparkApplicationStart', 'sparkApplicationEnd'):
+        return (msgtype, appId), True
+    if msgtype == 'sparkExecutorAdded':
+        return ('executor', appId, data.get('executorId')), True
+    if msgtype == 'sparkExecutorRemoved':
+        return ('executor', appId, data.get('executorId')), False
+    if msgtype == 'sparkExecutorMetrics':
+        return ('executorMetrics', appId, data.get('executorId')), True
+    return None, False
+
+
+class Subscriber(Thread):
+    """Sends the messages of the ring to one comm, from its own cursor"""
+
+    def __init__(self, fanout, comm, codecs, cursor):
+        """Constructor, initializes base class Thread."""
+        Thread.__init__(self)
+        self.daemon = True
+        self.fanout = fanout
+        self.comm = comm
+        self.codecs = set(codecs or ())
+        self.cursor = cursor
+        self.closed = False
+
+    def accepts(self, msg):
+        """Whether the comm can decode a message compressed for all comms"""
+        codec = msg.get('compression')
+        return codec is None or codec in self.codecs
+
+    def run(self):
+        while True:
+            entries = self.fanout.read(self)
+            if entries is None:
+                return
+            cpuStart = time.thread_time()
+            for msg, buffers, _ in entries:
+                if not self.accepts(msg):
+                    continue
+                start = time.perf_counter()
+                try:
+                    self.comm.send(msg, buffers=buffers)
+                except Exception as e:
+                    logger.warn('SparkMonitor comm send failed, closing it: %s', e)
+                    self.fanout.unsubscribe(self.comm)
+                    return
+                self.fanout.send_seconds.observe(time.perf_counter() - start)
+            if self.fanout.account is not None:
+                self.fanout.account(time.thread_time() - cpuStart)
+
+
+class FanOut:
+    """Ring buffer of the messages sent to the frontends, with a cursor per comm"""
+
+    def __init__(self, metrics, capacity=DEFAULT_CAPACITY, maxBytes=DEFAULT_MAX_BYTES,
+                 maxStates=10000):
+        """Constructor
+
+        capacity and maxBytes bound the messages kept in the ring, maxStates
+        the number of states kept for snapshots.
+        """
+        self.capacity = capacity
+        self.maxBytes = maxBytes
+        self.ring = deque()
+        self.bytes = 0
+        # Sequence number of the first message in the ring
+        self.start = 0
+        self.states = BoundedDict(maxStates)
+        self.subscribers = {}
+        self.condition = Condition()
+        # Called with the CPU time the sender threads spend, see CpuGovernor
+        self.account = None
+
+        self.send_seconds = metrics.histogram(
+            'comm_send_seconds', 'Time spent sending a message through a comm')
+        self.buffered = metrics.counter(
+            'messages_buffered', 'Messages published while no comm was open')
+        self.dropped = metrics.counter(
+            'messages_dropped', 'Messages overwritten before a comm read them')
+        self.snapshots = metrics.counter(
+            'comm_snapshots', 'Snapshots sent to comms instead of overwritten messages')
+        metrics.gauge('buffer_depth', 'Messages currently in the ring buffer',
+                      fn=lambda: len(self.ring))
+        metrics.gauge('comms_open', 'Frontend comms currently open',
+                      fn=lambda: len(self.subscribers))
+        metrics.gauge('comm_lag', 'Messages not yet sent to the slowest comm', fn=self.lag)
+
+    @property
+    def end(self):
+        return self.start + len(self.ring)
+
+    def publish(self, msg, buffers=None, key=None, keep=True):
+        """Append a message for all comms
+
+        key identifies the state the message updates, see state_key.
+        """
+        size = sum(len(b) for b in buffers or ())
+        entry = (msg, buffers, size)
+        with self.condition:
+            self.ring.append(entry)
+            self.bytes += size
+            if not self.subscribers:
+                self.buffered.inc()
+            if key is not None:
+                # Kept in the order the latest messages of the states were sent
+                self.states.pop(key, None)
+                if keep:
+                    self.states[key] = entry
+            while len(self.ring) > 1 and (len(self.ring) > self.capacity or
+                                          self.bytes > self.maxBytes):
+                self.bytes -= self.ring.popleft()[2]
+                self.start += 1
+            self.condition.notify_all()
+
+    def subscribe(self, comm, codecs=None):
+        """Start sending to a new comm, with the messages it missed"""
+        with self.condition:
+            cursor = self.start if self.start == 0 else -1
+            subscriber = Subscriber(self, comm, codecs, cursor)
+            self.subscribers[comm.comm_id] = subscriber
+        subscriber.start()
+        return subscriber
+
+    def unsubscribe(self, comm):
+        with self.condition:
+            subscriber = self.subscribers.pop(comm.comm_id, None)
+            if subscriber is not None:
+                subscriber.closed = True
+                self.condition.notify_all()
+
+    def codec(self):
+        """Best codec that all comms decode"""
+        with self.condition:
+            accepted = [s.codecs for s in self.subscribers.values()]
+        return choose_codec(set.intersection(*accepted) if accepted else ())
+
+    def read(self, subscriber):
+        """Wait for and return the next messages of a comm, None once it is closed"""
+        with self.condition:
+            while subscriber.cursor == self.end and not subscriber.closed:
+                self.condition.wait()
+            if subscriber.closed:
+                return None
+            if subscriber.cursor < self.start:
+                # The messages this comm did not read are gone
+                if subscriber.cursor >= 0:
+                    self.dropped.inc(self.start - subscriber.cursor)
+                self.snapshots.inc()
+                subscriber.cursor = self.end
+                return list(self.states.values())
+            offset = subscriber.cursor - self.start
+            entries = list(itertools.islice(self.ring, offset, offset + MAX_READ))
+            subscriber.cursor += len(entries)
+            return entries
+
+    def lag(self):
+        """Messages not yet read by the slowest comm"""
+        with self.condition:
+            cursors = [max(s.cursor, self.start) for s in self.subscribers.values()]
+            return self.end - min(cursors) if cursors else 0
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor CPU Governor
+
+During stages with many short tasks, decoding, routing and forwarding the
+listener messages can take a noticeable share of the kernel CPU, and the
+GIL, from the code of the user. The threads of the extension account the
+CPU time they spend, measured with time.thread_time, and every window the
+governor compares their share of a core with its budget.
+
+Over the budget, the detail requested from the listeners steps down one
+level at a time:
+
+- full: every task record,
+- sampled: the records of one task in SAMPLE_RATE, without the proportions
+  of the task time,
+- aggregate: no task records, only the per-stage task summaries.
+
+It steps back up once the share stays under half the budget for
+restoreWindows windows in a row. Windows also close on a timer, so that
+idle windows, when no thread reports CPU time, count towards restoring
+the detail. When the detail has to step down again
+right after being restored, restoreWindows doubles, so that the level does
+not flap between a detail too costly and one cheap enough.
+
+Options set through the Python API, such as those of %%sparkmonitor
+profile, take precedence over the governor.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import time
+from threading import Event, Lock, Thread
+
+# Share of one core the extension may use, 0 disables the governor
+DEFAULT_BUDGET = float(os.environ.get('SPARKMONITOR_CPU_BUDGET', 0.05))
+
+# Length of a measurement window in seconds
+DEFAULT_WINDOW = float(os.environ.get('SPARKMONITOR_CPU_WINDOW', 5))
+
+# Task records sent at the sampled level
+SAMPLE_RATE = 10
+
+# Levels of detail and the listener options they request
+LEVELS = (
+    ('full', {}),
+    ('sampled', {'taskSampleRate': SAMPLE_RATE, 'metricDetail': 'basic'}),
+    ('aggregate', {'taskDetail': 'aggregate', 'metricDetail': 'basic'}),
+)
+
+# Windows under half the budget before the detail steps back up, and their bound
+RESTORE_WINDOWS = 3
+MAX_RESTORE_WINDOWS = 48
+
+
+class CpuGovernor:
+    """Lowers the listener detail while the extension uses more CPU than its budget"""
+
+    def __init__(self, apply, metrics, notify=None, budget=DEFAULT_BUDGET, window=DEFAULT_WINDOW):
+        """Constructor
+
+        apply is called with the listener options of a new level, notify
+        with the state of the governor when its level changes.
+        """
+        self.apply = apply
+        self.notify = notify
+        self.budget = budget
+        self.window = window
+        self.level = 0
+        self.cpuSeconds = 0.0
+        self.windowStart = time.monotonic()
+        self.lastFraction = 0.0
+        self.calmWindows = 0
+        self.restoreWindows = RESTORE_WINDOWS
+        self.restored = False
+        self.lock = Lock()
+        # Level changes are applied in the order they were decided
+        self.applyLock = Lock()
+        self.decided = 0
+        self.applied = 0
+        self.stopped = Event()
+        self.cpu = metrics.counter(
+            'governor_cpu_seconds', 'CPU time spent by the extension threads')
+        self.changes = metrics.counter(
+            'governor_level_changes', 'Changes of the listener detail by the CPU governor')
+        metrics.gauge('governor_level', 'Listener detail level, 0 for full detail',
+                      fn=lambda: self.level)
+        metrics.gauge('governor_cpu_fraction', 'Share of a core used in the last window',
+                      fn=lambda: self.lastFraction)
+
+    def start(self):
+        """Close the windows on a timer, in a background thread"""
+        if not self.budget:
+            return
+        thread = Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.window / 2):
+            self.account(0.0)
+
+    def account(self, seconds):
+        """Account CPU time spent by an extension thread, closes the window when it ends"""
+        if seconds:
+            self.cpu.inc(seconds)
+        change = None
+        with self.lock:
+            self.cpuSeconds += seconds
+            now = time.monotonic()
+            elapsed = now - self.windowStart
+            if elapsed >= self.window:
+                state = self._close_window(elapsed)
+                self.windowStart = now
+                self.cpuSeconds = 0.0
+                if state is not None:
+                    self.decided += 1
+                    change = (self.decided, state)
+        if change is not None:
+            self._apply(*change)
+
+    def _apply(self, decided, state):
+        with self.applyLock:
+            if decided <= self.applied:
+                return  # A later change was applied first
+            self.applied = decided
+            self.apply(LEVELS[state['level']][1])
+            if self.notify is not None:
+                self.notify(state)
+
+    def _close_window(self, elapsed):
+        """Returns the new state if the level changes"""
+        fraction = self.cpuSeconds / elapsed
+        self.lastFraction = fraction
+        if not self.budget:
+            return None
+        if fraction > self.budget:
+            self.calmWindows = 0
+            if self.level == len(LEVELS) - 1:
+                return None
+            if self.restored:
+                # The detail just restored was too costly, wait longer next time
+                self.restoreWindows = min(MAX_RESTORE_WINDOWS, self.restoreWindows * 2)
+            self.restored = False
+            return self._set_level(self.level + 1)
+        if fraction >= self.budget / 2:
+            self.calmWindows = 0
+            return None
+        self.calmWindows += 1
+        if self.calmWindows < self.restoreWindows:
+            return None
+        self.calmWindows = 0
+        if self.level == 0:
+            # Full detail held for restoreWindows windows
+            self.restored = False
+            self.restoreWindows = RESTORE_WINDOWS
+            return None
+        self.restored = True
+        return self._set_level(self.level - 1)
+
+    def _set_level(self, level):
+        self.level = level
+        self.changes.inc()
+        return self._state()
+
+    def _state(self):
+        return {
+            'msgtype': 'governor',
+            'level': self.level,
+            'detail': LEVELS[self.level][0],
+            'cpuFraction': self.lastFraction,
+            'budget': self.budget,
+            'window': self.window,
+            'sampleRate': SAMPLE_RATE,
+        }
+
+    def state(self):
+        """Return the current level and the CPU share of the last window"""
+        with self.lock:
+            return self._state()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Run History
+
+Keeps the statistics of each cell execution that ran Spark jobs in a
+local SQLite database, and compares every new run with the previous runs
+of the same Spark work to detect regressions.
+
+The Spark work of a run is identified by a fingerprint of the names of
+its jobs and stages and of the structure of the stage graphs, with cell
+file names and stage ids left out, so that the same cell run again, in
+the same or in another kernel, has the same fingerprint.
+
+The database is only used from one worker thread: the kernel does not
+wait for it when starting or when a cell ends. Runs are looked up
+through an index on the fingerprint and only the latest runs of each
+fingerprint are kept.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.sparkmonitor', 'history.sqlite')
+
+# Metrics compared with the baseline, and the smallest difference reported
+COMPARED_METRICS = (
+    ('wallTime', 1.0),
+    ('shuffleReadBytes', 1024 * 1024),
+    ('bytesSpilled', 1024 * 1024),
+)
+
+# Time in seconds to wait for the end of the jobs of a finished cell
+JOB_END_GRACE = 5.0
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS runs ('
+    ' id INTEGER PRIMARY KEY,'
+    ' fingerprint TEXT NOT NULL,'
+    ' startTime REAL,'
+    ' wallTime REAL,'
+    ' numJobs INTEGER,'
+    ' numStages INTEGER,'
+    ' numTasks INTEGER,'
+    ' shuffleReadBytes REAL,'
+    ' bytesSpilled REAL)',
+    'CREATE INDEX IF NOT EXISTS runs_fingerprint ON runs (fingerprint, id)',
+)
+
+# Cell file names change with every execution and kernel
+CELL_NAME_PATTERN = re.compile(r'<ipython-input-[^>]*>|\S*ipykernel_\d+[/\\]\d+\.py')
+LINE_NUMBER_PATTERN = re.compile(r':\d+')
+
+
+def normalize_name(name):
+    """Name of a job or stage without the parts changing between runs"""
+    name = CELL_NAME_PATTERN.sub('<cell>', str(name or ''))
+    return LINE_NUMBER_PATTERN.sub('', name)
+
+
+def job_structure(data):
+    """Structure of a sparkJobStart message: names and stage graph"""
+    stageInfos = data.get('stageInfos') or {}
+    stageIds = sorted(int(stageId) for stageId in stageInfos)
+    position = {stageId: i for i, stageId in enumerate(stageIds)}
+    stages = []
+    for stageId in stageIds:
+        info = stageInfos[str(stageId)]
+        parents = sorted(position[p] for p in info.get('parentIds', []) if p in position)
+        stages.append([normalize_name(info.get('name')), parents])
+    return [normalize_name(data.get('name')), stages]
+
+
+class CellRun:
+    """Statistics of one cell execution, accumulated as messages arrive"""
+
+    def __init__(self, runId, cellId=None):
+        """Constructor"""
+        self.runId = runId
+        self.cellId = cellId
+        self.startTime = time.time()
+        self.endTime = None
+        self.jobs = []
+        self.jobIds = []
+        self.runningJobs = set()
+        self.numStages = 0
+        self.numTasks = 0
+        self.shuffleReadBytes = 0.0
+        self.bytesSpilled = 0.0
+
+    def fingerprint(self):
+        structure = json.dumps(self.jobs, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(structure.encode('utf-8')).hexdigest()[:16]
+
+    def stats(self):
+        return {
+            'startTime': self.startTime,
+            'wallTime': (self.endTime or time.time()) - self.startTime,
+            'numJobs': len(self.jobs),
+            'numStages': self.numStages,
+            'numTasks': self.numTasks,
+            'shuffleReadBytes': self.shuffleReadBytes,
+            'bytesSpilled': self.bytesSpilled,
+        }
+
+
+class HistoryStore:
+    """SQLite database of run statistics, used from a worker thread"""
+
+    def __init__(self, path=DEFAULT_PATH, keep=100):
+        """Constructor
+
+        keep is the number of runs kept for each fingerprint.
+        """
+        self.path = path
+        self.keep = keep
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.row_factory = sqlite3.Row
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+        return self.connection
+
+    def submit(self, fn, *args):
+        """Run fn(connection, *args) on the worker thread, returns a future"""
+        def task():
+            try:
+                return fn(self._connect(), *args)
+            except (sqlite3.Error, OSError) as e:
+                logger.warn('SparkMonitor run history error: %s', e)
+        return self.executor.submit(task)
+
+    def runs(self, fingerprint, limit=20):
+        """Return the latest runs of a fingerprint, the latest first"""
+        return self.submit(self._runs, fingerprint, limit).result() or []
+
+    @staticmethod
+    def _runs(connection, fingerprint, limit):
+        rows = connection.execute(
+            'SELECT * FROM runs WHERE fingerprint = ? ORDER BY id DESC LIMIT ?',
+            (fingerprint, limit))
+        return [dict(row) for row in rows]
+
+    def insert(self, connection, fingerprint, stats):
+        connection.execute(
+            'INSERT INTO runs (fingerprint, startTime, wallTime, numJobs, numStages,'
+            ' numTasks, shuffleReadBytes, bytesSpilled) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (fingerprint, stats['startTime'], stats['wallTime'], stats['numJobs'],
+             stats['numStages'], stats['numTasks'], stats['shuffleReadBytes'],
+             stats['bytesSpilled']))
+        connection.execute(
+            'DELETE FROM runs WHERE fingerprint = ? AND id <= ('
+            ' SELECT id FROM runs WHERE fingerprint = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+            (fingerprint, fingerprint, self.keep))
+        connection.commit()
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class RunHistory:
+    """Records cell executions and reports regressions against their baseline"""
+
+    def __init__(self, store, notify, window=10, minRuns=3, threshold=0.25):
+        """Constructor
+
+        notify is called with a regression notice. The baseline of a run
+        is the median of the window previous runs of its fingerprint,
+        regressions are reported past threshold (0.25 is 25% worse) once
+        there are at least minRuns previous runs.
+        """
+        self.store = store
+        self.notify = notify
+        self.window = window
+        self.minRuns = minRuns
+        self.threshold = threshold
+        self.runs = {}
+        self.lastFingerprint = None
+        self.lock = Lock()
+
+    def start_run(self, runId, cellId=None):
+        with self.lock:
+            self.runs[runId] = CellRun(runId, cellId)
+
+    def on_message(self, data, runId, appId=None):
+        """Account a listener message routed to a cell execution"""
+        run = self.runs.get(runId)
+        if run is None:
+            return
+        msgtype = data.get('msgtype')
+        if msgtype == 'sparkJobStart':
+            run.jobs.append(job_structure(data))
+            run.jobIds.append({'appId': appId, 'jobId': data.get('jobId')})
+            run.runningJobs.add((appId, data.get('jobId')))
+        elif msgtype == 'sparkStageCompleted':
+            run.numStages += 1
+            run.numTasks += data.get('numTasks', 0)
+            summary = data.get('taskSummary') or {}
+            run.shuffleReadBytes += summary.get('shuffleReadBytes', {}).get('sum', 0)
+            run.bytesSpilled += summary.get('bytesSpilled', {}).get('sum', 0)
+        elif msgtype == 'sparkJobEnd':
+            run.runningJobs.discard((appId, data.get('jobId')))
+            if run.endTime is not None and not run.runningJobs:
+                self._finish(runId)
+
+    def end_run(self, runId):
+        """Called after a cell is executed"""
+        run = self.runs.get(runId)
+        if run is None:
+            return
+        run.endTime = time.time()
+        if not run.runningJobs:
+            self._finish(runId)
+        else:
+            # Listener messages may still be on their way
+            timer = Timer(JOB_END_GRACE, self._finish, (runId,))
+            timer.daemon = True
+            timer.start()
+
+    def _finish(self, runId):
+        with self.lock:
+            run = self.runs.pop(runId, None)
+        if run is None or not run.jobs:
+            return
+        fingerprint = run.fingerprint()
+        self.lastFingerprint = fingerprint
+        self.store.submit(self._record, run, fingerprint, run.stats())
+
+    def _record(self, connection, run, fingerprint, stats):
+        previous = HistoryStore._runs(connection, fingerprint, self.window)
+        self.store.insert(connection, fingerprint, stats)
+        if len(previous) < self.minRuns:
+            return
+        regressions = []
+        for metric, minDifference in COMPARED_METRICS:
+            baseline = median([row[metric] or 0 for row in previous])
+            value = stats[metric]
+            if value - baseline > max(minDifference, baseline * self.threshold):
+                regressions.append({
+                    'metric': metric,
+                    'value': value,
+                    'baseline': baseline,
+                    'ratio': value / baseline if baseline else None,
+                })
+        if regressions:
+            self.notify({
+                'msgtype': 'regression',
+                'runId': run.runId,
+                'cellId': run.cellId,
+                'jobIds': run.jobIds,
+                'fingerprint': fingerprint,
+                'baselineRuns': len(previous),
+                'regressions': regressions,
+            })
@@ -12,14 +12,45 @@ from IPython import get_ipython
 
 # from .vscode_extension import is_vscode
 
+import atexit
+import codecs
+import json
 import logging
 import os
+import select
 import subprocess
+import shutil
 import socket
-from threading import Thread
+import tempfile
+import time
+from threading import Lock, Thread
 
 import pkg_resources
 
+from .stats import LatencyTracker, Metrics, PrometheusServer
+from .cellsummary import CellSummaries
+from .columnar import TASK_MSGTYPES, TaskBatch
+from .compression import compress_buffers
+from .control import ListenerControl
+from .critical_path import CriticalPathAnalyzer
+from .driver import DriverBottleneckDetector
+from .events import EventDispatcher
+from .executors import ExecutorMemoryMonitor
+from .sessionlog import DEFAULT_CHUNK_SIZE, SessionLog, export_session
+from .eta import EtaEstimator
+from .fanout import FanOut, state_key
+from .governor import CpuGovernor
+from .history import HistoryStore, RunHistory
+from .magics import sparkmonitor_magic
+from .polling import StatusPoller
+from .profile import PROFILE_OPTIONS, CellProfiler
+from .routing import RUN_ID_PROPERTY, CellRouter
+from .sampling import TaskSampler
+from .summaries import StageSummaries
+from .throughput import StageThroughput
+from .tracing import SpanTracer, SpanWriter, span_exporter
+from .utilisation import UtilisationTracker
+
 ipykernel_imported = True
 spark_imported = True
 try:
@@ -28,16 +59,31 @@ except ImportError:
     ipykernel_imported = False
 
 try:
-    from pyspark import SparkConf
+    from pyspark import SparkConf, SparkContext
 except ImportError:
     try:
         import findspark
         findspark.init()
-        from pyspark import SparkConf
+        from pyspark import SparkConf, SparkContext
     except Exception:
         spark_imported = False
 
 
+# Maximum number of task messages sent to the comm in one binary batch
+MAX_TASK_BATCH = 10000
+
+# Maximum time in seconds task messages wait in a batch
+MAX_TASK_BATCH_DELAY = 0.25
+
+# Kernel notices about a cell execution, kept in the summary of its output
+NOTICE_MSGTYPES = ('regression', 'utilisation', 'criticalPath', 'driverBottleneck')
+
+# Set by load_ipython_extension, the API functions raise RuntimeError before
+ip = None
+monitor = None
+run_id = None
+
+
 class ScalaMonitor:
     """Main singleton object for the kernel extension"""
 
@@ -47,39 +93,237 @@ class ScalaMonitor:
         ipython is the instance of ZMQInteractiveShell
         """
         self.ipython = ipython
-        self.comm = None
+        self.prometheus = None
+
+        # Spark applications seen by the kernel, by appId
+        self.applications = {}
+
+        # Optionally record every listener message, one per line, to replay
+        # them in benchmarks
+        self.trace = None
+        if os.environ.get('SPARKMONITOR_TRACE_FILE'):
+            self.trace = open(os.environ['SPARKMONITOR_TRACE_FILE'], 'a')
+
+        # Listener connections, see start()
+        self.scalaSocket = None
+
+        self.metrics = Metrics()
+        self.bytes_received = self.metrics.counter(
+            'bytes_received', 'Bytes received from the listener')
+        self.messages_received = self.metrics.counter(
+            'messages_received', 'Messages received from the listener')
+        self.decode_seconds = self.metrics.histogram(
+            'decode_seconds', 'Time spent decoding and splitting socket data')
+        self.display_seconds = self.metrics.histogram(
+            'display_seconds', 'Time spent publishing a display update')
+        self.connections = self.metrics.counter(
+            'listener_connections', 'Listener connections accepted')
+        self.reconnects = self.metrics.counter(
+            'listener_reconnects', 'Listener connections after the first one')
+        self.batch_bytes = self.metrics.counter(
+            'batch_bytes', 'Bytes of binary task batches before compression')
+        self.batch_bytes_sent = self.metrics.counter(
+            'batch_bytes_sent', 'Bytes of binary task batches after compression')
+        self.tasks_sampled_out = self.metrics.counter(
+            'tasks_sampled_out', 'Task messages not forwarded because of sampling')
+        self.metrics.gauge('pending_bytes', 'Undelimited bytes waiting in the socket threads',
+                           fn=lambda: self.scalaSocket.pending())
+        self.metrics.gauge('listener_connections_open', 'Listener connections currently open',
+                           fn=lambda: len(self.scalaSocket.connections))
+        self.latency = LatencyTracker(self.metrics)
+        # Messages are kept for the frontend comms opened before or later
+        self.fanout = FanOut(self.metrics)
+        self.router = CellRouter()
+        self.sampler = TaskSampler()
+        self.summaries = StageSummaries()
+        self.throughput = StageThroughput()
+        self.eta = EtaEstimator()
+        # Options sent before the socket starts are sent to the listeners when they connect
+        self.control = ListenerControl(
+            lambda msg: self.scalaSocket.sendToScala(msg) if self.scalaSocket is not None else None)
+
+        # Lowers the listener detail while the extension threads use too much CPU
+        self.governor = CpuGovernor(self.control.set_governed, self.metrics,
+                                    lambda state: sendToFrontEnd(state, ('governor',)))
+        self.fanout.account = self.governor.account
+
+        # Core time allocated to and used by each cell execution
+        self.utilisation = UtilisationTracker(sendToFrontEnd)
 
-        # It is possible that messages were requested to send to frontend using
-        # send() before comm is ready. We'll buffer such messages and send them
-        # right after comm is ready. See target_func for more details.
-        self.buffered_msgs = []
+        # Stages setting the duration of each job
+        self.critical_paths = CriticalPathAnalyzer(
+            lambda report: sendToFrontEnd(report, ('criticalPath', report['appId'], report['jobId'])))
+
+        # Stages sending too much data to the driver
+        self.driver_bottlenecks = DriverBottleneckDetector(
+            lambda notice: sendToFrontEnd(notice, ('driverBottleneck', notice['appId'], notice['jobId'])))
+
+        # Memory and GC time of the executors, and alerts about them
+        self.executors = ExecutorMemoryMonitor(
+            lambda notice: sendToFrontEnd(
+                notice, ('executorAlert', notice['appId'], notice['executorId'], notice['kind'])))
+
+        # Callbacks subscribed to the listener events from Python
+        self.events = EventDispatcher(
+            self.metrics, self.router.cell_of,
+            onTaskSubscriptions=lambda active: self.control.set_task_consumer('events', active))
+
+        # Jobs, stages and tasks exported as trace spans, see start_tracing
+        self.tracer = None
+        spans_target = (os.environ.get('SPARKMONITOR_OTLP_FILE') or
+                        os.environ.get('SPARKMONITOR_OTLP_ENDPOINT'))
+        if spans_target:
+            self.start_tracing(spans_target,
+                               float(os.environ.get('SPARKMONITOR_OTLP_TASK_RATE', 0)))
+
+        # Polls the status of a SparkContext running without the listener
+        self.poller = None
+
+        # Cell executions run with %%sparkmonitor profile, by run id
+        self.profilers = {}
+        # Profiler of the code run by profile_cell, until its execution starts
+        self.nextProfiler = None
+
+        # Summaries replacing the live output of the cells once their jobs end
+        self.cell_summaries = CellSummaries(displaySummary, self.applications)
+
+        # Statistics of the cell executions, compared with their previous runs, if enabled
+        self.history = None
+        history_path = os.environ.get('SPARKMONITOR_HISTORY_FILE')
+        if history_path:
+            self.history = RunHistory(
+                HistoryStore(os.path.expanduser(history_path)), sendToFrontEnd,
+                threshold=float(os.environ.get('SPARKMONITOR_REGRESSION_THRESHOLD', 0.25)))
+
+        # Listener messages of the session on disk, exported by export(), see start_session_log
+        self.session = None
+        if os.environ.get('SPARKMONITOR_SESSION_LOG'):
+            self.start_session_log(os.environ['SPARKMONITOR_SESSION_LOG'])
 
     def start(self):
         """Creates the socket thread and returns assigned port"""
-        self.scalaSocket = SocketThread()
+        self.scalaSocket = SocketThread(self)
+        self.governor.start()
         return self.scalaSocket.startSocket()  # returns the port
 
     def getPort(self):
         """Return the socket port"""
         return self.scalaSocket.port
 
-    def send(self, msg):
-        """Send a message to the frontend"""
-        if self.comm is not None:
-            self.comm.send(msg)
-        else:
-            self.buffered_msgs.append(msg)
-            if len(self.buffered_msgs) > 1000:
-                logger.warn("Buffered too many messages before frontend comm is opened. "
-                            "Discard buffered messages")
-                self.buffered_msgs = []
+    def getSocketPath(self):
+        """Return the path of the Unix domain socket, or None"""
+        return self.scalaSocket.socketPath
+
+    def listener_connected(self, appId):
+        """Whether a listener connected for an application"""
+        return any(c.appId == appId for c in list(self.scalaSocket.connections))
+
+    def poll_status(self):
+        """Poll the status of the active SparkContext if no listener connects for it
+
+        Disabled with SPARKMONITOR_STATUS_POLLING=off.
+        """
+        if not spark_imported or os.environ.get('SPARKMONITOR_STATUS_POLLING') == 'off':
+            return
+        sc = SparkContext._active_spark_context
+        if sc is None or self.listener_connected(sc.applicationId):
+            return
+        if self.poller is not None:
+            if self.poller.sc is sc and self.poller.is_alive():
+                return
+            self.poller.stop()
+        self.poller = StatusPoller(sc, self.scalaSocket.onrecv, self.metrics,
+                                   self.listener_connected)
+        self.poller.start()
+
+    def send(self, msg, buffers=None, key=None, keep=True):
+        """Send a message to all frontends, with optional binary buffers
+
+        key and keep identify the state updated by the message, which
+        frontends opening a comm later get in a snapshot, see state_key.
+        """
+        self.fanout.publish(msg, buffers, key, keep)
+
+    def on_application_message(self, data, appId):
+        """Keep track of the state of each Spark application"""
+        msgtype = data.get('msgtype')
+        if msgtype == 'sparkApplicationStart':
+            self.applications[appId] = {
+                'appId': appId,
+                'appName': data.get('appName'),
+                'appAttemptId': data.get('appAttemptId'),
+                'startTime': data.get('startTime'),
+                'endTime': None,
+            }
+        elif msgtype == 'sparkApplicationEnd' and appId in self.applications:
+            self.applications[appId]['endTime'] = data.get('endTime')
+
+    def start_profiled_run(self, runId):
+        """Bind the profiler waiting for the code run by profile_cell to its execution"""
+        profiler, self.nextProfiler = self.nextProfiler, None
+        if profiler is not None:
+            profiler.runId = runId
+            self.profilers[runId] = profiler
+
+    def start_session_log(self, path=None):
+        """Log the listener messages received from now on, to a temporary file without path"""
+        if self.session is None:
+            self.session = SessionLog(self.metrics, path)
+            self.control.set_task_consumer('session', True)
+        return self.session.path
+
+    def start_tracing(self, target, taskRate=0.0):
+        """Export trace spans to a file or OTLP/HTTP endpoint, or an exporter object"""
+        exporter = span_exporter(target) if isinstance(target, str) else target
+        writer = SpanWriter(exporter, self.metrics, {
+            'service.name': 'sparkmonitor',
+            'host.name': socket.gethostname(),
+            'process.pid': os.getpid(),
+        })
+        writer.start()
+        previous, self.tracer = self.tracer, SpanTracer(writer, taskRate)
+        self.control.set_task_consumer('tracing', taskRate > 0)
+        if previous is not None:
+            previous.close()
+
+    def stop_tracing(self):
+        """Export the remaining spans and stop exporting"""
+        tracer, self.tracer = self.tracer, None
+        self.control.set_task_consumer('tracing', False)
+        if tracer is not None:
+            tracer.close()
+
+    def serve_stats(self, port=0):
+        """Start the Prometheus endpoint on localhost, returns its port
+
+        A running endpoint is kept when port is 0 or its own port, and is
+        restarted on port otherwise.
+        """
+        if self.prometheus is not None and port and port != self.prometheus.port:
+            self.stop_stats()
+        if self.prometheus is None:
+            self.prometheus = PrometheusServer(self.metrics, port)
+            self.prometheus.start()
+        return self.prometheus.port
+
+    def stop_stats(self):
+        """Stop the Prometheus endpoint if it is running"""
+        if self.prometheus is not None:
+            self.prometheus.stop()
+            self.prometheus = None
 
     def handle_comm_message(self, msg):
         """Handle message received from frontend
 
-        Does nothing for now as this only works if kernel is not busy.
+        This only works if kernel is not busy, so frontends must not
+        expect a timely answer.
         """
         logger.debug('COMM MESSAGE:  \n %s', str(msg))
+        data = msg['content']['data']
+        if data.get('msgtype') == 'renderLatency':
+            self.latency.on_render_report(data.get('samples', []))
+        elif data.get('msgtype') == 'views':
+            self.control.on_views(msg['content'].get('comm_id'), data.get('views'))
 
     def register_comm(self):
         """Register a comm_target which will be used by
@@ -88,26 +332,45 @@ class ScalaMonitor:
             'SparkMonitor', self.target_func)
 
     def target_func(self, comm, msg):
-        """Callback function to be called when a frontend comm is opened"""
+        """Callback function to be called when a frontend comm is opened
+
+        Every tab or collaborator showing the notebook opens its own comm,
+        all of them receive the messages.
+        """
         logger.info('SparkMonitor comm opened from frontend.')
-        self.comm = comm
 
-        @self.comm.on_msg
+        @comm.on_msg
         def _recv(msg):
             self.handle_comm_message(msg)
+
+        @comm.on_close
+        def _close(msg):
+            self.fanout.unsubscribe(comm)
+            self.control.forget_client(comm.comm_id)
         comm.send({'msgtype': 'commopen'})
-        for msg in self.buffered_msgs:
-            self.comm.send(msg)
-        self.buffered_msgs = []
+        # Large batches are compressed with a codec all frontends accept
+        self.fanout.subscribe(comm, msg['content']['data'].get('codecs'))
 
 
 class SocketThread(Thread):
     """Class to manage a socket in a background thread
-    to talk to the scala listener."""
+    to talk to the scala listener.
+
+    Every Spark application in the kernel process connects with its own
+    listener, each connection is served by a ListenerConnection thread.
 
-    def __init__(self):
+    Listeners connect through TCP on localhost. With SPARKMONITOR_TRANSPORT
+    set to unix, the kernel also listens on a Unix domain socket, which
+    listeners running on Java 16 or later use instead.
+    """
+
+    def __init__(self, monitor):
         """Constructor, initializes base class Thread."""
         self.port = 0
+        self.socketPath = None
+        self.unixSock = None
+        self.monitor = monitor
+        self.connections = []
         Thread.__init__(self)
 
     def startSocket(self):
@@ -118,53 +381,252 @@ class SocketThread(Thread):
         self.sock.listen(5)
         self.port = self.sock.getsockname()[1]
         logger.info('Socket Listening on port %s', str(self.port))
+        if os.environ.get('SPARKMONITOR_TRANSPORT', 'tcp') == 'unix':
+            self.startUnixSocket()
         self.start()
         return self.port
 
+    def startUnixSocket(self):
+        """Also listen on a Unix domain socket in a private directory"""
+        if not hasattr(socket, 'AF_UNIX'):
+            logger.warn('Unix domain sockets are not supported, using TCP')
+            return
+        directory = tempfile.mkdtemp(prefix='sparkmonitor-')
+        path = os.path.join(directory, 'kernel.sock')
+        try:
+            self.unixSock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.unixSock.bind(path)
+            self.unixSock.listen(5)
+        except OSError as e:
+            logger.warn('Could not listen on Unix socket %s, using TCP: %s', path, e)
+            self.unixSock = None
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        self.socketPath = path
+        atexit.register(shutil.rmtree, directory, True)
+        logger.info('Socket Listening on %s', path)
+
     def run(self):
         """Overrides Thread.run
 
-        Creates a socket and waits(blocking) for connections
-        When a connection is closed, goes back into waiting.
+        Waits(blocking) for connections and hands each one to
+        its own thread.
         """
+        servers = [s for s in (self.sock, self.unixSock) if s is not None]
         while(True):
             logger.info('Starting socket thread, going to accept')
-            (client, addr) = self.sock.accept()
-            logger.info('Client Connected %s', addr)
-            totalMessage = ''
-            while True:
-                messagePart = client.recv(4096)
-                if not messagePart:
-                    logger.info('Scala socket closed - empty data')
-                    break
-                totalMessage += messagePart.decode()
-                # Messages are ended with ;EOD:
-                pieces = totalMessage.split(';EOD:')
-                totalMessage = pieces[-1]
-                messages = pieces[:-1]
-                for msg in messages:
-                    logger.debug('Message Received: \n%s\n', msg)
-                    self.onrecv(msg)
-            logger.info('Socket Exiting Client Loop')
-            try:
-                client.shutdown(socket.SHUT_RDWR)
-            except OSError:
-                client.close()
+            readable, _, _ = select.select(servers, [], [])
+            for server in readable:
+                (client, addr) = server.accept()
+                logger.info('Client Connected %s', addr or self.socketPath)
+                if self.monitor.connections.value:
+                    self.monitor.reconnects.inc()
+                self.monitor.connections.inc()
+                connection = ListenerConnection(self, client)
+                self.connections.append(connection)
+                connection.start()
+                self.monitor.control.on_connect(connection.send)
 
     def start(self):
         """Starts the socket thread"""
         Thread.start(self)
 
+    def pending(self):
+        """Number of undelimited bytes waiting in all connections"""
+        return sum(len(c.pending) for c in self.connections)
+
     def sendToScala(self, msg):
-        """Send a message through the socket."""
-        return self.socket.send(msg)
+        """Send a control message to every connected listener"""
+        for connection in list(self.connections):
+            connection.send(msg)
+
+    def onrecv(self, msg, connection=None):
+        """Forwards all messages to the frontend
+
+        Messages are stamped with the kernel receive and forward times
+        so that the frontend can report the render latency back, and
+        with the application and cell execution they belong to.
 
-    def onrecv(self, msg):
-        """Forwards all messages to the frontend"""
-        sendToFrontEnd({
+        Task messages of a connection are collected into a columnar
+        batch which is sent to the comm by flush().
+        """
+        recvTime = time.time() * 1000
+        runId = None
+        appId = connection.appId if connection else None
+        data = None
+        eta = None
+        throughput = None
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            logger.warn('Could not decode listener message: %s', msg)
+        else:
+            self.monitor.latency.on_listener_message(data, recvTime)
+            appId = data.get('appId') or appId
+            if connection:
+                connection.appId = appId
+            self.monitor.on_application_message(data, appId)
+            if self.monitor.session is not None:
+                self.monitor.session.write(msg, data.get('msgtype'), appId)
+            runId = self.monitor.router.route(data, appId)
+            self.monitor.summaries.update(data, appId)
+            throughput = self.monitor.throughput.on_message(data, appId)
+            eta = self.monitor.eta.on_message(data, appId)
+            if self.monitor.history is not None and runId:
+                self.monitor.history.on_message(data, runId, appId)
+            self.monitor.utilisation.on_message(data, runId, appId)
+            self.monitor.critical_paths.on_message(
+                data, runId, appId, self.monitor.router.cell_of(runId))
+            self.monitor.driver_bottlenecks.on_message(
+                data, runId, appId, self.monitor.router.cell_of(runId))
+            self.monitor.executors.on_message(data, appId)
+            self.monitor.cell_summaries.on_message(data, runId, appId)
+            profiler = self.monitor.profilers.get(runId) if runId else None
+            if profiler is not None:
+                profiler.on_message(data, appId)
+            self.monitor.events.dispatch(data, appId, runId)
+            tracer = self.monitor.tracer
+            if tracer is not None:
+                tracer.on_message(data, runId, appId)
+        isTask = data is not None and data.get('msgtype') in TASK_MSGTYPES
+        weight = None
+        if isTask:
+            weight = self.monitor.sampler.accept(data, appId)
+            if not weight:
+                self.monitor.tasks_sampled_out.inc()
+                return
+            data['weight'] = weight
+        batched = connection is not None and isTask
+        if connection is not None and not batched:
+            # Keep the order of task messages relative to the others
+            self.flush(connection)
+        forwardTime = time.time() * 1000
+        wrapper = {
             'msgtype': 'fromscala',
-            'msg': msg
-        })
+            'msg': msg,
+            'appId': appId,
+            'runId': runId,
+            'cellId': self.monitor.router.cell_of(runId),
+            'recvTime': recvTime,
+            'forwardTime': forwardTime
+        }
+        if weight is not None:
+            wrapper['weight'] = weight
+        if eta is not None:
+            wrapper['eta'] = eta
+        if throughput is not None:
+            wrapper['throughput'] = throughput
+        if data is not None and data.get('msgtype') == 'sparkStageCompleted':
+            self.monitor.sampler.on_stage_completed(data, appId)
+        if batched:
+            # Published to the VS Code renderer once per batch, see flush()
+            connection.displayTasks.setdefault(runId, []).append(data)
+            connection.batch.add(data)
+            if len(connection.batch) >= MAX_TASK_BATCH:
+                self.flush(connection)
+        else:
+            key, keep = state_key(data, appId) if data is not None else (None, True)
+            sendToFrontEnd(wrapper, key, keep)
+        self.monitor.latency.on_forward(recvTime, forwardTime)
+
+    def flush(self, connection):
+        """Send the pending task batch of a connection to the comm
+
+        The task messages of the batch are also published as one display
+        update per cell execution, for the VS Code renderer which does not
+        read the comm.
+        """
+        batch = connection.batch
+        if not len(batch):
+            return
+        for runId, tasks in connection.displayTasks.items():
+            displayToFrontEnd({
+                'msgtype': 'fromscalatasks',
+                'tasks': tasks,
+                'appId': connection.appId,
+                'runId': runId,
+                'cellId': self.monitor.router.cell_of(runId),
+                'forwardTime': time.time() * 1000,
+            })
+        connection.displayTasks = {}
+        msg, buffers = batch.pack()
+        batch.reset()
+        self.monitor.batch_bytes.inc(sum(len(b) for b in buffers))
+        buffers = compress_buffers(msg, buffers, self.monitor.fanout.codec())
+        self.monitor.batch_bytes_sent.inc(sum(len(b) for b in buffers))
+        msg['appId'] = connection.appId
+        msg['forwardTime'] = time.time() * 1000
+        self.monitor.send(msg, buffers)
+
+
+class ListenerConnection(Thread):
+    """Reads the messages of one listener connection in a background thread"""
+
+    def __init__(self, server, client):
+        """Constructor, initializes base class Thread."""
+        Thread.__init__(self)
+        self.daemon = True
+        self.server = server
+        self.client = client
+        self.appId = None
+        self.pending = ''
+        self.batch = TaskBatch()
+        # Task messages of the batch by run id, for the display updates
+        self.displayTasks = {}
+        self.sendLock = Lock()
+
+    def send(self, msg):
+        """Send a control message to the listener"""
+        # ASCII JSON, the listener reads it without decoding characters split between reads
+        data = (json.dumps(msg) + ';EOD:').encode('ascii')
+        with self.sendLock:
+            try:
+                self.client.sendall(data)
+            except OSError as e:
+                logger.warn('Could not send control message to the listener: %s', e)
+
+    def run(self):
+        """Overrides Thread.run
+
+        Reads messages until the listener closes the connection.
+        """
+        monitor = self.server.monitor
+        client = self.client
+        # A multi-byte character may be split between two reads
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            messagePart = client.recv(65536)
+            if not messagePart:
+                logger.info('Scala socket closed - empty data')
+                break
+            start = time.perf_counter()
+            cpuStart = time.thread_time()
+            monitor.bytes_received.inc(len(messagePart))
+            self.pending += decoder.decode(messagePart)
+            # Messages are ended with ;EOD:
+            pieces = self.pending.split(';EOD:')
+            self.pending = pieces[-1]
+            messages = pieces[:-1]
+            monitor.decode_seconds.observe(time.perf_counter() - start)
+            monitor.messages_received.inc(len(messages))
+            for msg in messages:
+                logger.debug('Message Received: \n%s\n', msg)
+                if monitor.trace is not None:
+                    monitor.trace.write(msg.replace('\n', ' ') + '\n')
+                self.server.onrecv(msg, self)
+            # The listener writes task messages in bursts, keep batching
+            # while the burst is still arriving
+            if (time.time() - self.batch.started > MAX_TASK_BATCH_DELAY or
+                    not select.select([client], [], [], 0)[0]):
+                self.server.flush(self)
+            monitor.governor.account(time.thread_time() - cpuStart)
+        self.server.flush(self)
+        logger.info('Socket Exiting Client Loop')
+        try:
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            client.close()
+        self.server.connections.remove(self)
 
 
 def load_ipython_extension(ipython):
@@ -198,6 +660,14 @@ def load_ipython_extension(ipython):
     monitor = ScalaMonitor(ip)
     monitor.register_comm()  # Communication to browser
     monitor.start()
+    ip.register_magic_function(sparkmonitor_magic, 'line_cell', 'sparkmonitor')
+
+    prometheus_port = os.environ.get('SPARKMONITOR_PROMETHEUS_PORT')
+    if prometheus_port:
+        try:
+            monitor.serve_stats(int(prometheus_port))
+        except (ValueError, OSError) as e:
+            logger.warn('Could not start the Prometheus endpoint: %s', e)
 
     # Injecting conf into users namespace
     if spark_imported:
@@ -215,12 +685,51 @@ def load_ipython_extension(ipython):
                 'swan_spark_conf': conf # For backward compatibility with fork
                 })  # Add to users namespace
     
-    def pre_run_cell_hook(*args, **kwargs):
+    def pre_run_cell_hook(info=None, *args, **kwargs):
         import uuid
         global run_id
         run_id = str(uuid.uuid4())  # Unique for each cell execution
+        monitor.start_profiled_run(run_id)
+        monitor.router.start_run(run_id, getattr(info, 'cell_id', None))
+        monitor.utilisation.start_run(run_id, getattr(info, 'cell_id', None))
+        monitor.cell_summaries.start_run(run_id, getattr(info, 'cell_id', None))
+        if monitor.history is not None:
+            monitor.history.start_run(run_id, getattr(info, 'cell_id', None))
+        if monitor.tracer is not None:
+            monitor.tracer.start_run(run_id, getattr(info, 'cell_id', None))
+        tag_spark_jobs(run_id)
+        monitor.poll_status()
+
+    def post_run_cell_hook(result=None, *args, **kwargs):
+        if monitor.history is not None and run_id:
+            monitor.history.end_run(run_id)
+        if run_id:
+            monitor.cell_summaries.end_run(run_id)
+        if monitor.tracer is not None and run_id:
+            monitor.tracer.end_run(run_id)
+        # A SparkContext may have been created without the listener
+        monitor.poll_status()
     
     ip.events.register('pre_run_cell', pre_run_cell_hook)
+    ip.events.register('post_run_cell', post_run_cell_hook)
+
+def tag_spark_jobs(run_id):
+    """Tag the Spark jobs of the calling thread with a cell execution.
+
+    The run id is set as a Spark local property which the listener sends
+    back with each job. Local properties are inherited by threads created
+    with pyspark.InheritableThread; jobs from other threads are attributed
+    through their job group or to the cell running at the time.
+    """
+    if not spark_imported:
+        return
+    sc = SparkContext._active_spark_context
+    if sc is None:
+        return  # Jobs of the cell creating the context use the fallback
+    try:
+        sc.setLocalProperty(RUN_ID_PROPERTY, run_id)
+    except Exception as e:
+        logger.debug('Could not tag Spark jobs with run id: %s', e)
 
 def configure(conf):
     """Configures the provided conf object.
@@ -234,6 +743,8 @@ def configure(conf):
     logger.info('SparkConf Configured, Starting to listen on port:', str(port))
     os.environ['SPARKMONITOR_KERNEL_PORT'] = str(port)
     logger.info(os.environ['SPARKMONITOR_KERNEL_PORT'])
+    if monitor.getSocketPath():
+        os.environ['SPARKMONITOR_KERNEL_SOCKET'] = monitor.getSocketPath()
     spark_scala_version = get_spark_scala_version()
     if "2.11" in spark_scala_version:
         jarpath = os.path.abspath(os.path.dirname(__file__)) + "/listener_2.11.jar"
@@ -254,19 +765,312 @@ def configure(conf):
         logger.warn("Unknown scala version skipped configuring listener jar.")
 
 
-def sendToFrontEnd(msg):
-    """Send a message to the frontend through the singleton monitor object."""
+def sendToFrontEnd(msg, key=None, keep=True):
+    """Send a message to the frontends through the singleton monitor object."""
+    global monitor
+
+    displayToFrontEnd(msg)
+
+    # send spark data to jupyter lab and notebook
+    if monitor and hasattr(monitor, 'send'):
+        monitor.send(msg, key=key, keep=keep)
+
+
+def displayToFrontEnd(msg):
+    """Publish a message as display data, used by the VS Code renderer.
+
+    Each cell execution has one output, updated with every message and
+    replaced by the summary of the execution once its jobs end.
+    """
     global monitor, run_id
 
+    displayId = msg.get('runId') or run_id
+    update = False
+    if monitor:
+        summaries = monitor.cell_summaries
+        if msg.get('msgtype') in NOTICE_MSGTYPES and summaries.on_notice(msg):
+            return  # Published with the summary
+        update = summaries.display_mode(displayId)
+        if update is None:
+            return  # The output holds the summary of its cell
+
     # send spark data to vscode jupyter
     display_data = {
         'application/vnd.sparkmonitor+json': msg,
     }
-    display(display_data, raw=True, display_id=run_id)
+    start = time.perf_counter()
+    display(display_data, raw=True, display_id=displayId, update=update)
+    if monitor:
+        monitor.display_seconds.observe(time.perf_counter() - start)
+
+
+def displaySummary(summary, displayId):
+    """Replace the live output of a cell execution with its summary."""
+    display({'application/vnd.sparkmonitor+json': summary}, raw=True,
+            display_id=displayId, update=True)
+
+def get_stats():
+    """Return a snapshot of the runtime statistics of the extension."""
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.metrics.snapshot()
+
+
+def get_stage_summary(stageId, appId=None):
+    """Return the task summary of a stage sent by the listener.
+
+    Returns count, mean, min, max and quantiles of the task duration, GC
+    time, shuffle read bytes, spilled bytes and result size, the bytes and
+    records read and written, and the task counts per executor, or None
+    if the stage has no ended task yet.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    summary = monitor.summaries.get(stageId, appId)
+    if summary is None:
+        return None
+    return {name: value.to_dict() if hasattr(value, 'to_dict') else value
+            for name, value in summary.items()}
+
+
+def get_stage_throughput(stageId, appId=None):
+    """Return the I/O throughput of a stage.
+
+    Holds the bytes and records of the input, output, shuffle read and
+    shuffle write of the stage, per second of the stage and per task-second,
+    and the bytes moved by each executor per task-second of its tasks.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.throughput.get(stageId, appId)
+
+
+def get_cell_utilisation(runId=None):
+    """Return how a cell execution used the executor cores, the last one by default.
+
+    The report holds the allocated core-seconds, the busy task-seconds,
+    the idle core-seconds, the utilisation (busy over allocated) and the
+    peak number of running tasks, or None if no job of the cell ended.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.utilisation.report(runId)
+
+
+def subscribe(event, fn, filter=None):
+    """Call fn with each listener event of a type, on a worker thread.
+
+    event is one of applicationStart, applicationEnd, jobStart, jobEnd,
+    stageSubmitted, stageActive, stageCompleted, taskStart, taskEnd,
+    executorAdded and executorRemoved. filter is a dict of the values
+    the event fields must have, or a function of the event returning
+    whether to call fn. Returns a Subscription, cancel() unsubscribes it.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.events.subscribe(event, fn, filter)
+
+
+def unsubscribe(subscription):
+    """Stop calling the callback of a subscription"""
+    subscription.cancel()
+
+
+def start_tracing(target, taskRate=0.0):
+    """Export the cell executions, jobs and stages as OpenTelemetry spans.
+
+    target is the path of a file, where OTLP JSON export requests are
+    appended one per line, an http(s) OTLP endpoint such as
+    http://localhost:4318/v1/traces, or an object with export(request)
+    and close() methods. taskRate is the fraction of the tasks received
+    exported as spans.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    monitor.start_tracing(target, taskRate)
+
+
+def stop_tracing():
+    """Export the remaining spans and stop exporting"""
+    global monitor
+    if monitor is not None:
+        monitor.stop_tracing()
+
+
+def profile_cell(cell):
+    """Run the code of a cell and return a ProfileReport of its Spark jobs.
+
+    Used by the %%sparkmonitor profile cell magic. The code is run with
+    ip.run_cell, as a cell execution of its own, so that magics, input
+    transformations, tracebacks and the execution hooks work as in any
+    cell. The listeners send all task records while it runs, and the
+    report is built once its jobs have ended.
+    """
+    global monitor, ip, run_id
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    outerRunId = run_id
+    profiler = CellProfiler(None)
+    previous = dict((name, monitor.control.user.get(name)) for name in PROFILE_OPTIONS)
+    monitor.control.set_options(**PROFILE_OPTIONS)
+    monitor.nextProfiler = profiler
+    try:
+        ip.run_cell(cell)
+        profiler.endTime = time.time()
+        profiler.wait_for_jobs()
+    finally:
+        monitor.nextProfiler = None
+        monitor.control.set_options(**previous)
+        monitor.profilers.pop(profiler.runId, None)
+        # Jobs started by the rest of the cell running the magic are its own
+        run_id = outerRunId
+        if outerRunId is not None:
+            tag_spark_jobs(outerRunId)
+    return profiler.report(monitor.utilisation.report(profiler.runId))
+
+
+def get_critical_path(jobId=None, appId=None):
+    """Return the critical path analysis of an ended job, the last one by default.
+
+    The analysis holds the stages of the critical path of the job, the
+    duration and slack of each of its stages in ms, and the bottlenecks,
+    the longest stages of the critical path with their share of it.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.critical_paths.report(jobId, appId)
+
+
+def get_driver_bottleneck(jobId=None, appId=None):
+    """Return the driver bottleneck notice of a job, the last one warned about by default.
+
+    The notice holds the bytes the result stage of the job sent to the
+    driver and the time spent getting and serialising its results in ms.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.driver_bottlenecks.report(jobId, appId)
+
+
+def get_cpu_governor():
+    """Return the level of detail set by the CPU governor.
+
+    Holds the level, 0 for full detail, its name, the share of a core the
+    extension threads used in the last window and the budget.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.governor.state()
+
+
+def get_executor_memory(appId=None):
+    """Return the memory samples of the executors of an application, the last one sampled by default.
+
+    Holds for each executor id its samples, oldest first, of the peak heap,
+    off-heap, execution and storage memory in bytes, the heap limit, the
+    total GC time in ms and the fraction of the time spent in GC since the
+    previous sample, and its active alerts.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.executors.report(appId)
+
+
+def start_session_log(path=None):
+    """Log the listener messages received from now on, for export().
+
+    The log is a temporary file removed when the kernel exits, or path,
+    which is kept. Returns the path of the log.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return monitor.start_session_log(path)
+
+
+def export(path, format='parquet', appId=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Export the jobs, stages, tasks and executor events monitored in this session.
+
+    format is parquet or arrow, to write a directory of tables partitioned
+    by application, or eventlog, to write the events of one application,
+    the last one started by default, as a Spark event log. Only the
+    messages logged since start_session_log are exported. The session log
+    is read as a stream and tasks are written chunkSize rows at a time.
+    Returns the number of rows written to each table, or of events.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    if monitor.session is None:
+        raise RuntimeError('Nothing to export, start the session log first with '
+                           'start_session_log() or SPARKMONITOR_SESSION_LOG')
+    return export_session(monitor.session, path, format, appId,
+                          monitor.router.cell_of, chunkSize)
+
+
+def get_run_history(fingerprint=None, limit=20):
+    """Return the latest recorded runs of some Spark work, the latest first.
+
+    fingerprint identifies the jobs and stages of a cell execution, it
+    defaults to that of the last cell execution which ran Spark jobs.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    if monitor.history is None:
+        return []
+    fingerprint = fingerprint or monitor.history.lastFingerprint
+    if fingerprint is None:
+        return []
+    return monitor.history.store.runs(fingerprint, limit)
+
+
+def set_task_sampling(rate=1, reservoir=0):
+    """Forward only a sample of the task events to the frontend.
+
+    rate forwards one task in rate, reservoir forwards the n-th task of
+    a stage with probability reservoir / n. The defaults forward all
+    tasks. The task summaries of stages still count every task, the
+    listener can also sample with spark.sparkmonitor.taskSampleRate and
+    spark.sparkmonitor.taskReservoirSize.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    monitor.sampler.configure(rate, reservoir)
+
+
+def set_listener_options(**options):
+    """Change the detail sent by the Spark listeners at runtime.
+
+    Options are taskSampleRate, taskReservoirSize, taskDetail ('full' or
+    'aggregate'), metricDetail ('full' or 'basic'), stageActiveRate (ms)
+    and taskEventsPerTick. They take precedence over the detail chosen
+    from the views open in the frontends, None resets an option.
+    """
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    monitor.control.set_options(**options)
+
+
+def get_listener_options():
+    """Return the options requested from the Spark listeners"""
+    global monitor
+    if monitor is None:
+        raise RuntimeError('The SparkMonitor kernel extension is not loaded')
+    return dict(monitor.control.sent)
 
-    # send spark data to jupyter lab and notebook
-    if monitor and hasattr(monitor, 'send'):
-        monitor.send(msg)
 
 def get_spark_scala_version():
     cmd = "pyspark --version 2>&1 | grep -m 1  -Eo '[0-9]*[.][0-9]*[.][0-9]*[,]' | sed 's/,$//'"
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor IPython Magics
+
+Usage:
+    %sparkmonitor stats               Print runtime statistics of the extension
+    %sparkmonitor stats reset         Reset the runtime statistics
+    %sparkmonitor stats serve [port]  Serve the statistics in Prometheus text
+                                      format on localhost
+    %sparkmonitor stats stop          Stop the Prometheus endpoint
+    %sparkmonitor sampling            Print the task sampling settings
+    %sparkmonitor sampling rate N     Forward one task event in N
+    %sparkmonitor sampling reservoir K
+                                      Forward the n-th task event of a stage
+                                      with probability K / n
+    %sparkmonitor sampling off        Forward all task events
+    %sparkmonitor listener            Print the options requested from the
+                                      Spark listeners
+    %sparkmonitor listener name=value ...
+                                      Change the detail sent by the listeners,
+                                      name=default resets an option
+    %%sparkmonitor profile            Run the cell and return a report of its
+                                      Spark jobs: driver and cluster time,
+                                      task time by phase, slowest tasks,
+                                      spills and executor utilisation
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+
+def sparkmonitor_magic(line, cell=None):
+    """Entrypoint of the %sparkmonitor and %%sparkmonitor magics"""
+    from . import kernelextension
+    monitor = kernelextension.monitor
+
+    args = line.split()
+    command = args[0] if args else ''
+    if command == 'profile':
+        return profile_command(kernelextension, cell)
+    if command == 'stats':
+        return stats_command(monitor, args[1:])
+    if command == 'sampling':
+        return sampling_command(monitor, args[1:])
+    if command == 'listener':
+        return listener_command(monitor, args[1:])
+    print(__doc__)
+
+
+def stats_command(monitor, args):
+    """Handles %sparkmonitor stats"""
+    action = args[0] if args else ''
+    if action == '':
+        print(monitor.metrics.format_table())
+        if monitor.prometheus is not None:
+            print('Prometheus endpoint: http://127.0.0.1:%s/metrics'
+                  % monitor.prometheus.port)
+    elif action == 'reset':
+        monitor.metrics.reset()
+    elif action == 'serve':
+        port = args[1] if len(args) > 1 else '0'
+        if not port.isdigit() or int(port) > 65535:
+            print('Invalid port: %s' % port)
+            print(__doc__)
+            return
+        port = monitor.serve_stats(int(port))
+        print('Serving SparkMonitor statistics on http://127.0.0.1:%s/metrics' % port)
+    elif action == 'stop':
+        monitor.stop_stats()
+    else:
+        print(__doc__)
+
+
+def sampling_command(monitor, args):
+    """Handles %sparkmonitor sampling"""
+    sampler = monitor.sampler
+    action = args[0] if args else ''
+    try:
+        if action == 'rate' and len(args) > 1:
+            sampler.configure(rate=int(args[1]))
+        elif action == 'reservoir' and len(args) > 1:
+            sampler.configure(reservoir=int(args[1]))
+        elif action == 'off':
+            sampler.configure()
+        elif action != '':
+            print(__doc__)
+            return
+    except ValueError as e:
+        print('Invalid sampling setting: %s' % e)
+        return
+    if sampler.reservoir:
+        print('Forwarding the n-th task event of a stage with probability %d / n' % sampler.reservoir)
+    elif sampler.rate > 1:
+        print('Forwarding one task event in %d' % sampler.rate)
+    else:
+        print('Forwarding all task events')
+
+
+def profile_command(kernelextension, cell):
+    """Handles %%sparkmonitor profile"""
+    if cell is None:
+        print('Profile a cell with %%sparkmonitor profile on its first line')
+        return
+    return kernelextension.profile_cell(cell)
+
+
+def listener_command(monitor, args):
+    """Handles %sparkmonitor listener"""
+    options = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if value == 'default':
+            options[name] = None
+        else:
+            options[name] = int(value) if value.isdigit() else value
+    try:
+        monitor.control.set_options(**options)
+    except ValueError as e:
+        print('Invalid listener option: %s' % e)
+        return
+    requested = monitor.control.sent
+    if not requested:
+        print('The listeners use their Spark configuration')
+    for name in sorted(requested):
+        print('%s = %s' % (name, requested[name]))
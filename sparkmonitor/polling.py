@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Status Polling
+
+Fallback for Spark applications without the listener, e.g. when the Scala
+version of Spark is unknown, spark.driver.extraClassPath cannot be set or
+the SparkContext was created before the extension was loaded. The job and
+stage progress is polled from the StatusTracker of the SparkContext on a
+background thread and turned into the messages the listener would send:
+
+    sparkApplicationStart, sparkJobStart, sparkStageSubmitted,
+    sparkStageActive, sparkStageCompleted, sparkJobEnd
+
+so that the kernel and every frontend handle them unchanged. The status
+tracker knows neither task records, parents of stages nor exact times:
+times are those of the poll which saw the change, and jobs which start
+and end between two polls are found from their consecutive ids.
+
+Polls are frequent while jobs run and back off while the application is
+idle. Each poll takes a few Py4J calls, its duration is measured and the
+interval kept at least MAX_OVERHEAD_FACTOR times longer, which bounds the
+driver time spent polling.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import logging
+import time
+from threading import Event, Thread
+
+from .routing import BoundedDict
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+# Poll interval in seconds while jobs run, and its bound while idle
+MIN_POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 5.0
+
+# Poll interval at least this many times the duration of a poll
+MAX_OVERHEAD_FACTOR = 20
+
+# Time in seconds the listener has to connect before polling starts
+LISTENER_GRACE_PERIOD = 3.0
+
+
+class PolledStage:
+    """Last state of a stage seen by the poller"""
+
+    __slots__ = ('stageId', 'attemptId', 'name', 'numTasks', 'numActiveTasks',
+                 'numCompletedTasks', 'numFailedTasks', 'submissionTime', 'jobIds', 'sent')
+
+    def __init__(self, stageId):
+        self.stageId = stageId
+        self.attemptId = 0
+        self.name = None
+        self.numTasks = 0
+        self.numActiveTasks = 0
+        self.numCompletedTasks = 0
+        self.numFailedTasks = 0
+        self.submissionTime = None
+        self.jobIds = []
+        # Task counts last sent, unchanged stages are not sent again
+        self.sent = None
+
+    def update(self, info):
+        self.attemptId = info.currentAttemptId
+        self.name = info.name
+        self.numTasks = info.numTasks
+        self.numActiveTasks = info.numActiveTasks
+        self.numCompletedTasks = info.numCompletedTasks
+        self.numFailedTasks = info.numFailedTasks
+
+    def started(self):
+        return bool(self.numActiveTasks or self.numCompletedTasks or self.numFailedTasks)
+
+    def fields(self):
+        return {
+            'stageId': self.stageId,
+            'stageAttemptId': self.attemptId,
+            'name': self.name,
+            'numTasks': self.numTasks,
+            'parentIds': [],
+            'jobIds': list(self.jobIds),
+        }
+
+
+class StatusPoller(Thread):
+    """Polls the StatusTracker of a SparkContext from a background thread"""
+
+    def __init__(self, sc, send, metrics, listenerConnected=None):
+        """Constructor
+
+        send is called with each message as a JSON string, as received
+        from the listener. listenerConnected(appId) tells whether a
+        listener connected for the application, in which case polling
+        stops.
+        """
+        Thread.__init__(self)
+        self.daemon = True
+        self.sc = sc
+        self.send = send
+        self.listenerConnected = listenerConnected
+        self.appId = sc.applicationId
+        self.stopped = Event()
+        self.jobs = {}
+        self.stages = {}
+        # Stages already completed, skipped by the later jobs using them
+        self.completed = BoundedDict(10000)
+        # Largest job id seen, None before the first poll
+        self.lastJobId = None
+        self.interval = MIN_POLL_INTERVAL
+        self.polls = metrics.counter(
+            'status_polls', 'StatusTracker polls of applications without listener')
+        self.poll_seconds = metrics.histogram(
+            'status_poll_seconds', 'Time spent polling the StatusTracker')
+        metrics.gauge('status_poll_interval_seconds', 'Current StatusTracker poll interval',
+                      fn=lambda: self.interval if self.is_alive() else 0)
+
+    def emit(self, msgtype, fields):
+        msg = {'msgtype': msgtype, 'appId': self.appId, 'emitTime': int(time.time() * 1000)}
+        msg.update(fields)
+        self.send(json.dumps(msg))
+
+    def active(self):
+        """Whether the SparkContext is still the active one and not stopped"""
+        sc = self.sc
+        return sc._jsc is not None and type(sc)._active_spark_context is sc
+
+    def run(self):
+        if self.stopped.wait(LISTENER_GRACE_PERIOD):
+            return
+        if self.listenerConnected is not None and self.listenerConnected(self.appId):
+            return
+        logger.info('SparkMonitor polling the status of application %s', self.appId)
+        self.emit('sparkApplicationStart', {
+            'startTime': self.sc.startTime,
+            'appName': self.sc.appName,
+            'appAttemptId': 'null',
+            'sparkUser': self.sc.sparkUser(),
+        })
+        while not self.stopped.is_set() and self.active():
+            if self.listenerConnected is not None and self.listenerConnected(self.appId):
+                break
+            start = time.perf_counter()
+            try:
+                busy = self.poll()
+            except Exception as e:
+                logger.warn('SparkMonitor could not poll the Spark status: %s', e)
+                busy = False
+            duration = time.perf_counter() - start
+            self.polls.inc()
+            self.poll_seconds.observe(duration)
+            if busy:
+                self.interval = MIN_POLL_INTERVAL
+            else:
+                self.interval = min(MAX_POLL_INTERVAL, self.interval * 2)
+            self.interval = max(self.interval, duration * MAX_OVERHEAD_FACTOR)
+            self.stopped.wait(self.interval)
+        self.finish_jobs('UNKNOWN')
+
+    def stop(self):
+        self.stopped.set()
+
+    def poll(self):
+        """Send the changes since the last poll, returns whether jobs are running"""
+        tracker = self.sc.statusTracker()
+        running = list(self.jobs)
+        active = set(tracker.getActiveJobsIds())
+        jobIds = active | set(tracker.getJobIdsForGroup())
+        first = self.lastJobId is None
+        if first:
+            # Jobs which ended before polling started are not replayed
+            self.lastJobId = min(active) - 1 if active else max(jobIds or [-1])
+        newest = max(jobIds) if jobIds else self.lastJobId
+        # Job ids are consecutive, jobs of groups which already ended are found too
+        for jobId in range(self.lastJobId + 1, newest + 1):
+            if first and jobId not in active:
+                continue
+            info = tracker.getJobInfo(jobId)
+            if info is not None:
+                self.start_job(tracker, info)
+        self.lastJobId = max(self.lastJobId, newest)
+        for jobId in running:
+            info = tracker.getJobInfo(jobId)
+            self.update_job(tracker, jobId, info.status if info is not None else 'UNKNOWN')
+        return bool(self.jobs)
+
+    def stage(self, tracker, stageId, jobId):
+        stage = self.stages.get(stageId)
+        if stage is None:
+            stage = self.stages[stageId] = PolledStage(stageId)
+        if jobId not in stage.jobIds:
+            stage.jobIds.append(jobId)
+        if stageId not in self.completed or stage.name is None:
+            info = tracker.getStageInfo(stageId)
+            if info is not None:
+                stage.update(info)
+        return stage
+
+    def num_executors(self):
+        """Number of executors, not counting the driver"""
+        try:
+            return max(1, len(self.sc._jsc.sc().statusTracker().getExecutorInfos()) - 1)
+        except Exception:
+            return None
+
+    def start_job(self, tracker, info):
+        now = int(time.time() * 1000)
+        stages = [self.stage(tracker, stageId, info.jobId) for stageId in info.stageIds]
+        stageInfos = {}
+        for stage in stages:
+            stageInfos[str(stage.stageId)] = {
+                'attemptId': stage.attemptId,
+                'name': stage.name,
+                'numTasks': stage.numTasks,
+                'parentIds': [],
+                'submissionTime': -1,
+                'completionTime': -1,
+            }
+        self.emit('sparkJobStart', {
+            'jobGroup': 'null',
+            'runId': 'null',
+            'jobId': info.jobId,
+            'status': 'RUNNING',
+            'submissionTime': now,
+            'stageIds': list(info.stageIds),
+            'stageInfos': stageInfos,
+            'numTasks': sum(stage.numTasks for stage in stages),
+            'totalCores': self.sc.defaultParallelism,
+            'numExecutors': self.num_executors(),
+            'name': stages[-1].name if stages else 'null',
+        })
+        self.jobs[info.jobId] = list(info.stageIds)
+        self.update_job(tracker, info.jobId, info.status, stages)
+
+    def update_job(self, tracker, jobId, status, stages=None):
+        now = int(time.time() * 1000)
+        if stages is None:
+            stages = [self.stage(tracker, stageId, jobId) for stageId in self.jobs[jobId]]
+        for stage in stages:
+            if stage.submissionTime is None and stage.started() and stage.stageId not in self.completed:
+                stage.submissionTime = now
+                fields = stage.fields()
+                fields['submissionTime'] = now
+                self.emit('sparkStageSubmitted', fields)
+            if stage.submissionTime is None or stage.stageId in self.completed:
+                continue
+            fields = stage.fields()
+            fields.update({
+                'numActiveTasks': stage.numActiveTasks,
+                'numCompletedTasks': stage.numCompletedTasks,
+                'numFailedTasks': stage.numFailedTasks,
+            })
+            done = stage.numCompletedTasks >= stage.numTasks and not stage.numActiveTasks
+            if done or status != 'RUNNING':
+                fields.update({
+                    'status': 'COMPLETED' if done else 'FAILED',
+                    'submissionTime': stage.submissionTime,
+                    'completionTime': now,
+                })
+                self.emit('sparkStageCompleted', fields)
+                self.completed[stage.stageId] = True
+            elif stage.sent != (stage.numActiveTasks, stage.numCompletedTasks, stage.numFailedTasks):
+                stage.sent = (stage.numActiveTasks, stage.numCompletedTasks, stage.numFailedTasks)
+                self.emit('sparkStageActive', fields)
+        if status != 'RUNNING':
+            self.end_job(jobId, status, now)
+
+    def end_job(self, jobId, status, now):
+        for stageId in self.jobs.pop(jobId):
+            stage = self.stages.get(stageId)
+            if stage is not None and jobId in stage.jobIds:
+                stage.jobIds.remove(jobId)
+                if not stage.jobIds:
+                    del self.stages[stageId]
+        self.emit('sparkJobEnd', {
+            'jobId': jobId,
+            'status': status,
+            'completionTime': now,
+        })
+
+    def finish_jobs(self, status):
+        """End the jobs still running when polling stops"""
+        now = int(time.time() * 1000)
+        for jobId in list(self.jobs):
+            self.end_job(jobId, status, now)
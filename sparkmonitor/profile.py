@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Cell Profiles
+
+The %%sparkmonitor profile cell magic runs a cell while collecting the
+listener messages of its execution, and returns a ProfileReport:
+
+- the wall time of the cell, split into the time jobs were running on the
+  cluster and the time spent in the driver only,
+- per stage, the task time split into the phases reported by the
+  listener: scheduler delay, deserialisation, shuffle read, computing,
+  shuffle write, serialisation and getting the result, and the GC time,
+- the slowest tasks, compared with the typical task of their stage, its
+  median from the task summary of the stage or else its mean,
+- the bytes spilled to memory and to disk,
+- the executor utilisation of the execution.
+
+The report renders as a table in notebooks and its attributes can be
+asserted on in performance tests. Task records are requested from the
+listeners while the cell runs, whatever views are open.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import heapq
+import time
+from html import escape
+from threading import Condition
+
+from .summaries import LogHistogram
+
+# Phases of the task time, in the order of the task chart
+TASK_PHASES = ('schedulerDelay', 'deserializationTime', 'shuffleReadTime',
+               'executorComputingTime', 'shuffleWriteTime', 'serializationTime',
+               'gettingResultTime')
+
+# Listener options while a profiled cell runs
+PROFILE_OPTIONS = {'taskDetail': 'full', 'taskSampleRate': 1, 'taskReservoirSize': 0}
+
+# Number of slowest tasks reported
+MAX_STRAGGLERS = 5
+
+# Time in seconds to wait for the end of the jobs once the cell has run
+JOB_END_TIMEOUT = 5.0
+
+
+class StageProfile:
+    """Task time of a stage attempt, by phase"""
+
+    def __init__(self, appId, stageId, attemptId):
+        """Constructor"""
+        self.appId = appId
+        self.stageId = stageId
+        self.attemptId = attemptId
+        self.name = None
+        self.status = None
+        self.numTasks = 0
+        self.numFailedTasks = 0
+        self.submissionTime = None
+        self.completionTime = None
+        self.taskCount = 0
+        self.taskTime = 0
+        self.phases = dict((phase, 0) for phase in TASK_PHASES)
+        self.jvmGCTime = 0
+        self.memoryBytesSpilled = 0
+        self.diskBytesSpilled = 0
+        self.medianDuration = None
+
+    def on_task_end(self, data, duration):
+        metrics = data.get('metrics') or {}
+        self.taskCount += 1
+        self.taskTime += duration
+        for phase in TASK_PHASES:
+            self.phases[phase] += metrics.get(phase, 0)
+        self.jvmGCTime += metrics.get('jvmGCTime', 0)
+        self.memoryBytesSpilled += metrics.get('memoryBytesSpilled', 0)
+        self.diskBytesSpilled += metrics.get('diskBytesSpilled', 0)
+
+    def on_stage_completed(self, data):
+        self.name = data.get('name', self.name)
+        self.status = data.get('status')
+        self.numTasks = data.get('numTasks', self.numTasks)
+        self.numFailedTasks = data.get('numFailedTasks', 0)
+        self.submissionTime = data.get('submissionTime')
+        self.completionTime = data.get('completionTime')
+        summary = data.get('taskSummary') or {}
+        if summary.get('duration'):
+            self.medianDuration = LogHistogram.from_json(summary['duration']).quantile(0.5)
+
+    @property
+    def duration(self):
+        if self.submissionTime is None or self.completionTime is None:
+            return None
+        return max(0, self.completionTime - self.submissionTime)
+
+    def to_dict(self):
+        return {
+            'appId': self.appId,
+            'stageId': self.stageId,
+            'attemptId': self.attemptId,
+            'name': self.name,
+            'status': self.status,
+            'numTasks': self.numTasks,
+            'numFailedTasks': self.numFailedTasks,
+            'duration': self.duration,
+            'taskTime': self.taskTime,
+            'phases': dict(self.phases),
+            'jvmGCTime': self.jvmGCTime,
+            'memoryBytesSpilled': self.memoryBytesSpilled,
+            'diskBytesSpilled': self.diskBytesSpilled,
+        }
+
+
+def union_length(intervals):
+    """Total length covered by a list of (start, end) intervals"""
+    total = 0
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+
+class CellProfiler:
+    """Collects the listener messages of one profiled cell execution"""
+
+    def __init__(self, runId):
+        """Constructor"""
+        self.runId = runId
+        self.startTime = time.time()
+        self.endTime = None
+        self.stages = {}
+        self.jobs = {}
+        self.runningJobs = set()
+        # Min-heap of the slowest tasks, (duration, taskId, task)
+        self.stragglers = []
+        self.condition = Condition()
+
+    def _stage(self, appId, stageId, attemptId):
+        key = (appId, stageId, attemptId or 0)
+        stage = self.stages.get(key)
+        if stage is None:
+            stage = self.stages[key] = StageProfile(appId, stageId, attemptId or 0)
+        return stage
+
+    def on_message(self, data, appId=None):
+        """Account a listener message routed to the profiled execution"""
+        msgtype = data.get('msgtype')
+        with self.condition:
+            if msgtype == 'sparkJobStart':
+                key = (appId, data.get('jobId'))
+                self.jobs[key] = [data.get('submissionTime'), None]
+                self.runningJobs.add(key)
+            elif msgtype == 'sparkJobEnd':
+                key = (appId, data.get('jobId'))
+                if key in self.jobs:
+                    self.jobs[key][1] = data.get('completionTime')
+                self.runningJobs.discard(key)
+                self.condition.notify_all()
+            elif msgtype == 'sparkStageSubmitted':
+                stage = self._stage(appId, data.get('stageId'), data.get('stageAttemptId'))
+                stage.name = data.get('name')
+                stage.numTasks = data.get('numTasks', 0)
+            elif msgtype == 'sparkStageCompleted':
+                self._stage(appId, data.get('stageId'), data.get('stageAttemptId')) \
+                    .on_stage_completed(data)
+            elif msgtype == 'sparkTaskEnd':
+                stage = self._stage(appId, data.get('stageId'), data.get('stageAttemptId'))
+                duration = max(0, (data.get('finishTime') or 0) - (data.get('launchTime') or 0))
+                stage.on_task_end(data, duration)
+                task = {
+                    'appId': appId,
+                    'stageId': data.get('stageId'),
+                    'stageAttemptId': data.get('stageAttemptId'),
+                    'taskId': data.get('taskId'),
+                    'index': data.get('index'),
+                    'executorId': data.get('executorId'),
+                    'host': data.get('host'),
+                    'duration': duration,
+                }
+                entry = (duration, data.get('taskId'), task)
+                if len(self.stragglers) < MAX_STRAGGLERS:
+                    heapq.heappush(self.stragglers, entry)
+                elif entry[:2] > self.stragglers[0][:2]:
+                    heapq.heapreplace(self.stragglers, entry)
+
+    def wait_for_jobs(self, timeout=JOB_END_TIMEOUT):
+        """Wait until the jobs of the execution have ended, or timeout"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.runningJobs:
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self.condition.wait(left)
+        return True
+
+    def report(self, utilisation=None):
+        """Build the report of the execution"""
+        with self.condition:
+            wallTime = (self.endTime or time.time()) - self.startTime
+            intervals = [(start, end) for start, end in self.jobs.values()
+                         if start is not None and end is not None]
+            clusterTime = min(wallTime, union_length(intervals) / 1000.0)
+            stages = sorted(self.stages.values(),
+                            key=lambda s: (str(s.appId), s.stageId, s.attemptId))
+            stragglers = []
+            for duration, _, task in sorted(self.stragglers, reverse=True):
+                task = dict(task)
+                stage = self.stages.get((task['appId'], task['stageId'], task['stageAttemptId'] or 0))
+                median = stage.medianDuration if stage is not None else None
+                if median is None and stage is not None and stage.taskCount:
+                    median = stage.taskTime / stage.taskCount
+                task['stageTypicalDuration'] = median
+                task['ratio'] = duration / median if median else None
+                stragglers.append(task)
+            return ProfileReport(
+                runId=self.runId,
+                wallTime=wallTime,
+                clusterTime=clusterTime,
+                numJobs=len(self.jobs),
+                stages=[stage.to_dict() for stage in stages],
+                stragglers=stragglers,
+                memoryBytesSpilled=sum(s.memoryBytesSpilled for s in stages),
+                diskBytesSpilled=sum(s.diskBytesSpilled for s in stages),
+                utilisation=utilisation,
+                complete=not self.runningJobs,
+            )
+
+
+def format_ms(ms):
+    if ms is None:
+        return '-'
+    if ms < 1000:
+        return '%dms' % ms
+    return '%.1fs' % (ms / 1000.0)
+
+
+def format_bytes(n):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if n < 1000:
+            return '%.0f %s' % (n, unit) if unit == 'B' else '%.1f %s' % (n, unit)
+        n /= 1000.0
+    return '%.1f TB' % n
+
+
+class ProfileReport:
+    """Spark performance report of a profiled cell execution
+
+    Times are in seconds for the cell and in ms for stages and tasks.
+    """
+
+    def __init__(self, runId, wallTime, clusterTime, numJobs, stages, stragglers,
+                 memoryBytesSpilled, diskBytesSpilled, utilisation=None, complete=True):
+        """Constructor"""
+        self.runId = runId
+        self.wallTime = wallTime
+        self.clusterTime = clusterTime
+        self.driverTime = max(0.0, wallTime - clusterTime)
+        self.numJobs = numJobs
+        self.stages = stages
+        self.stragglers = stragglers
+        self.memoryBytesSpilled = memoryBytesSpilled
+        self.diskBytesSpilled = diskBytesSpilled
+        self.utilisation = utilisation
+        # False if some jobs had not ended when the report was built
+        self.complete = complete
+
+    @property
+    def numStages(self):
+        return len(self.stages)
+
+    @property
+    def bytesSpilled(self):
+        return self.memoryBytesSpilled + self.diskBytesSpilled
+
+    def stage(self, stageId, attemptId=None):
+        """Return the profile of a stage, its last attempt by default"""
+        found = [s for s in self.stages if s['stageId'] == stageId and
+                 (attemptId is None or s['attemptId'] == attemptId)]
+        return found[-1] if found else None
+
+    def to_dict(self):
+        return {
+            'runId': self.runId,
+            'wallTime': self.wallTime,
+            'clusterTime': self.clusterTime,
+            'driverTime': self.driverTime,
+            'numJobs': self.numJobs,
+            'stages': self.stages,
+            'stragglers': self.stragglers,
+            'memoryBytesSpilled': self.memoryBytesSpilled,
+            'diskBytesSpilled': self.diskBytesSpilled,
+            'utilisation': self.utilisation,
+            'complete': self.complete,
+        }
+
+    def _summary_lines(self):
+        lines = ['Wall time %.2fs: %.2fs with jobs running on the cluster, %.2fs in the driver only'
+                 % (self.wallTime, self.clusterTime, self.driverTime),
+                 '%d jobs, %d stages, %s spilled to memory, %s spilled to disk'
+                 % (self.numJobs, self.numStages, format_bytes(self.memoryBytesSpilled),
+                    format_bytes(self.diskBytesSpilled))]
+        if self.utilisation and self.utilisation.get('utilisation') is not None:
+            lines.append('Executor utilisation %.0f%%: %.1f busy task-s of %.1f core-s, '
+                         'peak of %d running tasks'
+                         % (self.utilisation['utilisation'] * 100,
+                            self.utilisation['busyTaskSeconds'],
+                            self.utilisation['allocatedCoreSeconds'],
+                            self.utilisation['peakParallelism']))
+        if not self.complete:
+            lines.append('Some jobs had not ended when the report was built')
+        return lines
+
+    def __repr__(self):
+        lines = ['SparkMonitor profile'] + ['  ' + line for line in self._summary_lines()]
+        if self.stages:
+            lines.append('  Stages (task time by phase):')
+            for s in self.stages:
+                phases = ', '.join('%s %s' % (phase, format_ms(s['phases'][phase]))
+                                   for phase in TASK_PHASES if s['phases'][phase])
+                lines.append('    %s %s: %s, %d tasks, %s' % (
+                    s['stageId'], s['name'], format_ms(s['duration']), s['numTasks'],
+                    phases or 'no task records'))
+        if self.stragglers:
+            lines.append('  Slowest tasks:')
+            for t in self.stragglers:
+                lines.append('    task %s of stage %s on executor %s: %s%s' % (
+                    t['taskId'], t['stageId'], t['executorId'], format_ms(t['duration']),
+                    ', %.1fx the typical task of the stage' % t['ratio'] if t['ratio'] else ''))
+        return '\n'.join(lines)
+
+    def _repr_html_(self):
+        def cell(value):
+            return '<td>%s</td>' % escape(str(value))
+        out = ['<div class="sparkmonitor-profile"><b>SparkMonitor profile</b><ul>']
+        out += ['<li>%s</li>' % escape(line) for line in self._summary_lines()]
+        out.append('</ul>')
+        if self.stages:
+            out.append('<table><tr><th>Stage</th><th>Name</th><th>Duration</th><th>Tasks</th>')
+            out += ['<th>%s</th>' % phase for phase in TASK_PHASES]
+            out.append('<th>jvmGCTime</th><th>Spilled</th></tr>')
+            for s in self.stages:
+                out.append('<tr>' + cell(s['stageId']) + cell(s['name']) +
+                           cell(format_ms(s['duration'])) + cell(s['numTasks']))
+                out += [cell(format_ms(s['phases'][phase])) for phase in TASK_PHASES]
+                out.append(cell(format_ms(s['jvmGCTime'])) +
+                           cell(format_bytes(s['memoryBytesSpilled'] + s['diskBytesSpilled'])) +
+                           '</tr>')
+            out.append('</table>')
+        if self.stragglers:
+            out.append('<table><tr><th>Task</th><th>Stage</th><th>Executor</th>'
+                       '<th>Duration</th><th>Typical task of the stage</th></tr>')
+            for t in self.stragglers:
+                out.append('<tr>' + cell(t['taskId']) + cell(t['stageId']) +
+                           cell(t['executorId']) + cell(format_ms(t['duration'])) +
+                           cell(format_ms(t['stageTypicalDuration'])) + '</tr>')
+            out.append('</table>')
+        out.append('</div>')
+        return ''.join(out)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Cell Routing
+
+Attributes listener messages to the cell execution that started them.
+
+Each cell execution gets a run id which the kernel extension sets as a
+Spark local property before the cell runs. The listener sends it back
+with the job, so jobs are routed explicitly instead of to whichever cell
+happens to be running. Job groups, jobs and stages are indexed by run id
+so that every later message of a job is routed in constant time. As job
+and stage ids are only unique within a Spark application, the indexes
+are keyed by application id as well.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+# Spark local property carrying the run id of the cell execution
+RUN_ID_PROPERTY = 'sparkmonitor.runId'
+
+
+class BoundedDict(OrderedDict):
+    """A dict forgetting its oldest entries past a maximum size"""
+
+    def __init__(self, maxsize):
+        OrderedDict.__init__(self)
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class CellRouter:
+    """Index from job groups, jobs and stages to cell executions"""
+
+    def __init__(self, maxsize=10000):
+        """Constructor
+
+        maxsize bounds the number of entries of every index.
+        """
+        self.current = None
+        self.runToCell = BoundedDict(maxsize)
+        self.jobGroupToRun = BoundedDict(maxsize)
+        self.jobToRun = BoundedDict(maxsize)
+        self.stageToRun = BoundedDict(maxsize)
+
+    def start_run(self, runId, cellId=None):
+        """Called before a cell is executed"""
+        self.current = runId
+        self.runToCell[runId] = cellId
+
+    def cell_of(self, runId):
+        """Return the frontend cell id of a run, if it is known"""
+        return self.runToCell.get(runId)
+
+    def route(self, data, appId=None):
+        """Return the run id a parsed listener message belongs to
+
+        Returns None for messages not related to a cell, such as
+        application and executor events.
+        """
+        msgtype = data.get('msgtype')
+        if msgtype == 'sparkJobStart':
+            return self._route_job_start(data, appId)
+        elif msgtype == 'sparkJobEnd':
+            return self.jobToRun.get((appId, data.get('jobId')), self.current)
+        elif msgtype in ('sparkStageSubmitted', 'sparkStageCompleted', 'sparkStageActive'):
+            key = (appId, data.get('stageId'))
+            runId = self.stageToRun.get(key)
+            if runId is None and data.get('runId') not in (None, 'null'):
+                runId = self.stageToRun[key] = data['runId']
+            return runId or self.current
+        elif msgtype in ('sparkTaskStart', 'sparkTaskEnd'):
+            return self.stageToRun.get((appId, data.get('stageId')), self.current)
+        return None
+
+    def _route_job_start(self, data, appId):
+        runId = data.get('runId')
+        jobGroup = data.get('jobGroup')
+        if jobGroup in (None, 'null'):
+            jobGroup = None
+        if not runId or runId == 'null':
+            # Untagged job, e.g. from a thread that did not inherit local
+            # properties: use the run that first used its job group, or
+            # the cell running right now.
+            runId = self.jobGroupToRun.get(jobGroup) if jobGroup else None
+            runId = runId or self.current
+        if jobGroup and jobGroup not in self.jobGroupToRun:
+            self.jobGroupToRun[jobGroup] = runId
+        self.jobToRun[(appId, data.get('jobId'))] = runId
+        for stageId in data.get('stageIds', []):
+            self.stageToRun[(appId, stageId)] = runId
+        return runId
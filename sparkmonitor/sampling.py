@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Task Sampling
+
+Forwards only a sample of the task events to the frontend. The exact task
+counts and duration sums of a stage are in the task summary the listener
+sends with its stage updates, which covers every task.
+
+Two modes are supported:
+    rate N       forward one task in N, chosen by a hash of its taskId
+    reservoir K  forward the n-th task of a stage with probability
+                 min(1, K / n), as reservoir sampling admits it. Forwarded
+                 events cannot be taken back, so no task is evicted: a
+                 stage of n tasks forwards about K * (1 + ln(n / K)) of them
+
+The start and end of a task are always both forwarded or both dropped,
+with the same weight, even if sampling is changed while the task runs.
+Each forwarded task carries a weight, the inverse of its probability of
+being forwarded, so that frontends can scale their estimates.
+The listener can sample too (spark.sparkmonitor.taskSampleRate), one task
+in N by task index. The kernel hashes the taskId so that its choice is
+independent of the listener's, the probability of a task being forwarded
+is then the product of both and its weight the product of their weights.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import random
+
+MASK64 = (1 << 64) - 1
+
+
+def task_hash(taskId):
+    """Mix the bits of a taskId (splitmix64), consecutive ids give unrelated hashes"""
+    z = (int(taskId) + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+class StageTaskStats:
+    """Sampling state of one stage attempt"""
+
+    __slots__ = ('numStarted', 'numForwarded', 'running')
+
+    def __init__(self):
+        # Estimate of the started tasks, weighted by the listener sampling
+        self.numStarted = 0
+        self.numForwarded = 0
+        # Weight given to each running task at its start, 0 if dropped, by taskId
+        self.running = {}
+
+
+class TaskSampler:
+    """Decides which task events are forwarded to the frontend"""
+
+    def __init__(self, rate=1, reservoir=0, maxStages=1000):
+        """Constructor
+
+        rate forwards one task in rate, reservoir forwards the n-th task of
+        a stage with probability reservoir / n. Both disabled forwards all.
+        """
+        self.stages = {}
+        self.maxStages = maxStages
+        self.configure(rate, reservoir)
+
+    def configure(self, rate=1, reservoir=0):
+        if rate < 1 or reservoir < 0:
+            raise ValueError('rate must be >= 1 and reservoir >= 0')
+        self.rate = int(rate)
+        self.reservoir = int(reservoir)
+
+    @property
+    def enabled(self):
+        return self.rate > 1 or self.reservoir > 0
+
+    def stage(self, appId, stageId, stageAttemptId):
+        key = (appId, stageId, stageAttemptId)
+        stats = self.stages.get(key)
+        if stats is None:
+            if len(self.stages) >= self.maxStages:
+                self.stages.pop(next(iter(self.stages)))
+            stats = self.stages[key] = StageTaskStats()
+        return stats
+
+    def accept(self, data, appId=None):
+        """Account a task message, return its weight or 0 to drop it
+
+        The end of a task gets the weight given to its start, whatever the
+        sampling is when it ends. A task whose start was not seen is
+        forwarded only if sampling is disabled.
+        """
+        stats = self.stage(appId, data.get('stageId'), data.get('stageAttemptId'))
+        listenerWeight = data.get('sampleWeight', 1)
+        if data.get('msgtype') == 'sparkTaskStart':
+            stats.numStarted += listenerWeight
+            weight = self._weight(data, stats) if self.enabled else 1
+            stats.running[data.get('taskId')] = weight
+            if weight:
+                stats.numForwarded += 1
+            return weight * listenerWeight
+        weight = stats.running.pop(data.get('taskId'), None)
+        if weight is None:
+            weight = 0 if self.enabled else 1
+        return weight * listenerWeight
+
+    def _weight(self, data, stats):
+        if self.reservoir:
+            n = stats.numStarted
+            if n <= self.reservoir or random.random() * n < self.reservoir:
+                return max(1.0, float(n) / self.reservoir)
+            return 0
+        # Not by index, the listener samples by index
+        return self.rate if task_hash(data.get('taskId', 0)) % self.rate == 0 else 0
+
+    def on_stage_completed(self, data, appId=None):
+        """Forget the sampling state of a completed stage"""
+        self.stages.pop((appId, data.get('stageId'), data.get('stageAttemptId')), None)
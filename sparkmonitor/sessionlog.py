@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Session Log and Export
+
+The kernel keeps summaries of the jobs it monitors, not their tasks. For
+offline analysis, the listener messages of the session can be appended
+to a log on disk as they are received, one per line, and exported from
+it. The log is off by default, logging every task costs kernel CPU time
+and disk space:
+
+    import sparkmonitor
+    sparkmonitor.start_session_log()
+    # run Spark jobs
+    sparkmonitor.export('runs', format='parquet')
+    sparkmonitor.export('app.eventlog', format='eventlog')
+
+- parquet and arrow write one directory per table, applications, jobs,
+  stages, tasks and executors, partitioned by application:
+  runs/tasks/appId=local-1712/part-00000.parquet. Arrow files use the
+  Arrow IPC file format. Both need pyarrow.
+- eventlog writes the events of one application in the JSON lines format
+  of the Spark event logs, which the Spark History Server can replay.
+
+The log is read once, line by line. Tasks are written in chunks of
+chunkSize rows, so exporting millions of tasks holds one chunk in memory;
+jobs, stages and executors, far fewer, are merged in memory and written
+at the end. Only the task records the listener sent are in the log, a
+sample with task sampling, whose sampleWeight column gives the number of
+tasks each one stands for. The kernel requests the full task detail from
+the listeners while the log is open, but options set through the API or
+the CPU governor can lower it: the export warns when the stages it
+writes have no task records, or when task events were left out of the
+log past its size limit.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import atexit
+import io
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from threading import Lock
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+# Largest size of the session log, task events are no longer logged past it
+DEFAULT_MAX_BYTES = int(os.environ.get('SPARKMONITOR_SESSION_LOG_MAX_BYTES', 1024 ** 3))
+
+# Task rows written at once
+DEFAULT_CHUNK_SIZE = 65536
+
+FORMATS = ('parquet', 'arrow', 'eventlog')
+
+# Messages kept in the session log, stage updates are left out
+LOGGED_MSGTYPES = frozenset([
+    'sparkApplicationStart', 'sparkApplicationEnd', 'sparkJobStart', 'sparkJobEnd',
+    'sparkStageSubmitted', 'sparkStageCompleted', 'sparkTaskStart', 'sparkTaskEnd',
+    'sparkExecutorAdded', 'sparkExecutorRemoved', 'sparkExecutorMetrics',
+])
+
+TASK_MSGTYPES = frozenset(['sparkTaskStart', 'sparkTaskEnd'])
+
+# I/O totals of the task summaries and task metrics
+IO_FIELDS = ('inputBytes', 'inputRecords', 'outputBytes', 'outputRecords', 'shuffleReadBytes',
+             'shuffleReadRecords', 'shuffleWriteBytes', 'shuffleWriteRecords')
+
+# Metrics of the task records
+TASK_METRICS = ('shuffleReadTime', 'shuffleWriteTime', 'serializationTime', 'deserializationTime',
+                'gettingResultTime', 'executorComputingTime', 'schedulerDelay', 'resultSize',
+                'jvmGCTime', 'memoryBytesSpilled', 'diskBytesSpilled', 'peakExecutionMemory') + IO_FIELDS
+
+# Columns of the exported tables and their types, appId is the partition
+TABLES = {
+    'applications': [
+        ('appName', 'string'), ('appAttemptId', 'string'), ('sparkUser', 'string'),
+        ('startTime', 'int64'), ('endTime', 'int64'),
+    ],
+    'jobs': [
+        ('jobId', 'int64'), ('runId', 'string'), ('cellId', 'string'), ('jobGroup', 'string'),
+        ('name', 'string'), ('status', 'string'), ('submissionTime', 'int64'),
+        ('completionTime', 'int64'), ('numTasks', 'int64'), ('stageIds', 'list<int64>'),
+    ],
+    'stages': [
+        ('stageId', 'int64'), ('stageAttemptId', 'int64'), ('runId', 'string'), ('name', 'string'),
+        ('status', 'string'), ('numTasks', 'int64'), ('numCompletedTasks', 'int64'),
+        ('numFailedTasks', 'int64'), ('parentIds', 'list<int64>'), ('jobIds', 'list<int64>'),
+        ('submissionTime', 'int64'), ('completionTime', 'int64'), ('taskDurationSum', 'int64'),
+    ] + [(name, 'int64') for name in IO_FIELDS],
+    'tasks': [
+        ('stageId', 'int64'), ('stageAttemptId', 'int64'), ('taskId', 'int64'), ('index', 'int64'),
+        ('attemptNumber', 'int64'), ('taskType', 'string'), ('executorId', 'string'),
+        ('host', 'string'), ('status', 'string'), ('speculative', 'bool'), ('launchTime', 'int64'),
+        ('finishTime', 'int64'), ('errorMessage', 'string'), ('sampleWeight', 'float64'),
+    ] + [(name, 'int64') for name in TASK_METRICS],
+    'executors': [
+        ('executorId', 'string'), ('event', 'string'), ('time', 'int64'), ('host', 'string'),
+        ('numCores', 'int64'), ('totalCores', 'int64'), ('maxHeapMemory', 'int64'),
+        ('maxMemory', 'int64'), ('jvmHeapMemory', 'int64'), ('jvmOffHeapMemory', 'int64'),
+        ('onHeapExecutionMemory', 'int64'), ('offHeapExecutionMemory', 'int64'),
+        ('onHeapStorageMemory', 'int64'), ('offHeapStorageMemory', 'int64'),
+        ('minorGCTime', 'int64'), ('majorGCTime', 'int64'),
+    ],
+}
+
+
+class SessionLog:
+    """Append-only log of the listener messages of the session, one per line"""
+
+    def __init__(self, metrics, path=None, maxBytes=DEFAULT_MAX_BYTES):
+        """Constructor
+
+        Without path, the log is a temporary file removed when the kernel
+        exits. Past maxBytes, task events are no longer logged.
+        """
+        if path is None:
+            directory = tempfile.mkdtemp(prefix='sparkmonitor-')
+            path = os.path.join(directory, 'session.jsonl')
+            atexit.register(shutil.rmtree, directory, True)
+        self.path = path
+        self.file = io.open(path, 'ab')
+        self.bytes = self.file.tell()
+        self.maxBytes = maxBytes
+        self.lock = Lock()
+        self.skipped = metrics.counter(
+            'session_log_skipped', 'Task events not logged because the session log is full')
+        metrics.gauge('session_log_bytes', 'Size of the session log', fn=lambda: self.bytes)
+
+    def write(self, msg, msgtype, appId=None):
+        """Log a listener message, as received, after the application it belongs to"""
+        if msgtype not in LOGGED_MSGTYPES:
+            return
+        # Messages do not all hold their appId, json escapes the tabs of the appId
+        line = (json.dumps(appId) + '\t' + msg.replace('\n', ' ') + '\n').encode('utf-8')
+        with self.lock:
+            if self.maxBytes and self.bytes + len(line) > self.maxBytes and msgtype in TASK_MSGTYPES:
+                self.skipped.inc()
+                return
+            self.file.write(line)
+            self.bytes += len(line)
+
+    def messages(self):
+        """Yield the logged messages, up to those logged when called"""
+        with self.lock:
+            self.file.flush()
+            size = os.path.getsize(self.path)
+        with io.open(self.path, 'rb') as f:
+            read = 0
+            for line in f:
+                read += len(line)
+                if read > size:
+                    break
+                appId, _, msg = line.decode('utf-8').partition('\t')
+                try:
+                    data = json.loads(msg)
+                    appId = json.loads(appId)
+                except ValueError:
+                    continue
+                if appId:
+                    data['appId'] = appId
+                yield data
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def _null(value):
+    """None for the "null" strings the listener sends for missing values"""
+    return None if value == 'null' else value
+
+
+def _time(value):
+    """None for the -1 or 0 times of events which did not happen"""
+    return value if isinstance(value, (int, float)) and value > 0 else None
+
+
+def application_row(app, data):
+    if data['msgtype'] == 'sparkApplicationStart':
+        app.update({
+            'appName': data.get('appName'),
+            'appAttemptId': _null(data.get('appAttemptId')),
+            'sparkUser': data.get('sparkUser'),
+            'startTime': _time(data.get('startTime')),
+        })
+    else:
+        app['endTime'] = _time(data.get('endTime'))
+
+
+def job_row(job, data, cellOf=None):
+    if data['msgtype'] == 'sparkJobStart':
+        runId = _null(data.get('runId'))
+        job.update({
+            'jobId': data.get('jobId'),
+            'runId': runId,
+            'cellId': cellOf(runId) if cellOf and runId else None,
+            'jobGroup': _null(data.get('jobGroup')),
+            'name': _null(data.get('name')),
+            'status': data.get('status'),
+            'submissionTime': _time(data.get('submissionTime')),
+            'numTasks': data.get('numTasks'),
+            'stageIds': data.get('stageIds'),
+        })
+    else:
+        job['jobId'] = data.get('jobId')
+        job['status'] = data.get('status')
+        job['completionTime'] = _time(data.get('completionTime'))
+
+
+def stage_row(stage, data):
+    for name in ('stageId', 'stageAttemptId', 'name', 'numTasks', 'parentIds', 'jobIds'):
+        if data.get(name) is not None:
+            stage[name] = data[name]
+    stage['submissionTime'] = _time(data.get('submissionTime')) or stage.get('submissionTime')
+    if data['msgtype'] == 'sparkStageSubmitted':
+        stage['runId'] = _null(data.get('runId'))
+        stage['status'] = 'RUNNING'
+        return
+    stage.update({
+        'status': data.get('status'),
+        'completionTime': _time(data.get('completionTime')),
+        'numCompletedTasks': data.get('numCompletedTasks'),
+        'numFailedTasks': data.get('numFailedTasks'),
+        'taskDurationSum': data.get('taskDurationSum'),
+    })
+    totals = (data.get('taskSummary') or {}).get('io') or {}
+    for name in IO_FIELDS:
+        stage[name] = totals.get(name)
+
+
+def task_row(data):
+    row = dict((name, data.get(name)) for name in (
+        'stageId', 'stageAttemptId', 'taskId', 'index', 'attemptNumber', 'taskType',
+        'executorId', 'host', 'status', 'speculative', 'launchTime', 'errorMessage'))
+    row['finishTime'] = _time(data.get('finishTime'))
+    row['sampleWeight'] = float(data.get('sampleWeight', 1))
+    metrics = data.get('metrics') or {}
+    for name in TASK_METRICS:
+        row[name] = metrics.get(name)
+    return row
+
+
+def executor_row(data):
+    row = dict((name, data.get(name)) for name, _ in TABLES['executors'])
+    row['event'] = {
+        'sparkExecutorAdded': 'added',
+        'sparkExecutorRemoved': 'removed',
+        'sparkExecutorMetrics': 'metrics',
+    }[data['msgtype']]
+    return row
+
+
+def _arrow_type(pa, name):
+    if name.startswith('list<'):
+        return pa.list_(_arrow_type(pa, name[5:-1]))
+    return {'string': pa.string(), 'int64': pa.int64(), 'float64': pa.float64(),
+            'bool': pa.bool_()}[name]
+
+
+def _int(value):
+    """Times and sizes are integers, some listeners send them as floats"""
+    return int(value) if isinstance(value, float) else value
+
+
+class TableWriter:
+    """Writes the rows of one table, partitioned by application, as Parquet or Arrow files"""
+
+    def __init__(self, path, table, format):
+        """Constructor"""
+        import pyarrow as pa
+        self.pa = pa
+        self.path = os.path.join(path, table)
+        self.format = format
+        self.columns = TABLES[table]
+        self.schema = pa.schema([(name, _arrow_type(pa, type)) for name, type in self.columns])
+        self.writers = {}
+        self.rows = 0
+
+    def write(self, appId, rows):
+        """Write a chunk of rows of an application"""
+        if not rows:
+            return
+        pa = self.pa
+        arrays = []
+        for name, type in self.columns:
+            values = [row.get(name) for row in rows]
+            if type == 'int64':
+                values = [_int(value) for value in values]
+            arrays.append(pa.array(values, type=self.schema.field(name).type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        writer = self.writers.get(appId)
+        if writer is None:
+            writer = self.writers[appId] = self._open(appId)
+        # A row group of the Parquet file or a record batch of the Arrow file per chunk
+        writer.write_table(table)
+        self.rows += len(rows)
+
+    def _open(self, appId):
+        directory = os.path.join(self.path, 'appId=' + (quote(appId, safe='') if appId
+                                                        else '__HIVE_DEFAULT_PARTITION__'))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(os.path.join(directory, 'part-00000.parquet'), self.schema)
+        return self.pa.ipc.new_file(os.path.join(directory, 'part-00000.arrow'), self.schema)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def export_tables(messages, path, format='parquet', cellOf=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Write the tables of the logged messages, returns the number of rows of each table"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError('Exporting to %s needs pyarrow, install it with pip install pyarrow' % format)
+    applications = {}
+    jobs = {}
+    stages = {}
+    taskChunks = {}
+    executorChunks = {}
+    writers = dict((table, TableWriter(path, table, format)) for table in TABLES)
+    try:
+        for data in messages:
+            msgtype = data.get('msgtype')
+            appId = data.get('appId') or ''
+            if msgtype == 'sparkTaskEnd':
+                chunk = taskChunks.setdefault(appId, [])
+                chunk.append(task_row(data))
+                if len(chunk) >= chunkSize:
+                    writers['tasks'].write(appId, chunk)
+                    taskChunks[appId] = []
+            elif msgtype in ('sparkJobStart', 'sparkJobEnd'):
+                job_row(jobs.setdefault((appId, data.get('jobId')), {}), data, cellOf)
+            elif msgtype in ('sparkStageSubmitted', 'sparkStageCompleted'):
+                key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+                stage_row(stages.setdefault(key, {}), data)
+            elif msgtype in ('sparkExecutorAdded', 'sparkExecutorRemoved', 'sparkExecutorMetrics'):
+                chunk = executorChunks.setdefault(appId, [])
+                chunk.append(executor_row(data))
+                if len(chunk) >= chunkSize:
+                    writers['executors'].write(appId, chunk)
+                    executorChunks[appId] = []
+            elif msgtype in ('sparkApplicationStart', 'sparkApplicationEnd'):
+                application_row(applications.setdefault(appId, {}), data)
+        for table, chunks in (('tasks', taskChunks), ('executors', executorChunks)):
+            for appId, chunk in chunks.items():
+                writers[table].write(appId, chunk)
+        for table, rows in (('applications', applications), ('jobs', jobs), ('stages', stages)):
+            byApp = {}
+            for key, row in rows.items():
+                byApp.setdefault(key[0] if isinstance(key, tuple) else key, []).append(row)
+            for appId, chunk in byApp.items():
+                writers[table].write(appId, chunk)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return dict((table, writer.rows) for table, writer in writers.items())
+
+
+def _stage_info(data, stageId=None, info=None):
+    """Stage Info of the Spark event log, from a stage message or the stage infos of a job"""
+    info = info if info is not None else data
+    stage = {
+        'Stage ID': stageId if stageId is not None else data.get('stageId'),
+        'Stage Attempt ID': info.get('stageAttemptId', info.get('attemptId', 0)),
+        'Stage Name': info.get('name'),
+        'Number of Tasks': info.get('numTasks'),
+        'RDD Info': [],
+        'Parent IDs': info.get('parentIds') or [],
+        'Details': '',
+        'Accumulables': [],
+    }
+    if _time(info.get('submissionTime')):
+        stage['Submission Time'] = info['submissionTime']
+    if _time(info.get('completionTime')):
+        stage['Completion Time'] = info['completionTime']
+    if info.get('status') == 'FAILED':
+        stage['Failure Reason'] = 'Stage failed'
+    return stage
+
+
+def _task_info(data):
+    return {
+        'Task ID': data.get('taskId'),
+        'Index': data.get('index'),
+        'Attempt': data.get('attemptNumber'),
+        'Launch Time': data.get('launchTime'),
+        'Executor ID': data.get('executorId'),
+        'Host': data.get('host'),
+        'Locality': 'ANY',
+        'Speculative': bool(data.get('speculative')),
+        'Getting Result Time': 0,
+        'Finish Time': _time(data.get('finishTime')) or 0,
+        'Failed': data.get('status') == 'FAILED',
+        'Killed': data.get('status') == 'KILLED',
+        'Accumulables': [],
+    }
+
+
+def _task_metrics(metrics):
+    shuffleReadTime = metrics.get('shuffleReadTime', 0)
+    shuffleWriteTime = metrics.get('shuffleWriteTime', 0)
+    return {
+        'Executor Deserialize Time': metrics.get('deserializationTime', 0),
+        'Executor Deserialize CPU Time': 0,
+        'Executor Run Time': (metrics.get('executorComputingTime', 0) +
+                              shuffleReadTime + shuffleWriteTime),
+        'Executor CPU Time': 0,
+        'Peak Execution Memory': metrics.get('peakExecutionMemory', 0),
+        'Result Size': metrics.get('resultSize', 0),
+        'JVM GC Time': metrics.get('jvmGCTime', 0),
+        'Result Serialization Time': metrics.get('serializationTime', 0),
+        'Memory Bytes Spilled': metrics.get('memoryBytesSpilled', 0),
+        'Disk Bytes Spilled': metrics.get('diskBytesSpilled', 0),
+        'Shuffle Read Metrics': {
+            'Remote Blocks Fetched': 0,
+            'Local Blocks Fetched': 0,
+            'Fetch Wait Time': shuffleReadTime,
+            'Remote Bytes Read': metrics.get('shuffleReadBytes', 0),
+            'Remote Bytes Read To Disk': 0,
+            'Local Bytes Read': 0,
+            'Total Records Read': metrics.get('shuffleReadRecords', 0),
+        },
+        'Shuffle Write Metrics': {
+            'Shuffle Bytes Written': metrics.get('shuffleWriteBytes', 0),
+            # In ns in the event logs
+            'Shuffle Write Time': shuffleWriteTime * 1000000,
+            'Shuffle Records Written': metrics.get('shuffleWriteRecords', 0),
+        },
+        'Input Metrics': {
+            'Bytes Read': metrics.get('inputBytes', 0),
+            'Records Read': metrics.get('inputRecords', 0),
+        },
+        'Output Metrics': {
+            'Bytes Written': metrics.get('outputBytes', 0),
+            'Records Written': metrics.get('outputRecords', 0),
+        },
+        'Updated Blocks': [],
+    }
+
+
+def _task_end_reason(data):
+    status = data.get('status')
+    if status == 'KILLED':
+        return {'Reason': 'TaskKilled', 'Kill Reason': data.get('errorMessage') or 'killed',
+                'Accumulator Updates': []}
+    if status == 'FAILED':
+        return {'Reason': 'ExceptionFailure', 'Class Name': '',
+                'Description': data.get('errorMessage') or '', 'Stack Trace': [],
+                'Full Stack Trace': data.get('errorMessage') or '', 'Accumulator Updates': []}
+    return {'Reason': 'Success'}
+
+
+def event_log_event(data):
+    """The Spark event log event of a listener message, None for those without one"""
+    msgtype = data.get('msgtype')
+    if msgtype == 'sparkApplicationStart':
+        event = {
+            'Event': 'SparkListenerApplicationStart',
+            'App Name': data.get('appName'),
+            'App ID': data.get('appId'),
+            'Timestamp': data.get('startTime'),
+            'User': data.get('sparkUser'),
+        }
+        if _null(data.get('appAttemptId')):
+            event['App Attempt ID'] = data['appAttemptId']
+        return event
+    if msgtype == 'sparkApplicationEnd':
+        return {'Event': 'SparkListenerApplicationEnd', 'Timestamp': data.get('endTime')}
+    if msgtype == 'sparkJobStart':
+        stageInfos = data.get('stageInfos') or {}
+        properties = {}
+        if _null(data.get('jobGroup')):
+            properties['spark.jobGroup.id'] = data['jobGroup']
+        if _null(data.get('runId')):
+            properties['sparkmonitor.runId'] = data['runId']
+        return {
+            'Event': 'SparkListenerJobStart',
+            'Job ID': data.get('jobId'),
+            'Submission Time': data.get('submissionTime'),
+            'Stage Infos': [_stage_info(data, int(stageId), info)
+                            for stageId, info in sorted(stageInfos.items(), key=lambda i: int(i[0]))],
+            'Stage IDs': data.get('stageIds') or [],
+            'Properties': properties,
+        }
+    if msgtype == 'sparkJobEnd':
+        if data.get('status') == 'SUCCEEDED':
+            result = {'Result': 'JobSucceeded'}
+        else:
+            result = {'Result': 'JobFailed',
+                      'Exception': {'Message': 'Job %s' % data.get('status'), 'Stack Trace': []}}
+        return {
+            'Event': 'SparkListenerJobEnd',
+            'Job ID': data.get('jobId'),
+            'Completion Time': data.get('completionTime'),
+            'Job Result': result,
+        }
+    if msgtype == 'sparkStageSubmitted':
+        return {'Event': 'SparkListenerStageSubmitted', 'Stage Info': _stage_info(data),
+                'Properties': {}}
+    if msgtype == 'sparkStageCompleted':
+        return {'Event': 'SparkListenerStageCompleted', 'Stage Info': _stage_info(data)}
+    if msgtype == 'sparkTaskStart':
+        return {
+            'Event': 'SparkListenerTaskStart',
+            'Stage ID': data.get('stageId'),
+            'Stage Attempt ID': data.get('stageAttemptId'),
+            'Task Info': _task_info(data),
+        }
+    if msgtype == 'sparkTaskEnd':
+        return {
+            'Event': 'SparkListenerTaskEnd',
+            'Stage ID': data.get('stageId'),
+            'Stage Attempt ID': data.get('stageAttemptId'),
+            'Task Type': data.get('taskType'),
+            'Task End Reason': _task_end_reason(data),
+            'Task Info': _task_info(data),
+            'Task Metrics': _task_metrics(data.get('metrics') or {}),
+        }
+    if msgtype == 'sparkExecutorAdded':
+        return {
+            'Event': 'SparkListenerExecutorAdded',
+            'Timestamp': data.get('time'),
+            'Executor ID': data.get('executorId'),
+            'Executor Info': {'Host': data.get('host'), 'Total Cores': data.get('numCores'),
+                              'Log Urls': {}},
+        }
+    if msgtype == 'sparkExecutorRemoved':
+        return {
+            'Event': 'SparkListenerExecutorRemoved',
+            'Timestamp': data.get('time'),
+            'Executor ID': data.get('executorId'),
+            'Removed Reason': '',
+        }
+    return None
+
+
+def _check_tasks(log, numStages, numTasks):
+    """Warn when the exported stages have no task records or task events were not logged"""
+    if numStages and not numTasks:
+        warnings.warn('The session log has no task records for the exported stages, the '
+                      'listener only sends them with the full task detail')
+    if log.skipped.value:
+        warnings.warn('%d task events were not logged, the session log reached its size limit '
+                      '(SPARKMONITOR_SESSION_LOG_MAX_BYTES)' % log.skipped.value)
+
+
+def export_event_log(log, path, appId=None):
+    """Write the events of an application as a Spark event log, the last one started by default
+
+    Returns the number of events written.
+    """
+    if appId is None:
+        for data in log.messages():
+            if data.get('msgtype') == 'sparkApplicationStart':
+                appId = data.get('appId')
+    count = 0
+    numStages = 0
+    numTasks = 0
+    with io.open(path, 'w', encoding='utf-8') as f:
+        for data in log.messages():
+            if appId is not None and data.get('appId') != appId:
+                continue
+            event = event_log_event(data)
+            if event is not None:
+                f.write(json.dumps(event) + '\n')
+                count += 1
+                msgtype = data.get('msgtype')
+                numStages += msgtype == 'sparkStageCompleted'
+                numTasks += msgtype in TASK_MSGTYPES
+    _check_tasks(log, numStages, numTasks)
+    return count
+
+
+def export_session(log, path, format='parquet', appId=None, cellOf=None,
+                   chunkSize=DEFAULT_CHUNK_SIZE):
+    """Export the logged messages, see the module documentation"""
+    if format not in FORMATS:
+        raise ValueError('Unknown export format %s, expected one of %s' % (format, ', '.join(FORMATS)))
+    if format == 'eventlog':
+        return {'events': export_event_log(log, path, appId)}
+    messages = log.messages()
+    if appId is not None:
+        messages = (data for data in messages if data.get('appId') == appId)
+    rows = export_tables(messages, path, format, cellOf, chunkSize)
+    _check_tasks(log, rows['stages'], rows['tasks'])
+    return rows
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Runtime Statistics
+
+Counters, gauges and histograms measuring the kernel extension itself.
+Updates are plain attribute increments without locking so that they
+are cheap enough to stay enabled; the GIL keeps them consistent enough
+for monitoring purposes.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import bisect
+import logging
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+# Histogram bucket upper bounds in seconds, from 10us to 10s
+DEFAULT_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3,
+                   1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# Bucket upper bounds in seconds for end-to-end latencies, from 1ms to 60s
+LATENCY_BUCKETS = (1e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The Spark timestamp (in ms) each listener message refers to
+EVENT_TIME_FIELDS = {
+    'sparkApplicationStart': 'startTime',
+    'sparkApplicationEnd': 'endTime',
+    'sparkJobStart': 'submissionTime',
+    'sparkJobEnd': 'completionTime',
+    'sparkStageSubmitted': 'submissionTime',
+    'sparkStageCompleted': 'completionTime',
+    'sparkTaskStart': 'launchTime',
+    'sparkTaskEnd': 'finishTime',
+    'sparkExecutorAdded': 'time',
+    'sparkExecutorRemoved': 'time',
+}
+
+
+class Counter:
+    """A monotonically increasing value"""
+
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """A value that can go up and down
+
+    If a function is given it is called when the gauge is read,
+    so that nothing is paid on the hot path.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, description, fn=None):
+        self.name = name
+        self.description = description
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        if self.fn is None:
+            self.value = 0
+
+    def snapshot(self):
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return 0
+        return self.value
+
+
+class Histogram:
+    """A distribution of observed values in fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        # The last bucket holds values above the largest bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class RollingHistogram:
+    """A histogram over the last one to two windows of observations
+
+    Two histograms are kept and rotated every `window` seconds, so old
+    observations age out in constant time and memory.
+    """
+
+    kind = 'summary'
+
+    def __init__(self, name, description, window=60.0, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.window = window
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def _rotate(self, now):
+        if now - self.rotated > self.window:
+            self.previous = self.current
+            self.current = Histogram(self.name, self.description, self.buckets)
+            self.rotated = now
+
+    def observe(self, value):
+        self._rotate(time.time())
+        self.current.observe(value)
+
+    def reset(self):
+        self.current = Histogram(self.name, self.description, self.buckets)
+        self.previous = Histogram(self.name, self.description, self.buckets)
+        self.rotated = time.time()
+
+    def merged(self):
+        """Return a histogram combining both windows"""
+        self._rotate(time.time())
+        merged = Histogram(self.name, self.description, self.buckets)
+        for h in (self.previous, self.current):
+            merged.counts = [a + b for a, b in zip(merged.counts, h.counts)]
+            merged.count += h.count
+            merged.sum += h.sum
+            merged.max = max(merged.max, h.max)
+        return merged
+
+    def snapshot(self):
+        return self.merged().snapshot()
+
+
+class LatencyTracker:
+    """Rolling latency histograms for each step of the event pipeline
+
+    The steps are Spark event time -> listener emit -> kernel receive ->
+    kernel forward -> frontend render. Listener and kernel run on the same
+    host, the render latency uses the browser clock and is only meaningful
+    when the browser clock is reasonably in sync with the kernel host.
+    """
+
+    def __init__(self, metrics, window=60.0):
+        self.spark_to_listener = metrics.rolling_histogram(
+            'latency_spark_to_listener', 'Spark event time to listener emit', window)
+        self.listener_to_kernel = metrics.rolling_histogram(
+            'latency_listener_to_kernel', 'Listener emit to kernel receive', window)
+        self.kernel_forward = metrics.rolling_histogram(
+            'latency_kernel_forward', 'Kernel receive to frontend send', window)
+        self.kernel_to_render = metrics.rolling_histogram(
+            'latency_kernel_to_render', 'Kernel send to frontend render', window)
+
+    def on_listener_message(self, data, recvTime):
+        """Record the latencies of a parsed listener message, times in ms"""
+        emitTime = data.get('emitTime')
+        if not emitTime:
+            return  # Listener without emit timestamps
+        field = EVENT_TIME_FIELDS.get(data.get('msgtype'))
+        eventTime = data.get(field) if field else None
+        if isinstance(eventTime, (int, float)) and eventTime > 0:
+            self.spark_to_listener.observe(max(emitTime - eventTime, 0) / 1000.0)
+        self.listener_to_kernel.observe(max(recvTime - emitTime, 0) / 1000.0)
+
+    def on_forward(self, recvTime, forwardTime):
+        self.kernel_forward.observe(max(forwardTime - recvTime, 0) / 1000.0)
+
+    def on_render_report(self, samples):
+        """Record render latencies in ms reported by a frontend"""
+        for sample in samples:
+            if isinstance(sample, (int, float)):
+                self.kernel_to_render.observe(max(sample, 0) / 1000.0)
+
+
+class Metrics:
+    """Registry of all the metrics of a monitor"""
+
+    def __init__(self, prefix='sparkmonitor'):
+        self.prefix = prefix
+        self.metrics = OrderedDict()
+        self.started = time.time()
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description, fn=None):
+        return self._add(Gauge(name, description, fn))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, description, buckets))
+
+    def rolling_histogram(self, name, description, window=60.0, buckets=LATENCY_BUCKETS):
+        return self._add(RollingHistogram(name, description, window, buckets))
+
+    def reset(self):
+        """Reset all counters and histograms"""
+        for metric in self.metrics.values():
+            metric.reset()
+        self.started = time.time()
+
+    def snapshot(self):
+        """Return the current value of every metric as a dict"""
+        snap = OrderedDict()
+        snap['uptime'] = time.time() - self.started
+        for name, metric in self.metrics.items():
+            snap[name] = metric.snapshot()
+        return snap
+
+    def format_table(self):
+        """Return a human readable summary of all metrics"""
+        lines = ['SparkMonitor statistics (%.0fs since reset)'
+                 % (time.time() - self.started)]
+        for name, metric in self.metrics.items():
+            value = metric.snapshot()
+            if metric.kind in ('histogram', 'summary'):
+                value = ('count=%d mean=%.3gms p50<=%.3gms p99<=%.3gms max=%.3gms'
+                         % (value['count'], value['mean'] * 1e3, value['p50'] * 1e3,
+                            value['p99'] * 1e3, value['max'] * 1e3))
+            lines.append('  %-32s %s' % (name, value))
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        out = []
+        for name, metric in self.metrics.items():
+            full = '%s_%s' % (self.prefix, name)
+            out.append('# HELP %s %s' % (full, metric.description))
+            out.append('# TYPE %s %s' % (full, metric.kind))
+            if metric.kind == 'histogram':
+                cumulative = 0
+                for bound, n in zip(metric.buckets, metric.counts):
+                    cumulative += n
+                    out.append('%s_bucket{le="%g"} %d' % (full, bound, cumulative))
+                out.append('%s_bucket{le="+Inf"} %d' % (full, metric.count))
+                out.append('%s_sum %r' % (full, metric.sum))
+                out.append('%s_count %d' % (full, metric.count))
+            elif metric.kind == 'summary':
+                merged = metric.merged()
+                for q in (0.5, 0.9, 0.99):
+                    out.append('%s{quantile="%g"} %r' % (full, q, merged.quantile(q)))
+                out.append('%s_sum %r' % (full, merged.sum))
+                out.append('%s_count %d' % (full, merged.count))
+            else:
+                out.append('%s %s' % (full, metric.snapshot()))
+        return '\n'.join(out) + '\n'
+
+
+class PrometheusServer(Thread):
+    """Serves the metrics of a registry over HTTP on localhost only"""
+
+    def __init__(self, metrics, port=0):
+        """Constructor, binds the server socket."""
+        Thread.__init__(self)
+        self.daemon = True
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('Prometheus endpoint: ' + format, *args)
+
+        self.server = HTTPServer(('127.0.0.1', port), Handler)
+        self.port = self.server.server_address[1]
+
+    def run(self):
+        logger.info('Prometheus endpoint listening on port %s', self.port)
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
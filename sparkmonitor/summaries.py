@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Stage Task Summaries
+
+The listener keeps a summary of the ended tasks of each stage: mergeable
+histograms with logarithmic bins of the task duration, GC time, shuffle
+read bytes, spilled bytes and result size, and task counts per executor.
+Summaries are sent with the stage updates, with
+spark.sparkmonitor.taskDetail=aggregate they replace the task records.
+
+A value v is counted in bin ceil(log(v) / log(gamma)), so quantiles have
+a relative error under (gamma - 1) / 2. Histograms of several stages are
+merged by adding their bins.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import math
+
+from .routing import BoundedDict
+
+SUMMARY_METRICS = ('duration', 'jvmGCTime', 'shuffleReadBytes', 'bytesSpilled', 'resultSize')
+
+
+class LogHistogram:
+    """Histogram with logarithmic bins, as sent by the listener"""
+
+    def __init__(self, gamma=1.1):
+        """Constructor"""
+        self.gamma = gamma
+        self.count = 0
+        self.sum = 0.0
+        self.min = 0.0
+        self.max = 0.0
+        self.zeros = 0
+        self.bins = {}
+
+    @classmethod
+    def from_json(cls, data):
+        hist = cls(data.get('gamma', 1.1))
+        hist.count = data.get('count', 0)
+        hist.sum = data.get('sum', 0.0)
+        hist.min = data.get('min', 0.0)
+        hist.max = data.get('max', 0.0)
+        hist.zeros = data.get('zeros', 0)
+        offset = data.get('offset', 0)
+        hist.bins = {offset + i: n for i, n in enumerate(data.get('bins', [])) if n}
+        return hist
+
+    def merge(self, other):
+        """Add the values of another histogram with the same gamma"""
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge histograms with different bins')
+        if other.count:
+            self.min = min(self.min, other.min) if self.count else other.min
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.sum += other.sum
+        self.zeros += other.zeros
+        for bin, n in other.bins.items():
+            self.bins[bin] = self.bins.get(bin, 0) + n
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q):
+        """Estimate the q-quantile, q between 0 and 1"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for bin in sorted(self.bins):
+            seen += self.bins[bin]
+            if seen > rank:
+                # Middle of the bin (gamma^(bin-1), gamma^bin]
+                value = 2 * math.pow(self.gamma, bin) / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+class StageSummaries:
+    """Latest task summary of each stage attempt"""
+
+    def __init__(self, maxsize=1000):
+        """Constructor
+
+        maxsize bounds the number of stage attempts kept.
+        """
+        self.stages = BoundedDict(maxsize)
+
+    def update(self, data, appId=None):
+        """Keep the summary of a sparkStageActive/sparkStageCompleted message"""
+        summary = data.get('taskSummary')
+        if summary:
+            key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+            self.stages[key] = summary
+
+    def get(self, stageId, appId=None, attemptId=None):
+        """Return the decoded summary of a stage, of its last attempt by default
+
+        Histograms are returned as LogHistogram objects, executors as a dict
+        of task counts by executor id.
+        """
+        keys = [key for key in self.stages
+                if key[1] == stageId and (appId is None or key[0] == appId) and
+                (attemptId is None or key[2] == attemptId)]
+        if not keys:
+            return None
+        summary = self.stages[max(keys, key=lambda key: key[2])]
+        result = {name: LogHistogram.from_json(summary[name])
+                  for name in SUMMARY_METRICS if name in summary}
+        result['executors'] = summary.get('executors', {})
+        result['io'] = summary.get('io', {})
+        return result
+
+    def merged(self, stageIds, appId=None):
+        """Merge the summaries of several stages, e.g. those of a job"""
+        result = {name: LogHistogram() for name in SUMMARY_METRICS}
+        executors = {}
+        for stageId in stageIds:
+            summary = self.get(stageId, appId)
+            if summary is None:
+                continue
+            for name in SUMMARY_METRICS:
+                if name in summary:
+                    result[name].merge(summary[name])
+            for executorId, counts in summary['executors'].items():
+                total = executors.setdefault(executorId, {})
+                for field, value in counts.items():
+                    total[field] = total.get(field, 0) + value
+        result['executors'] = executors
+        return result
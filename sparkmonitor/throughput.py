@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Stage Throughput
+
+The task summary of a stage holds the bytes and records its ended tasks
+read from the input and the shuffle and wrote to the output and the
+shuffle, exact whatever the task detail, and the bytes read and written
+by each executor. From them and the times of the stage, the throughput
+of the stage is
+
+- per second of the stage, from its submission to its completion or the
+  last update, which tells what the stage achieved,
+- per task-second, the sum of the durations of its tasks, which tells
+  how fast each task moved data, so I/O-bound stages show low rates
+  whatever their parallelism,
+
+and the throughput of each executor per task-second of its tasks, which
+points out slow disks or network links.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from .routing import BoundedDict
+
+# Kinds of I/O of the task summaries, with their bytes and records fields
+IO_KINDS = ('input', 'output', 'shuffleRead', 'shuffleWrite')
+
+
+def stage_throughput(data, submissionTime=None):
+    """Throughput of a sparkStageActive/sparkStageCompleted message, None without I/O summary"""
+    summary = data.get('taskSummary') or {}
+    io = summary.get('io')
+    if not io:
+        return None
+    submissionTime = data.get('submissionTime') or submissionTime
+    endTime = data.get('completionTime') if data.get('msgtype') == 'sparkStageCompleted' else None
+    endTime = endTime if endTime and endTime > 0 else data.get('emitTime')
+    elapsed = (endTime - submissionTime) / 1000.0 if submissionTime and endTime else None
+    taskSeconds = (summary.get('duration') or {}).get('sum', 0) / 1000.0
+    throughput = {
+        'elapsed': elapsed,
+        'taskSeconds': taskSeconds,
+        'executors': {},
+    }
+    for kind in IO_KINDS:
+        nbytes = io.get(kind + 'Bytes', 0)
+        records = io.get(kind + 'Records', 0)
+        throughput[kind] = {
+            'bytes': nbytes,
+            'records': records,
+            'bytesPerSecond': nbytes / elapsed if elapsed else None,
+            'recordsPerSecond': records / elapsed if elapsed else None,
+            'bytesPerTaskSecond': nbytes / taskSeconds if taskSeconds else None,
+        }
+    for executorId, counts in (summary.get('executors') or {}).items():
+        seconds = counts.get('durationSum', 0) / 1000.0
+        moved = counts.get('bytesRead', 0) + counts.get('bytesWritten', 0)
+        throughput['executors'][executorId] = {
+            'taskSeconds': seconds,
+            'bytesRead': counts.get('bytesRead', 0),
+            'bytesWritten': counts.get('bytesWritten', 0),
+            'bytesPerTaskSecond': moved / seconds if seconds else None,
+        }
+    return throughput
+
+
+class StageThroughput:
+    """Throughput of each stage attempt, computed from its task summary"""
+
+    def __init__(self, maxsize=1000):
+        """Constructor"""
+        self.submissionTimes = BoundedDict(maxsize)
+        self.stages = BoundedDict(maxsize)
+
+    def on_message(self, data, appId=None):
+        """Account a stage message, returns the throughput of the stage if known"""
+        msgtype = data.get('msgtype')
+        key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+        if msgtype == 'sparkStageSubmitted':
+            self.submissionTimes[key] = data.get('submissionTime')
+            return None
+        if msgtype not in ('sparkStageActive', 'sparkStageCompleted'):
+            return None
+        throughput = stage_throughput(data, self.submissionTimes.get(key))
+        if throughput is None:
+            return None
+        self.stages[key] = throughput
+        if msgtype == 'sparkStageCompleted':
+            self.submissionTimes.pop(key, None)
+        return throughput
+
+    def get(self, stageId, appId=None, attemptId=None):
+        """Return the throughput of a stage, of its last attempt by default"""
+        keys = [key for key in self.stages
+                if key[1] == stageId and (appId is None or key[0] == appId) and
+                (attemptId is None or key[2] == attemptId)]
+        if not keys:
+            return None
+        return self.stages[max(keys, key=lambda key: key[2])]
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Trace Spans
+
+Turns the listener events into OpenTelemetry spans, nested as
+
+    cell execution > job > stage > task
+
+with the metrics of each as attributes, so that notebook Spark runs show
+in tracing tools. A cell execution is a trace, its id derived from the run
+id; jobs not started from a cell are the root of their own trace. Task
+spans are only built from the task end events, for a sampled fraction of
+them.
+
+Spans are built on the socket thread and put on a bounded queue, an
+exporter thread writes them in batches. When the queue is full, spans are
+dropped and counted rather than slowing down the socket thread. Batches
+are written in the OTLP JSON encoding, as the body of an
+ExportTraceServiceRequest:
+
+- FileSpanExporter appends one request per line to a file, rotated when
+  it grows too large, as the OpenTelemetry collector file exporter does,
+- HttpSpanExporter posts each request to an OTLP/HTTP endpoint, usually
+  http://localhost:4318/v1/traces of a local collector.
+
+Any object with export(request) and close() methods can be used instead.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import random
+import time
+from threading import Lock, Thread
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:
+    from Queue import Empty, Full, Queue
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+
+from ._version import __version__
+from .routing import BoundedDict
+
+logger = logging.getLogger('tornado.sparkmonitor.kernel')
+
+# Largest number of spans waiting for the exporter
+MAX_QUEUED_SPANS = 20000
+
+# Largest number of spans in one export request
+MAX_BATCH_SPANS = 512
+
+# Maximum time in seconds spans wait to be exported
+MAX_BATCH_DELAY = 2.0
+
+# Size in bytes at which the span file is rotated, and rotated files kept
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Task metrics exported as attributes of the task spans
+TASK_METRICS = ('executorComputingTime', 'schedulerDelay', 'deserializationTime',
+                'shuffleReadTime', 'shuffleWriteTime', 'serializationTime',
+                'gettingResultTime', 'jvmGCTime', 'resultSize', 'memoryBytesSpilled',
+                'diskBytesSpilled', 'peakExecutionMemory')
+
+# Task summaries of a completed stage whose sums are exported as attributes
+STAGE_SUMMARIES = ('jvmGCTime', 'shuffleReadBytes', 'bytesSpilled', 'resultSize')
+
+
+def new_span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+def new_trace_id():
+    return '%032x' % random.getrandbits(128)
+
+
+def attribute(key, value):
+    """An OTLP JSON attribute, 64 bit integers are encoded as strings"""
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': '%s' % (value,)}}
+
+
+def nanos(ms):
+    return str(int(ms * 1000000))
+
+
+class Span:
+    """A span being built from the listener events"""
+
+    __slots__ = ('traceId', 'spanId', 'parentSpanId', 'name', 'startTime',
+                 'attributes', 'error')
+
+    def __init__(self, traceId, name, startTime, parentSpanId=None):
+        """Constructor, times are in ms"""
+        self.traceId = traceId
+        self.spanId = new_span_id()
+        self.parentSpanId = parentSpanId
+        self.name = name
+        self.startTime = startTime
+        self.attributes = {}
+        self.error = None
+
+    def to_otlp(self, endTime):
+        span = {
+            'traceId': self.traceId,
+            'spanId': self.spanId,
+            'name': self.name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': nanos(self.startTime),
+            'endTimeUnixNano': nanos(max(endTime, self.startTime)),
+            'attributes': [attribute(key, value) for key, value in self.attributes.items()
+                           if value is not None],
+            'status': {'code': STATUS_ERROR, 'message': self.error}
+                      if self.error is not None else {'code': STATUS_OK},
+        }
+        if self.parentSpanId:
+            span['parentSpanId'] = self.parentSpanId
+        return span
+
+
+class FileSpanExporter:
+    """Appends OTLP JSON export requests to a file, one per line"""
+
+    def __init__(self, path, maxBytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        """Constructor
+
+        When the file exceeds maxBytes it is renamed path.1, the previous
+        path.1 becomes path.2 and so on, up to backups files.
+        """
+        self.path = os.path.expanduser(path)
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.file = None
+
+    def _open(self):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.file = open(self.path, 'a')
+        return self.file
+
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self.path, n)):
+                os.replace('%s.%d' % (self.path, n), '%s.%d' % (self.path, n + 1))
+        if self.backups:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+    def export(self, request):
+        f = self._open()
+        f.write(json.dumps(request, separators=(',', ':')) + '\n')
+        f.flush()
+        if self.maxBytes and f.tell() >= self.maxBytes:
+            self._rotate()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class HttpSpanExporter:
+    """Posts OTLP JSON export requests to an OTLP/HTTP endpoint"""
+
+    def __init__(self, endpoint, timeout=5.0):
+        """Constructor"""
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, request):
+        body = json.dumps(request, separators=(',', ':')).encode('utf-8')
+        urlopen(Request(self.endpoint, body, {'Content-Type': 'application/json'}),
+                timeout=self.timeout).close()
+
+    def close(self):
+        pass
+
+
+def span_exporter(target):
+    """Exporter of a file path or http(s) endpoint"""
+    if target.startswith(('http://', 'https://')):
+        return HttpSpanExporter(target)
+    return FileSpanExporter(target)
+
+
+class SpanWriter(Thread):
+    """Exports the queued spans in batches from a background thread"""
+
+    def __init__(self, exporter, metrics, resource=None):
+        """Constructor
+
+        resource is a dict of attributes describing the kernel.
+        """
+        Thread.__init__(self)
+        self.daemon = True
+        self.exporter = exporter
+        self.queue = Queue(MAX_QUEUED_SPANS)
+        self.running = True
+        self.resource = {'attributes': [attribute(key, value) for key, value
+                                        in sorted((resource or {}).items())]}
+        self.exported = metrics.counter(
+            'spans_exported', 'Trace spans written by the span exporter')
+        self.dropped = metrics.counter(
+            'spans_dropped', 'Trace spans dropped because the exporter fell behind or failed')
+
+    def put(self, span):
+        """Queue an OTLP span without blocking"""
+        try:
+            self.queue.put_nowait(span)
+        except Full:
+            self.dropped.inc()
+
+    def request(self, spans):
+        return {'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{
+                'scope': {'name': 'sparkmonitor', 'version': __version__},
+                'spans': spans,
+            }],
+        }]}
+
+    def run(self):
+        while self.running or not self.queue.empty():
+            spans = []
+            deadline = time.time() + MAX_BATCH_DELAY
+            while len(spans) < MAX_BATCH_SPANS:
+                try:
+                    spans.append(self.queue.get(timeout=max(0, deadline - time.time())))
+                except Empty:
+                    break
+            if not spans:
+                continue
+            try:
+                self.exporter.export(self.request(spans))
+                self.exported.inc(len(spans))
+            except Exception as e:
+                self.dropped.inc(len(spans))
+                logger.warn('SparkMonitor could not export %d spans: %s', len(spans), e)
+        self.exporter.close()
+
+    def stop(self):
+        """Export the queued spans and stop"""
+        self.running = False
+        self.join()
+
+
+class SpanTracer:
+    """Builds the spans of the cell executions, jobs, stages and tasks"""
+
+    def __init__(self, writer, taskRate=0.0, maxsize=1000):
+        """Constructor
+
+        taskRate is the fraction of the task end events received exported
+        as spans.
+        """
+        self.writer = writer
+        self.taskRate = taskRate
+        # Spans of the cell executions running jobs, by run id
+        self.cells = BoundedDict(maxsize)
+        # Spans of the running jobs and stages and their trace ids
+        self.jobs = BoundedDict(maxsize)
+        self.stages = BoundedDict(maxsize * 10)
+        self.lock = Lock()
+
+    def start_run(self, runId, cellId=None):
+        with self.lock:
+            span = Span(runId.replace('-', ''), 'cell', time.time() * 1000)
+            span.attributes['jupyter.cell.id'] = cellId
+            span.attributes['sparkmonitor.run.id'] = runId
+            span.attributes['spark.job.count'] = 0
+            self.cells[runId] = span
+
+    def end_run(self, runId):
+        with self.lock:
+            span = self.cells.pop(runId, None)
+        if span is not None and span.attributes['spark.job.count']:
+            self.writer.put(span.to_otlp(time.time() * 1000))
+
+    def on_message(self, data, runId=None, appId=None):
+        msgtype = data.get('msgtype')
+        with self.lock:
+            if msgtype == 'sparkJobStart':
+                self._start_job(data, runId, appId)
+            elif msgtype == 'sparkJobEnd':
+                self._end_job(data, appId)
+            elif msgtype == 'sparkStageSubmitted':
+                self._stage(data, appId)
+            elif msgtype == 'sparkStageCompleted':
+                self._end_stage(data, appId)
+            elif msgtype == 'sparkTaskEnd' and self.taskRate:
+                self._task(data, appId)
+
+    def _start_job(self, data, runId, appId):
+        cell = self.cells.get(runId) if runId else None
+        if cell is not None:
+            span = Span(cell.traceId, 'job', data.get('submissionTime') or time.time() * 1000,
+                        cell.spanId)
+            cell.attributes['spark.job.count'] += 1
+        else:
+            span = Span(new_trace_id(), 'job', data.get('submissionTime') or time.time() * 1000)
+        span.attributes.update({
+            'spark.app.id': appId,
+            'spark.job.id': data.get('jobId'),
+            'spark.job.name': data.get('name'),
+            'spark.job.group': data.get('jobGroup') if data.get('jobGroup') != 'null' else None,
+            'spark.job.stage_count': len(data.get('stageIds') or ()),
+            'spark.job.task_count': data.get('numTasks'),
+            'spark.executor.cores': data.get('totalCores'),
+        })
+        self.jobs[(appId, data.get('jobId'))] = span
+
+    def _end_job(self, data, appId):
+        span = self.jobs.pop((appId, data.get('jobId')), None)
+        if span is None:
+            return
+        span.attributes['spark.job.status'] = data.get('status')
+        if data.get('status') not in (None, 'SUCCEEDED'):
+            span.error = 'Job %s' % data.get('status')
+        self.writer.put(span.to_otlp(data.get('completionTime') or time.time() * 1000))
+
+    def _stage(self, data, appId):
+        key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+        span = self.stages.get(key)
+        if span is not None:
+            return span
+        job = None
+        for jobId in data.get('jobIds') or ():
+            job = self.jobs.get((appId, jobId))
+            if job is not None:
+                break
+        startTime = data.get('submissionTime') or time.time() * 1000
+        if job is not None:
+            span = Span(job.traceId, 'stage', startTime, job.spanId)
+        else:
+            span = Span(new_trace_id(), 'stage', startTime)
+        span.attributes.update({
+            'spark.app.id': appId,
+            'spark.stage.id': data.get('stageId'),
+            'spark.stage.attempt': data.get('stageAttemptId'),
+            'spark.stage.name': data.get('name'),
+            'spark.stage.task_count': data.get('numTasks'),
+        })
+        self.stages[key] = span
+        return span
+
+    def _end_stage(self, data, appId):
+        span = self._stage(data, appId)
+        del self.stages[(appId, data.get('stageId'), data.get('stageAttemptId'))]
+        span.attributes.update({
+            'spark.stage.status': data.get('status'),
+            'spark.stage.completed_tasks': data.get('numCompletedTasks'),
+            'spark.stage.failed_tasks': data.get('numFailedTasks'),
+            'spark.stage.task_duration_sum': data.get('taskDurationSum'),
+        })
+        for name in STAGE_SUMMARIES:
+            summary = (data.get('taskSummary') or {}).get(name)
+            if summary:
+                span.attributes['spark.stage.%s_sum' % name] = summary.get('sum')
+        if data.get('status') == 'FAILED':
+            span.error = 'Stage failed'
+        self.writer.put(span.to_otlp(data.get('completionTime') or time.time() * 1000))
+
+    def _task(self, data, appId):
+        if self.taskRate < 1 and random.random() >= self.taskRate:
+            return
+        stage = self.stages.get((appId, data.get('stageId'), data.get('stageAttemptId')))
+        if stage is None or not data.get('launchTime') or not data.get('finishTime'):
+            return
+        span = Span(stage.traceId, 'task', data['launchTime'], stage.spanId)
+        span.attributes.update({
+            'spark.task.id': data.get('taskId'),
+            'spark.task.index': data.get('index'),
+            'spark.task.attempt': data.get('attemptNumber'),
+            'spark.task.status': data.get('status'),
+            'spark.task.speculative': data.get('speculative'),
+            'spark.executor.id': data.get('executorId'),
+            'host.name': data.get('host'),
+        })
+        metrics = data.get('metrics') or {}
+        for name in TASK_METRICS:
+            span.attributes['spark.task.%s' % name] = metrics.get(name)
+        if data.get('status') in ('FAILED', 'KILLED'):
+            span.error = data.get('errorMessage') or 'Task %s' % data.get('status')
+        self.writer.put(span.to_otlp(data['finishTime']))
+
+    def close(self):
+        """Export the remaining spans and stop the exporter"""
+        self.writer.stop()
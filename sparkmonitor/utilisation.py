@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""SparkMonitor Executor Utilisation
+
+Accounts how well each cell execution used the executor cores allocated
+to its applications while its jobs ran:
+
+- allocated core-seconds, the integral of the executor cores of the
+  applications between the submission of the first job of the cell and
+  the completion of its last job, from the executor added and removed
+  events,
+- busy task-seconds, the sum of the durations of the tasks of its
+  stages, exact even when task events are sampled or not sent,
+- utilisation, busy over allocated, and idle core-seconds, their
+  difference,
+- peak parallelism, the largest number of tasks running at once, from the
+  task start and end events or the stage updates without task records.
+
+Every message is accounted in constant time and memory: the cores of an
+application are kept as a running integral, a run only keeps the
+integral at its start and counters.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from threading import Lock
+
+from .routing import BoundedDict
+
+
+class AllocatedCores:
+    """Executor cores of an application and their integral over time, in core-ms"""
+
+    __slots__ = ('cores', 'time', 'coreMs')
+
+    def __init__(self, cores=0, time=None):
+        self.cores = cores
+        self.time = time
+        self.coreMs = 0.0
+
+    def integral(self, time):
+        """Core-ms allocated from the first event up to time"""
+        if self.time is None or time is None:
+            return self.coreMs
+        return self.coreMs + self.cores * (time - self.time)
+
+    def set_cores(self, cores, time):
+        if time is not None:
+            self.coreMs = self.integral(time)
+            self.time = time
+        self.cores = cores
+
+
+class RunUtilisation:
+    """Utilisation counters of one cell execution"""
+
+    __slots__ = ('runId', 'cellId', 'jobIds', 'runningJobs', 'startTime', 'endTime',
+                 'coreStart', 'busyMs', 'numActiveTasks', 'stageActiveTasks',
+                 'peakParallelism', 'maxCores')
+
+    def __init__(self, runId, cellId=None):
+        """Constructor"""
+        self.runId = runId
+        self.cellId = cellId
+        self.jobIds = []
+        self.runningJobs = set()
+        self.startTime = None
+        self.endTime = None
+        # Integral of the cores of each application at the start of the run
+        self.coreStart = {}
+        self.busyMs = 0
+        # Running tasks from the task events, and from the stage updates by stage
+        self.numActiveTasks = 0
+        self.stageActiveTasks = {}
+        self.peakParallelism = 0
+        self.maxCores = 0
+
+    def update_peak(self):
+        self.peakParallelism = max(self.peakParallelism, self.numActiveTasks,
+                                   sum(self.stageActiveTasks.values()))
+
+
+class UtilisationTracker:
+    """Integrates allocated and busy core time per cell execution"""
+
+    def __init__(self, notify=None, maxsize=100):
+        """Constructor
+
+        notify is called with the utilisation report of a cell execution
+        each time one of its jobs ends.
+        """
+        self.notify = notify
+        self.apps = {}
+        self.runs = BoundedDict(maxsize)
+        self.reports = BoundedDict(maxsize)
+        self.lastRunId = None
+        self.lock = Lock()
+
+    def _app(self, appId):
+        app = self.apps.get(appId)
+        if app is None:
+            app = self.apps[appId] = AllocatedCores()
+        return app
+
+    def on_message(self, data, runId, appId=None):
+        """Account a listener message, runId is None for executor events"""
+        msgtype = data.get('msgtype')
+        report = None
+        with self.lock:
+            if msgtype in ('sparkExecutorAdded', 'sparkExecutorRemoved'):
+                self._app(appId).set_cores(data.get('totalCores', 0), data.get('time'))
+                return
+            run = self.runs.get(runId)
+            if msgtype == 'sparkJobStart':
+                app = self._app(appId)
+                if app.time is None and data.get('totalCores') is not None:
+                    # Executors added before the listener connected
+                    app.set_cores(data['totalCores'], data.get('submissionTime'))
+                if run is None:
+                    if runId is None:
+                        return
+                    run = self.runs[runId] = RunUtilisation(runId)
+                submissionTime = data.get('submissionTime')
+                if run.startTime is None:
+                    run.startTime = submissionTime
+                if appId not in run.coreStart:
+                    run.coreStart[appId] = app.integral(submissionTime)
+                run.maxCores = max(run.maxCores, app.cores)
+                run.jobIds.append({'appId': appId, 'jobId': data.get('jobId')})
+                run.runningJobs.add((appId, data.get('jobId')))
+                self.lastRunId = runId
+                return
+            if run is None:
+                return
+            if msgtype == 'sparkTaskStart':
+                run.numActiveTasks += data.get('sampleWeight', 1)
+                run.update_peak()
+            elif msgtype == 'sparkTaskEnd':
+                run.numActiveTasks = max(0, run.numActiveTasks - data.get('sampleWeight', 1))
+            elif msgtype == 'sparkStageActive':
+                key = (appId, data.get('stageId'), data.get('stageAttemptId'))
+                run.stageActiveTasks[key] = data.get('numActiveTasks', 0)
+                run.update_peak()
+            elif msgtype == 'sparkStageCompleted':
+                run.stageActiveTasks.pop((appId, data.get('stageId'), data.get('stageAttemptId')), None)
+                run.busyMs += data.get('taskDurationSum', 0)
+            elif msgtype == 'sparkJobEnd':
+                run.runningJobs.discard((appId, data.get('jobId')))
+                completionTime = data.get('completionTime')
+                if completionTime is not None:
+                    run.endTime = max(run.endTime or 0, completionTime)
+                run.maxCores = max(run.maxCores, self._app(appId).cores)
+                report = self.reports[runId] = self._report(run)
+        if report is not None and self.notify is not None:
+            self.notify(report)
+
+    def start_run(self, runId, cellId=None):
+        with self.lock:
+            self.runs[runId] = RunUtilisation(runId, cellId)
+
+    def _report(self, run):
+        endTime = run.endTime or run.startTime
+        allocatedMs = sum(self._app(appId).integral(endTime) - start
+                          for appId, start in run.coreStart.items())
+        allocated = max(0.0, allocatedMs / 1000.0)
+        busy = run.busyMs / 1000.0
+        return {
+            'msgtype': 'utilisation',
+            'runId': run.runId,
+            'cellId': run.cellId,
+            'jobIds': list(run.jobIds),
+            'wallTime': max(0, endTime - run.startTime) / 1000.0,
+            'allocatedCoreSeconds': allocated,
+            'busyTaskSeconds': busy,
+            'idleCoreSeconds': max(0.0, allocated - busy),
+            'utilisation': min(1.0, busy / allocated) if allocated else None,
+            'peakParallelism': run.peakParallelism,
+            'maxCores': run.maxCores,
+        }
+
+    def report(self, runId=None):
+        """Return the utilisation of a cell execution, the last one running jobs by default"""
+        with self.lock:
+            return self.reports.get(runId or self.lastRunId)
@@ -3,6 +3,7 @@ import React from 'react';
 
 import { useCellStore, useNotebookStore } from '../store';
 import { CellMonitorHeader } from './header';
+import { ExecutorTable } from './executor-table';
 import { JobTable } from './job-table';
 import { LazyTimeline } from './lazy-timeline';
 import { LazyTaskChart } from './lazy-task-chart';
@@ -28,6 +29,8 @@ export const CellMonitor = observer(() => {
     tabContent = <LazyTaskChart />;
   } else if (cell?.view === 'timeline') {
     tabContent = <LazyTimeline />;
+  } else if (cell?.view === 'executors') {
+    tabContent = <ExecutorTable />;
   }
 
   return (
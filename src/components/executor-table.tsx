@@ -0,0 +1,111 @@
+import { observer } from 'mobx-react-lite';
+import React from 'react';
+
+import { useCellStore } from '../store';
+import type { IExecutorMemorySample, SparkExecutor } from '../store/spark-executor';
+import { executorAlertText, percent, prettyBytes } from './header';
+import { ErrorBoundary } from './error-boundary';
+
+/** Used heap of the samples of an executor, as a line scaled to its limit */
+const HeapSparkline = (props: { samples: IExecutorMemorySample[] }) => {
+  const samples = props.samples;
+  if (samples.length < 2) {
+    return null;
+  }
+  const width = 80;
+  const height = 16;
+  const max = Math.max(...samples.map(s => Math.max(s.maxHeapMemory, s.heapMemory)), 1);
+  const start = samples[0].time;
+  const span = Math.max(samples[samples.length - 1].time - start, 1);
+  const points = samples
+    .map(s => `${((s.time - start) / span) * width},${height - (s.heapMemory / max) * height}`)
+    .join(' ');
+  return (
+    <svg className="executorsparkline" width={width} height={height}>
+      <polyline points={points} />
+    </svg>
+  );
+};
+
+const MemoryBar = (props: { used: number; total: number }) => {
+  const fraction = props.total ? Math.min(1, props.used / props.total) : 0;
+  return (
+    <span className="executormemorybar">
+      <span
+        className={fraction >= 0.9 ? 'executormemoryused executormemoryhigh' : 'executormemoryused'}
+        style={{ width: `${fraction * 100}%` }}
+      />
+    </span>
+  );
+};
+
+const ExecutorItem = observer((props: { executor: SparkExecutor }) => {
+  const executor = props.executor;
+  const sample = executor.latest;
+  if (!sample) {
+    return null;
+  }
+  const alerts = executor.activeAlerts;
+  const peakHeap = Math.max(...executor.samples.map(s => s.heapMemory));
+  return (
+    <tr
+      className={alerts.length ? 'executorrow executoralert' : 'executorrow'}
+      title={alerts.map(executorAlertText).join('\n') || undefined}
+    >
+      <td className="tdexecutorid" title={executor.appId}>
+        {executor.executorId}
+        {executor.removed ? ' (removed)' : ''}
+      </td>
+      <td className="tdexecutorheap" title={`Peak over the last ${executor.samples.length} samples: ${prettyBytes(peakHeap)}`}>
+        <MemoryBar used={sample.heapMemory} total={sample.maxHeapMemory} />
+        {prettyBytes(sample.heapMemory)} / {sample.maxHeapMemory ? prettyBytes(sample.maxHeapMemory) : '-'}
+      </td>
+      <td className="tdexecutorhistory">
+        <HeapSparkline samples={executor.samples} />
+      </td>
+      <td className="tdexecutoroffheap">{prettyBytes(sample.offHeapMemory)}</td>
+      <td className="tdexecutorexecution">{prettyBytes(sample.executionMemory)}</td>
+      <td className="tdexecutorstorage">
+        {prettyBytes(sample.storageMemory)}
+        {sample.maxMemory ? ` / ${prettyBytes(sample.maxMemory)}` : ''}
+      </td>
+      <td className="tdexecutorgc">{percent(sample.gcFraction)}</td>
+    </tr>
+  );
+});
+
+export const ExecutorTable = observer(() => {
+  const cell = useCellStore();
+  const executors = cell.executors;
+
+  return (
+    <ErrorBoundary>
+      <div className="tabcontent">
+        {executors.some(executor => executor.latest) ? (
+          <table className="executortable">
+            <thead>
+              <tr>
+                <th className="thexecutorid">Executor</th>
+                <th className="thexecutorheap">Heap</th>
+                <th className="thexecutorhistory">Heap History</th>
+                <th className="thexecutoroffheap">Off-heap</th>
+                <th className="thexecutorexecution">Execution</th>
+                <th className="thexecutorstorage">Storage</th>
+                <th className="thexecutorgc">GC Time</th>
+              </tr>
+            </thead>
+            <tbody>
+              {executors.map(executor => (
+                <ExecutorItem executor={executor} key={executor.uniqueId} />
+              ))}
+            </tbody>
+          </table>
+        ) : (
+          <div className="executorempty">
+            No memory samples yet, the executors send them with their heartbeats
+          </div>
+        )}
+      </div>
+    </ErrorBoundary>
+  );
+});
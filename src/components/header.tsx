@@ -1,6 +1,72 @@
 import React from 'react';
 import { observer } from 'mobx-react-lite';
 import { useCellStore, useNotebookStore } from '../store';
+import prettyMilliseconds from 'pretty-ms';
+import type { IExecutorAlert } from '../store/spark-executor';
+
+const METRIC_NAMES: { [metric: string]: string } = {
+  wallTime: 'Wall time',
+  shuffleReadBytes: 'Shuffle read',
+  bytesSpilled: 'Spill'
+};
+
+export const prettyBytes = (bytes: number) => {
+  const units = ['B', 'kB', 'MB', 'GB', 'TB'];
+  let i = 0;
+  while (bytes >= 1000 && i < units.length - 1) {
+    bytes /= 1000;
+    i++;
+  }
+  return `${bytes.toFixed(i ? 1 : 0)} ${units[i]}`;
+};
+
+/** Describes a regression notice, e.g. "Wall time: 12s, usually 8s" */
+const regressionText = (notice: any) => {
+  const format = (metric: string, value: number) =>
+    metric === 'wallTime'
+      ? prettyMilliseconds(value * 1000)
+      : prettyBytes(value);
+  const lines = (notice.regressions || []).map(
+    (r: any) =>
+      `${METRIC_NAMES[r.metric] || r.metric}: ${format(r.metric, r.value)}, usually ${format(r.metric, r.baseline)}`
+  );
+  return [...lines, `Compared with the median of the last ${notice.baselineRuns} runs`].join('\n');
+};
+
+/** Describes a utilisation report, e.g. "Busy: 120 task-s of 200 core-s" */
+const utilisationText = (report: any) =>
+  [
+    `Busy: ${report.busyTaskSeconds.toFixed(1)} task-s of ${report.allocatedCoreSeconds.toFixed(1)} core-s allocated`,
+    `Idle: ${report.idleCoreSeconds.toFixed(1)} core-s`,
+    `Peak parallelism: ${report.peakParallelism} tasks on ${report.maxCores} cores`
+  ].join('\n');
+
+/** Describes a driver bottleneck notice, e.g. "1.2 GB of results, 14s getting them" */
+export const driverBottleneckText = (notice: any) =>
+  [
+    `Stage ${notice.stageId} sent ${prettyBytes(notice.resultBytes)} of results to the driver`,
+    `Getting results: ${prettyMilliseconds(notice.gettingResultTime)}, serializing them: ${prettyMilliseconds(notice.serializationTime)}`,
+    'Consider aggregating or writing the data out instead of collecting it'
+  ].join('\n');
+
+export const percent = (fraction?: number | null) =>
+  typeof fraction === 'number' ? `${Math.round(fraction * 100)}%` : '-';
+
+/** Describes an executor alert, e.g. "Executor 3: heap 94% used, limit 90%" */
+export const executorAlertText = (alert: IExecutorAlert) =>
+  alert.kind === 'heap'
+    ? `Executor ${alert.executorId}: heap ${percent(alert.heapFraction)} used, limit ${percent(alert.limit)}`
+    : `Executor ${alert.executorId}: ${percent(alert.gcFraction)} of the time in GC, limit ${percent(alert.limit)}`;
+
+/** Describes the level of the CPU governor, e.g. "Task records sampled, 1 in 10" */
+const governorText = (state: any) =>
+  [
+    state.detail === 'sampled'
+      ? `Task records of 1 task in ${state.sampleRate} are shown, the task chart is an estimate`
+      : 'Task records are not sent, only the task summaries of the stages',
+    `The monitor used ${percent(state.cpuFraction)} of a core, over its budget of ${percent(state.budget)}`,
+    'Full detail is restored once the load drops'
+  ].join('\n');
 
 export const CellMonitorHeader = observer(() => {
   const notebook = useNotebookStore();
@@ -14,6 +80,9 @@ export const CellMonitorHeader = observer(() => {
     'taskviewtabbuttonicon tabbutton ' + isButtonActive('taskchart');
   const timelineButtonClassNames =
     'timelinetabbuttonicon tabbutton ' + isButtonActive('timeline');
+  const executorsButtonClassNames =
+    'executorstabbuttonicon tabbutton ' + isButtonActive('executors');
+  const executorAlerts = cell.executorAlerts;
 
   return (
     <div className="title">
@@ -60,6 +129,56 @@ export const CellMonitorHeader = observer(() => {
             ) : (
               ''
             )}
+            {typeof cell.utilisation?.utilisation === 'number' ? (
+              <span className="badgeutilisation" title={utilisationText(cell.utilisation)}>
+                {Math.round(cell.utilisation.utilisation * 100)}% cores used
+              </span>
+            ) : (
+              ''
+            )}
+            {cell.driverBottlenecks.length ? (
+              <span
+                className="badgedriverbottleneck"
+                title={cell.driverBottlenecks
+                  .map((notice: any) => `Job ${notice.jobId}: ${driverBottleneckText(notice)}`)
+                  .join('\n\n')}
+              >
+                Driver bottleneck
+              </span>
+            ) : (
+              ''
+            )}
+            {executorAlerts.length ? (
+              <span
+                className={
+                  executorAlerts.some(alert => alert.active)
+                    ? 'badgeexecutoralert badgeexecutoralertactive'
+                    : 'badgeexecutoralert'
+                }
+                title={executorAlerts.map(executorAlertText).join('\n')}
+                onClick={() => {
+                  cell.setView('executors');
+                }}
+              >
+                Executor memory
+              </span>
+            ) : (
+              ''
+            )}
+            {notebook.governor?.level && cell.numActiveJobs ? (
+              <span className="badgegovernor" title={governorText(notebook.governor)}>
+                Reduced detail
+              </span>
+            ) : (
+              ''
+            )}
+            {cell.regression ? (
+              <span className="badgeregression" title={regressionText(cell.regression)}>
+                Slower than usual
+              </span>
+            ) : (
+              ''
+            )}
           </span>
         </span>
       </div>
@@ -86,6 +205,13 @@ export const CellMonitorHeader = observer(() => {
               cell.setView('timeline');
             }}
           />
+          <span
+            className={executorsButtonClassNames}
+            title="Executor Memory"
+            onClick={() => {
+              cell.setView('executors');
+            }}
+          />
           {/* TODO <span className="sparkuitabbuttonicon tabbutton" title="Open the Spark UI" /> */}
           <span
             className="closebuttonicon tabbutton"
@@ -3,15 +3,112 @@ import React from 'react';
 import TimeAgo from 'react-timeago';
 
 import { useCellStore, useNotebookStore } from '../store';
+import type { IEta, SparkJob } from '../store/spark-job';
+import type { IThroughput } from '../store/spark-stage';
 import { ProgressBar } from './progress-bar';
+import { driverBottleneckText, prettyBytes } from './header';
 import prettyMilliseconds from 'pretty-ms';
 import { ErrorBoundary } from './error-boundary';
 
+/** Estimated time left of a running job or stage, with its 90% interval as a tooltip */
+const EtaText = (props: { eta?: IEta }) => {
+  const eta = props.eta;
+  if (!eta) {
+    return <>-</>;
+  }
+  const format = (ms: number) => prettyMilliseconds(ms, { secondsDecimalDigits: 0 });
+  return (
+    <span
+      className="tdeta"
+      title={`Expected between ${format(eta.low)} and ${format(eta.high)} from the last update`}
+    >
+      ~{format(eta.remaining)} left
+    </span>
+  );
+};
+
+/** The bottleneck stages of an ended job, e.g. "Bottleneck: stage 3 (62%)" */
+const BottleneckText = (props: { bottlenecks: SparkJob['bottlenecks'] }) => {
+  const bottlenecks = props.bottlenecks;
+  if (!bottlenecks?.length) {
+    return null;
+  }
+  const lines = bottlenecks.map(
+    b => `Stage ${b.stageId} ${b.name}: ${prettyMilliseconds(b.duration)}, ${Math.round(b.share * 100)}% of the critical path`
+  );
+  return (
+    <span className="jobbottleneck" title={lines.join('\n')}>
+      Bottleneck: stage {bottlenecks[0].stageId} ({Math.round(bottlenecks[0].share * 100)}%)
+    </span>
+  );
+};
+
+const DriverBottleneckText = (props: { notice: any }) => {
+  if (!props.notice) {
+    return null;
+  }
+  return (
+    <span className="jobdriverbottleneck" title={driverBottleneckText(props.notice)}>
+      Driver bottleneck
+    </span>
+  );
+};
+
+type IOKind = 'input' | 'output' | 'shuffleRead' | 'shuffleWrite';
+
+const IO_KINDS: Array<[IOKind, string]> = [
+  ['input', 'Input'],
+  ['output', 'Output'],
+  ['shuffleRead', 'Shuffle read'],
+  ['shuffleWrite', 'Shuffle write']
+];
+
+/** The largest I/O of a stage and its rate, e.g. "Input 120 MB/s", with the details as a tooltip */
+const ThroughputText = (props: { throughput?: IThroughput }) => {
+  const throughput = props.throughput;
+  const kinds = IO_KINDS.filter(([kind]) => (throughput?.[kind]?.bytes ?? 0) > 0);
+  if (!throughput || !kinds.length) {
+    return <>-</>;
+  }
+  const rate = (bytesPerSecond?: number | null) =>
+    typeof bytesPerSecond === 'number' ? `${prettyBytes(bytesPerSecond)}/s` : '-';
+  const lines = kinds.map(([kind, label]) => {
+    const io = throughput[kind];
+    const perTask = io.bytesPerTaskSecond ? `, ${rate(io.bytesPerTaskSecond)} per task` : '';
+    return `${label}: ${prettyBytes(io.bytes)}, ${io.records} records, ${rate(io.bytesPerSecond)}${perTask}`;
+  });
+  const executors = Object.entries(throughput.executors || {}).sort(
+    ([, a], [, b]) => (a.bytesPerTaskSecond ?? 0) - (b.bytesPerTaskSecond ?? 0)
+  );
+  if (executors.length) {
+    lines.push('', 'Executors, slowest first:');
+    executors.slice(0, 10).forEach(([executorId, e]) => {
+      lines.push(
+        `${executorId}: ${prettyBytes(e.bytesRead)} read, ${prettyBytes(e.bytesWritten)} written, ${rate(e.bytesPerTaskSecond)} per task`
+      );
+    });
+  }
+  const [largest, label] = kinds.reduce((a, b) =>
+    throughput[b[0]].bytes > throughput[a[0]].bytes ? b : a
+  );
+  return (
+    <span title={lines.join('\n')}>
+      {label} {rate(throughput[largest].bytesPerSecond)}
+    </span>
+  );
+};
+
 const StageItem = observer((props: { stageId: string }) => {
   const notebook = useNotebookStore();
   const stage = notebook.stages[props.stageId];
+  const slackText =
+    stage.slack === undefined
+      ? undefined
+      : stage.critical
+        ? 'On the critical path of the job'
+        : `Could have taken ${prettyMilliseconds(stage.slack)} longer without delaying the job`;
   return (
-    <tr className="stagerow">
+    <tr className={stage.critical ? 'stagerow stagecritical' : 'stagerow'} title={slackText}>
       <td className="tdstageid">{stage.stageId}</td>
       <td className="tdstagename">
         {stage.name ? String(stage.name).charAt(0).toUpperCase() + String(stage.name).slice(1).toLowerCase() : 'Unnamed'}
@@ -36,7 +133,10 @@ const StageItem = observer((props: { stageId: string }) => {
           ? prettyMilliseconds(
               stage.completionTime?.getTime() - stage.submissionTime.getTime()
             )
-          : '-'}
+          : <EtaText eta={stage.eta} />}
+      </td>
+      <td className="tdstageio">
+        <ThroughputText throughput={stage.throughput} />
       </td>
     </tr>
   );
@@ -58,6 +158,7 @@ const StageTable = observer((props: { jobId: string }) => {
           <th className="thstagetasks">Tasks</th>
           <th className="thstagestart">Submission Time</th>
           <th className="thstageduration">Duration</th>
+          <th className="thstageio">I/O</th>
         </tr>
       </thead>
       <tbody>{rows}</tbody>
@@ -85,9 +186,13 @@ const JobItem = observer((props: { jobId: string }) => {
             }
           ></span>
         </td>
-        <td className="tdjobid">{job.jobId}</td>
+        <td className="tdjobid" title={job.appId}>
+          {job.jobId}
+        </td>
         <td className="tdjobname">
           {job.name ? String(job.name).charAt(0).toUpperCase() + String(job.name).slice(1).toLowerCase() : 'Unnamed'}
+          <BottleneckText bottlenecks={job.bottlenecks} />
+          <DriverBottleneckText notice={job.driverBottleneck} />
         </td>
         <td className="tdjobstatus">
           <span className={'tditemjobstatus ' + job.status}>
@@ -114,7 +219,7 @@ const JobItem = observer((props: { jobId: string }) => {
             ? prettyMilliseconds(
                 job.endTime?.getTime() - job.startTime.getTime()
               )
-            : '-'}
+            : <EtaText eta={job.eta} />}
         </td>
       </tr>
       {!stagesCollapsed && (
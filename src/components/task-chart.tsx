@@ -216,7 +216,7 @@ const TaskChart = observer(() => {
         size: 8,
         color: '#6DD58C'
       },
-      name: 'Running Tasks',
+      name: taskChartStore.sampled ? 'Running Tasks (estimated)' : 'Running Tasks',
       legendgroup: 'running',
       showlegend: true
     };
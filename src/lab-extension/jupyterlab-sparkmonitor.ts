@@ -1,5 +1,5 @@
 import React from 'react';
-import { ICellModel } from '@jupyterlab/cells';
+import { Cell, ICellModel, ICodeCellModel } from '@jupyterlab/cells';
 import { NotebookPanel } from '@jupyterlab/notebook';
 import {
   IComm,
@@ -12,6 +12,10 @@ import { CellWidget } from '../components';
 import { ReactWidget } from '@jupyterlab/apputils';
 
 import type { NotebookStore } from '../store/notebook';
+import { LatencyReporter } from '../store/latency-reporter';
+import { ViewReporter } from '../store/view-reporter';
+import { decodeTaskBatch, supportedCodecs } from '../store/columnar';
+import { findCellSummary } from '../store/cell-summary';
 
 export default class JupyterLabSparkMonitor {
   currentCellTracker: CurrentCellTracker;
@@ -20,6 +24,15 @@ export default class JupyterLabSparkMonitor {
 
   /** Communication object with the kernel. */
   comm?: IComm;
+
+  /** Reports render latency of kernel messages back to the kernel. */
+  latencyReporter = new LatencyReporter(data => this.comm?.send(data));
+
+  /** Reports the open views, so that the kernel adjusts the listener detail. */
+  viewReporter: ViewReporter;
+
+  /** Messages are handled in order, decompressing a batch is asynchronous. */
+  private messageQueue: Promise<void> = Promise.resolve();
   
   /** Retry mechanism for comm connection */
   private commRetryTimer?: number;
@@ -34,10 +47,17 @@ export default class JupyterLabSparkMonitor {
   // Map of cellId to its widget instance for easy access and management
   private cellWidgets = new Map<string, any>();
 
+  // Map of cellId to the widget of each code cell, to find routed cells by id
+  private codeCells = new Map<string, Cell>();
+
+  // Map of cellId to the id of its last execution which started Spark jobs
+  private cellRunIds = new Map<string, string>();
+
   constructor(
     private notebookPanel: NotebookPanel,
     private notebookStore: NotebookStore
   ) {
+    this.viewReporter = new ViewReporter(notebookStore, data => this.comm?.send(data));
     this.createCellReactElements();
     this.currentCellTracker = new CurrentCellTracker(notebookPanel);
     this.kernel = (notebookPanel as any).session
@@ -176,6 +196,7 @@ export default class JupyterLabSparkMonitor {
           console.log('SparkMonitor: Comm successfully established');
           this.isCommReady = true;
           this.retryCount = 0;
+          this.viewReporter.report();
         } else {
           this.scheduleCommRetry();
         }
@@ -326,12 +347,29 @@ export default class JupyterLabSparkMonitor {
     }
   }
 
+  /** Restores the display of a cell from the summary saved in its outputs */
+  private restoreCellSummary(cellModel: ICellModel) {
+    if (this.notebookStore.hasCellData(cellModel.id)) {
+      return; // Live data of the current session
+    }
+    const outputs = (cellModel as ICodeCellModel).outputs?.toJSON();
+    const summary = findCellSummary(outputs);
+    if (summary) {
+      this.notebookStore.onCellSummary(cellModel.id, summary);
+    }
+  }
+
   createCellReactElements() {
     const createElementIfNotExists = (cellModel: ICellModel) => {
       if (cellModel.type === 'code') {
+        this.restoreCellSummary(cellModel);
+
         const codeCell = this.notebookPanel.content.widgets.find(
           widget => widget.model === cellModel
         );
+        if (codeCell) {
+          this.codeCells.set(cellModel.id, codeCell);
+        }
 
         // Check if widget already exists and is still valid
         const existingWidget = this.cellWidgets.get(cellModel.id);
@@ -483,6 +521,7 @@ export default class JupyterLabSparkMonitor {
             widget.dispose();
           }
           this.cellWidgets.delete(cellModel.id);
+          this.codeCells.delete(cellModel.id);
           this.notebookStore.onCellRemoved(cellModel.id);
         });
       }
@@ -569,7 +608,7 @@ export default class JupyterLabSparkMonitor {
         }, 5000); // 5 second timeout
         
         try {
-          this.comm!.open({ msgtype: 'openfromfrontend' });
+          this.comm!.open({ msgtype: 'openfromfrontend', codecs: supportedCodecs });
           
           // Consider the comm successfully opened immediately after calling open
           // The actual connection will be verified through message handling
@@ -595,7 +634,29 @@ export default class JupyterLabSparkMonitor {
     }
   }
 
-  onSparkJobStart(data: any) {
+  /**
+   * Returns the id of the cell the kernel attributed a message to,
+   * if that cell is in this notebook.
+   */
+  private getRoutedCellId(routing: any): string | undefined {
+    const cellId = routing?.cellId;
+    if (cellId && this.codeCells.has(cellId)) {
+      return cellId;
+    }
+    return undefined;
+  }
+
+  onSparkJobStart(data: any, routing?: any) {
+    const routedCellId = this.getRoutedCellId(routing);
+    if (routedCellId) {
+      // The kernel tagged the job with its cell execution, a new run id means a new execution
+      if (this.cellRunIds.get(routedCellId) !== routing.runId) {
+        this.cellRunIds.set(routedCellId, routing.runId);
+        this.notebookStore.onCellExecutedAgain(routedCellId);
+      }
+      this.notebookStore.onSparkJobStart(routedCellId, data);
+      return;
+    }
     const cell = this.currentCellTracker.getActiveCell();
     if (!cell) {
       console.warn('SparkMonitor: Job started with no running cell.');
@@ -613,7 +674,12 @@ export default class JupyterLabSparkMonitor {
     this.notebookStore.onSparkJobStart(cell.model.id, data);
   }
 
-  onSparkStageSubmitted(data: any) {
+  onSparkStageSubmitted(data: any, routing?: any) {
+    const routedCellId = this.getRoutedCellId(routing);
+    if (routedCellId) {
+      this.notebookStore.onSparkStageSubmitted(routedCellId, data);
+      return;
+    }
     const cell = this.currentCellTracker.getActiveCell();
     if (!cell) {
       console.warn('SparkMonitor: Stage started with no running cell.');
@@ -623,20 +689,62 @@ export default class JupyterLabSparkMonitor {
   }
 
   handleMessage(msg: ICommMsgMsg) {
+    this.messageQueue = this.messageQueue
+      .then(() => this.processMessage(msg))
+      .catch(error => console.error('SparkMonitor: Error handling message', error));
+  }
+
+  private async processMessage(msg: ICommMsgMsg) {
     if (!msg.content.data.msgtype) {
       console.warn('SparkMonitor: Unknown message');
     }
+    if (msg.content.data.msgtype === 'taskbatch') {
+      this.notebookStore.onSparkTaskBatch(
+        await decodeTaskBatch(msg.content.data, msg.buffers || [])
+      );
+      this.latencyReporter.onMessage(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'regression') {
+      this.notebookStore.onRegression(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'utilisation') {
+      this.notebookStore.onUtilisation(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'criticalPath') {
+      this.notebookStore.onCriticalPath(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'driverBottleneck') {
+      this.notebookStore.onDriverBottleneck(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'executorAlert') {
+      this.notebookStore.onExecutorAlert(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'governor') {
+      this.notebookStore.onGovernor(msg.content.data);
+    }
     if (msg.content.data.msgtype === 'fromscala') {
       const data: any = JSON.parse(msg.content.data.msg as string);
+      if (msg.content.data.weight !== undefined) {
+        // Weight of a sampled task event, set by the kernel
+        data.weight = msg.content.data.weight;
+      }
+      if (msg.content.data.eta !== undefined) {
+        // Completion estimates of a stage and its jobs, set by the kernel
+        data.eta = msg.content.data.eta;
+      }
+      if (msg.content.data.throughput !== undefined) {
+        // I/O throughput of a stage, computed by the kernel
+        data.throughput = msg.content.data.throughput;
+      }
       switch (data.msgtype) {
         case 'sparkJobStart':
-          this.onSparkJobStart(data);
+          this.onSparkJobStart(data, msg.content.data);
           break;
         case 'sparkJobEnd':
           this.notebookStore.onSparkJobEnd(data);
           break;
         case 'sparkStageSubmitted':
-          this.onSparkStageSubmitted(data);
+          this.onSparkStageSubmitted(data, msg.content.data);
           break;
         case 'sparkStageCompleted':
           this.notebookStore.onSparkStageCompleted(data);
@@ -662,10 +770,14 @@ export default class JupyterLabSparkMonitor {
         case 'sparkExecutorRemoved':
           this.notebookStore.onSparkExecutorRemoved(data);
           break;
+        case 'sparkExecutorMetrics':
+          this.notebookStore.onSparkExecutorMetrics(data);
+          break;
         default:
           console.warn('SparkMonitor: Unknown message');
           break;
       }
+      this.latencyReporter.onMessage(msg.content.data);
     }
   }
 
@@ -702,6 +814,7 @@ export default class JupyterLabSparkMonitor {
       }
     });
     this.cellWidgets.clear();
+    this.viewReporter.dispose();
     
     this.resetCommConnection();
   }
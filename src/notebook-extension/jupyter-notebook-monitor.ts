@@ -8,10 +8,18 @@ import { CellWidget } from '../components';
 import * as cellTracker from './currentcell';
 import { NotebookStore } from '../store/notebook';
 import { store } from '../store';
+import { LatencyReporter } from '../store/latency-reporter';
+import { ViewReporter } from '../store/view-reporter';
+import { decodeTaskBatch, supportedCodecs } from '../store/columnar';
+import { findCellSummary } from '../store/cell-summary';
 
 export class JupyterNotebookSparkMonitor {
   comm: any = null;
   notebookStore: NotebookStore;
+  latencyReporter = new LatencyReporter(data => this.comm?.send(data));
+  viewReporter: ViewReporter;
+  // Messages are handled in order, decompressing a batch is asynchronous
+  messageQueue: Promise<void> = Promise.resolve();
 
   constructor() {
     cellTracker.register();
@@ -19,10 +27,18 @@ export class JupyterNotebookSparkMonitor {
     // For jupyter notebook a single page has only one notebook.
     store.notebooks['default'] = new NotebookStore('default');
     this.notebookStore = store.notebooks['default'];
+    this.viewReporter = new ViewReporter(this.notebookStore, data => this.comm?.send(data));
 
     // Initialize Cell React Widgets
     this.createCellReactElements();
 
+    // Restore the displays of the cells saved with a summary
+    if (Jupyter.notebook._fully_loaded) {
+      this.restoreCellSummaries();
+    } else {
+      events.one('notebook_loaded.Notebook', () => this.restoreCellSummaries());
+    }
+
     // Connect on page load
     this.startComm();
 
@@ -44,10 +60,11 @@ export class JupyterNotebookSparkMonitor {
     if (Jupyter.notebook.kernel) {
       this.comm = Jupyter.notebook.kernel.comm_manager.new_comm(
         'SparkMonitor',
-        { msgtype: 'openfromfrontend' }
+        { msgtype: 'openfromfrontend', codecs: supportedCodecs }
       );
       // Register a message handler
       this.comm.on_msg((msg: any) => this.handleCommMessage(msg));
+      this.viewReporter.report();
       // this.comm.on_close($.proxy(that.on_comm_close, that)); // noop
     } else {
       console.log('SparkMonitor: No communication established, kernel null');
@@ -59,20 +76,40 @@ export class JupyterNotebookSparkMonitor {
       const cell = data.cell;
       const cellDiv: HTMLDivElement = cell.element.get(0);
       if (!cellDiv.querySelector('.sparkMonitorCellRoot')) {
-        const element = document.createElement('div');
-        cellDiv
-          .querySelector('.input')
-          ?.insertAdjacentElement('afterend', element);
         this.notebookStore.onCellExecutedAgain(cell.cell_id);
-        const cellWidget = React.createElement(CellWidget, {
-          notebookId: 'default',
-          cellId: cell.cell_id
-        });
-        ReactDOM.render(cellWidget, element);
+        this.createCellWidget(cell);
       }
     });
   }
 
+  createCellWidget(cell: any) {
+    const element = document.createElement('div');
+    cell.element
+      .get(0)
+      .querySelector('.input')
+      ?.insertAdjacentElement('afterend', element);
+    const cellWidget = React.createElement(CellWidget, {
+      notebookId: 'default',
+      cellId: cell.cell_id
+    });
+    ReactDOM.render(cellWidget, element);
+  }
+
+  restoreCellSummaries() {
+    for (const cell of Jupyter.notebook.get_cells()) {
+      if (cell.cell_type !== 'code') {
+        continue;
+      }
+      const summary = findCellSummary(cell.output_area?.outputs);
+      if (summary && !this.notebookStore.hasCellData(cell.cell_id)) {
+        this.notebookStore.onCellSummary(cell.cell_id, summary);
+        if (!cell.element.get(0).querySelector('.sparkMonitorCellRoot')) {
+          this.createCellWidget(cell);
+        }
+      }
+    }
+  }
+
   createButtons() {
     let isVisible = true;
 
@@ -105,11 +142,53 @@ export class JupyterNotebookSparkMonitor {
   }
 
   handleCommMessage(msg: any) {
+    this.messageQueue = this.messageQueue
+      .then(() => this.processCommMessage(msg))
+      .catch(error => console.error('SparkMonitor: Error handling message', error));
+  }
+
+  async processCommMessage(msg: any) {
     if (!msg.content.data.msgtype) {
       console.warn('SparkMonitor: Unknown message');
     }
+    if (msg.content.data.msgtype === 'taskbatch') {
+      this.notebookStore.onSparkTaskBatch(
+        await decodeTaskBatch(msg.content.data, msg.buffers || [])
+      );
+      this.latencyReporter.onMessage(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'regression') {
+      this.notebookStore.onRegression(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'utilisation') {
+      this.notebookStore.onUtilisation(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'criticalPath') {
+      this.notebookStore.onCriticalPath(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'driverBottleneck') {
+      this.notebookStore.onDriverBottleneck(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'executorAlert') {
+      this.notebookStore.onExecutorAlert(msg.content.data);
+    }
+    if (msg.content.data.msgtype === 'governor') {
+      this.notebookStore.onGovernor(msg.content.data);
+    }
     if (msg.content.data.msgtype === 'fromscala') {
       const data = JSON.parse(msg.content.data.msg);
+      if (msg.content.data.weight !== undefined) {
+        // Weight of a sampled task event, set by the kernel
+        data.weight = msg.content.data.weight;
+      }
+      if (msg.content.data.eta !== undefined) {
+        // Completion estimates of a stage and its jobs, set by the kernel
+        data.eta = msg.content.data.eta;
+      }
+      if (msg.content.data.throughput !== undefined) {
+        // I/O throughput of a stage, computed by the kernel
+        data.throughput = msg.content.data.throughput;
+      }
       switch (data.msgtype) {
         case 'sparkJobStart':
           this.onSparkJobStart(data);
@@ -144,7 +223,11 @@ export class JupyterNotebookSparkMonitor {
         case 'sparkExecutorRemoved':
           this.notebookStore.onSparkExecutorRemoved(data);
           break;
+        case 'sparkExecutorMetrics':
+          this.notebookStore.onSparkExecutorMetrics(data);
+          break;
       }
+      this.latencyReporter.onMessage(msg.content.data);
     }
   }
 
@@ -0,0 +1,17 @@
+/** Mime type of the display data published by the kernel */
+export const SPARKMONITOR_MIME_TYPE = 'application/vnd.sparkmonitor+json';
+
+/**
+ * Returns the summary saved in the outputs of a cell, in nbformat JSON,
+ * which the kernel publishes in place of the live display once the jobs
+ * of a cell execution end.
+ */
+export function findCellSummary(outputs: any[]): any | undefined {
+  for (const output of outputs || []) {
+    const data = output?.data?.[SPARKMONITOR_MIME_TYPE];
+    if (data?.msgtype === 'summary') {
+      return data;
+    }
+  }
+  return undefined;
+}
@@ -4,11 +4,15 @@ import { TaskChartStore } from './task-chart-store';
 import type { NotebookStore } from './notebook';
 
 export class Cell {
-  view: 'jobs' | 'taskchart' | 'timeline' = 'jobs';
+  view: 'jobs' | 'taskchart' | 'timeline' | 'executors' = 'jobs';
   isCollapsed = false;
   isRemoved = false;
   uniqueJobIds: Array<string> = [];
   taskChartStore: TaskChartStore;
+  /** Regression notice of the last execution, compared with previous runs */
+  regression?: any = undefined;
+  /** Executor core time allocated to and used by the last execution */
+  utilisation?: any = undefined;
   constructor(
     public cellId: string,
     private notebookStore: NotebookStore
@@ -22,6 +26,8 @@ export class Cell {
     this.isCollapsed = false;
     this.isRemoved = false;
     this.uniqueJobIds = [];
+    this.regression = undefined;
+    this.utilisation = undefined;
     this.taskChartStore.reset();
   }
 
@@ -33,7 +39,7 @@ export class Cell {
     this.isRemoved = !this.isRemoved;
   }
 
-  setView(view: 'jobs' | 'taskchart' | 'timeline') {
+  setView(view: 'jobs' | 'taskchart' | 'timeline' | 'executors') {
     this.view = view;
     this.isCollapsed = false;
     this.isRemoved = false;
@@ -54,6 +60,36 @@ export class Cell {
     return this.jobs.filter(job => job.status === 'COMPLETED').length;
   }
 
+  /** Jobs whose results were too large or too slow to get to the driver */
+  get driverBottlenecks() {
+    return this.jobs.filter(job => job?.driverBottleneck).map(job => job.driverBottleneck);
+  }
+
+  /** Executors of the applications which ran the jobs of the cell */
+  get executors() {
+    const appIds = new Set(this.jobs.map(job => job?.appId ?? ''));
+    return Object.values(this.notebookStore.executors)
+      .filter(executor => appIds.has(executor.appId))
+      .sort((a, b) => a.executorId.localeCompare(b.executorId, undefined, { numeric: true }));
+  }
+
+  /** Executor alerts raised while the jobs of the cell ran */
+  get executorAlerts() {
+    const jobs = this.jobs.filter(job => job);
+    if (!jobs.length) {
+      return [];
+    }
+    const start = Math.min(...jobs.map(job => job.startTime.getTime()));
+    const end = jobs.some(job => !job.endTime)
+      ? Infinity
+      : Math.max(...jobs.map(job => job.endTime?.getTime() ?? 0));
+    return this.executors.flatMap(executor =>
+      Object.values(executor.alerts).filter(
+        alert => alert.startTime <= end && (alert.active || alert.time >= start)
+      )
+    );
+  }
+
   get numTotalJobs() {
     return this.uniqueJobIds.length;
   }
@@ -0,0 +1,67 @@
+/**
+ * Decoding of the columnar task batches sent by the kernel as binary comm buffers.
+ * Large batches may be compressed by the kernel with one of the codecs announced
+ * by the frontend when opening the comm.
+ */
+
+type TypedArray = Uint8Array | Int32Array | Float64Array;
+
+const typedArrays: {
+  [type: string]: { new (buffer: ArrayBuffer, byteOffset?: number, length?: number): TypedArray; BYTES_PER_ELEMENT: number };
+} = {
+  Uint8Array,
+  Int32Array,
+  Float64Array
+};
+
+export interface TaskBatch {
+  appId?: string;
+  count: number;
+  columns: { [name: string]: TypedArray };
+  strings: string[];
+  errors: { [row: string]: string };
+  forwardTime?: number;
+}
+
+/** Wraps a comm buffer in a typed array without copying when it is aligned */
+function toTypedArray(type: string, buffer: ArrayBuffer | ArrayBufferView): TypedArray {
+  const TypedArrayType = typedArrays[type];
+  const view =
+    buffer instanceof ArrayBuffer ? new Uint8Array(buffer) : new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+  const length = view.byteLength / TypedArrayType.BYTES_PER_ELEMENT;
+  if (view.byteOffset % TypedArrayType.BYTES_PER_ELEMENT === 0) {
+    return new TypedArrayType(view.buffer, view.byteOffset, length);
+  }
+  return new TypedArrayType(view.slice().buffer, 0, length);
+}
+
+/** Codecs this browser can decompress, announced to the kernel */
+export const supportedCodecs: string[] = typeof DecompressionStream !== 'undefined' ? ['deflate'] : [];
+
+async function inflate(buffer: ArrayBuffer | ArrayBufferView): Promise<ArrayBuffer> {
+  const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Response(stream).arrayBuffer();
+}
+
+export async function decodeTaskBatch(data: any, buffers: (ArrayBuffer | ArrayBufferView)[]): Promise<TaskBatch> {
+  if (data.compression) {
+    if (data.compression !== 'deflate') {
+      throw new Error(`SparkMonitor: Unsupported compression ${data.compression}`);
+    }
+    buffers = await Promise.all(
+      buffers.map((buffer, i) => (data.compressed[i] ? inflate(buffer) : Promise.resolve(buffer)))
+    );
+  }
+  const columns: { [name: string]: TypedArray } = {};
+  data.columns.forEach((column: { name: string; type: string }, i: number) => {
+    columns[column.name] = toTypedArray(column.type, buffers[i]);
+  });
+  return {
+    appId: data.appId,
+    count: data.count,
+    columns,
+    strings: data.strings,
+    errors: data.errors || {},
+    forwardTime: data.forwardTime
+  };
+}
@@ -0,0 +1,50 @@
+/**
+ * Measures how long after the kernel forwarded a message it was rendered,
+ * and periodically reports the samples back to the kernel over the comm.
+ */
+export class LatencyReporter {
+  private pendingForwardTimes: number[] = [];
+  private samples: number[] = [];
+  private frameRequested = false;
+  private lastReport = Date.now();
+
+  /** Maximum number of samples sent in one report */
+  maxSamples = 200;
+  /** Minimum interval between two reports in ms */
+  reportInterval = 2000;
+
+  constructor(private send: (data: any) => void) {}
+
+  /** Called for each message received from the kernel */
+  onMessage(data: any) {
+    if (typeof data.forwardTime !== 'number') {
+      return;
+    }
+    this.pendingForwardTimes.push(data.forwardTime);
+    if (!this.frameRequested) {
+      // All stores are updated synchronously, the DOM is painted before the next frame
+      this.frameRequested = true;
+      requestAnimationFrame(() => this.onFrame());
+    }
+  }
+
+  private onFrame() {
+    this.frameRequested = false;
+    const now = Date.now();
+    this.pendingForwardTimes.forEach(forwardTime => {
+      if (this.samples.length < this.maxSamples) {
+        this.samples.push(now - forwardTime);
+      }
+    });
+    this.pendingForwardTimes = [];
+    if (now - this.lastReport >= this.reportInterval) {
+      this.lastReport = now;
+      try {
+        this.send({ msgtype: 'renderLatency', samples: this.samples });
+      } catch (e) {
+        console.warn('SparkMonitor: Could not report render latency', e);
+      }
+      this.samples = [];
+    }
+  }
+}
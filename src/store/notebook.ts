@@ -1,25 +1,55 @@
 import { makeAutoObservable } from 'mobx';
 import { SparkStage } from './spark-stage';
 import { SparkJob } from './spark-job';
+import { SparkExecutor } from './spark-executor';
 import { Cell } from './cell';
+import type { TaskBatch } from './columnar';
+import type { TaskChartStore } from './task-chart-store';
 
-export class NotebookStore {
+/** State of one Spark application connected to the kernel. */
+export interface SparkApplication {
+  applicationId: string;
+  applicationName?: string;
+  applicationAttemptId?: string;
+  uniqueId: string;
   numExecutors?: number;
   numTotalCores?: number;
+}
+
+export class NotebookStore {
   applicationName?: string;
   applicationId?: string;
   applicationAttemptId?: string;
   uniqueId = 'default-key';
   hideAllDisplays = false;
+  /** Level of detail the kernel requests from the listeners to stay within its CPU budget */
+  governor?: any = undefined;
+
+  /** Several Spark applications can run in one kernel, by appId */
+  applications: { [appId: string]: SparkApplication } = {};
 
   cells: { [cellId: string]: Cell } = {};
   jobs: { [jobId: string]: SparkJob } = {};
   stages: { [stageId: string]: SparkStage } = {};
+  /** Memory samples of the executors, by application and executor id */
+  executors: { [uniqueExecutorId: string]: SparkExecutor } = {};
 
   constructor(public notebookPanelId: string) {
     makeAutoObservable(this);
   }
 
+  /** Views shown by the visible displays of cells that ran Spark jobs */
+  get openViews(): string[] {
+    const views = new Set<string>();
+    for (const cellId in this.cells) {
+      const cell = this.cells[cellId];
+      if (cell.numTotalJobs && !cell.isCollapsed && !cell.isRemoved) {
+        views.add(cell.view);
+      }
+    }
+    return Array.from(views).sort();
+  }
+
   resetNotebook() {
     for (const cellId in this.cells) {
       this.cells[cellId].reset();
@@ -39,11 +69,51 @@ export class NotebookStore {
     this.hideAllDisplays = !this.hideAllDisplays;
   }
 
+  get numExecutors() {
+    const apps = Object.values(this.applications);
+    if (!apps.some(app => app.numExecutors !== undefined)) {
+      return undefined;
+    }
+    return apps.reduce((sum, app) => sum + (app.numExecutors || 0), 0);
+  }
+
+  get numTotalCores() {
+    const apps = Object.values(this.applications);
+    if (!apps.some(app => app.numTotalCores !== undefined)) {
+      return undefined;
+    }
+    return apps.reduce((sum, app) => sum + (app.numTotalCores || 0), 0);
+  }
+
+  /**
+   * Returns the application a message belongs to, creating it if needed.
+   * Messages of listeners without appId share a default application.
+   */
+  private getApplication(data: any): SparkApplication {
+    const appId = data.appId ? String(data.appId) : '';
+    let app = this.applications[appId];
+    if (!app) {
+      app = {
+        applicationId: appId,
+        uniqueId: appId ? `app${appId}` : this.uniqueId
+      };
+      this.applications[appId] = app;
+    }
+    return app;
+  }
+
+  /** Prefix of the unique ids of jobs and stages of a message's application */
+  private appUniqueId(data: any) {
+    return this.getApplication(data).uniqueId;
+  }
+
   onSparkApplicationStart(data: any) {
+    const app = this.getApplication(data);
+    app.applicationName = data.appName;
+    app.applicationAttemptId = data.appAttemptId;
     this.applicationId = data.appId;
     this.applicationName = data.appName;
     this.applicationAttemptId = data.appAttemptId;
-    this.uniqueId = `app${this.applicationId}-attempt${this.applicationAttemptId}`;
   }
 
   private deleteCellData(cellId: string) {
@@ -77,11 +147,14 @@ export class NotebookStore {
   onSparkJobStart(cellId: string, data: any) {
     // These values are set here as previous messages may
     // be missed if reconnecting from a browser reload.
-    this.numTotalCores = data.totalCores;
-    this.numExecutors = data.numExecutors;
+    const app = this.getApplication(data);
+    app.numTotalCores = data.totalCores;
+    app.numExecutors = data.numExecutors;
+    const appUniqueId = app.uniqueId;
 
     const job = new SparkJob(this);
-    job.uniqueId = `${this.uniqueId}-job-${data.jobId}`;
+    job.uniqueId = `${appUniqueId}-job-${data.jobId}`;
+    job.appId = app.applicationId;
     job.jobId = data.jobId;
     job.status = data.status;
     job.cellId = cellId;
@@ -93,10 +166,11 @@ export class NotebookStore {
     job.numTasks = data.numTasks;
 
     data.stageIds.forEach((stageId: string) => {
-      const uniqueStageId = `${this.uniqueId}-stage-${stageId}`;
+      const uniqueStageId = `${appUniqueId}-stage-${stageId}`;
       let stage = this.stages[uniqueStageId];
       if (!stage) {
         stage = new SparkStage();
+        stage.uniqueId = uniqueStageId;
         stage.status = 'PENDING';
         this.stages[uniqueStageId] = stage;
       }
@@ -111,7 +185,7 @@ export class NotebookStore {
 
     if (job.name === 'null') {
       const lastStageId = Math.max.apply(null, data.stageIds);
-      job.name = this.stages[`${this.uniqueId}-stage-${lastStageId}`].name;
+      job.name = this.stages[`${appUniqueId}-stage-${lastStageId}`].name;
     }
 
     if (!this.cells[cellId]) {
@@ -124,7 +198,7 @@ export class NotebookStore {
   }
 
   onSparkJobEnd(data: any) {
-    const uniqueId = `${this.uniqueId}-job-${data.jobId}`;
+    const uniqueId = `${this.appUniqueId(data)}-job-${data.jobId}`;
     const job = this.jobs[uniqueId];
     if (job) {
       job.status = data.status;
@@ -144,7 +218,7 @@ export class NotebookStore {
   onSparkStageSubmitted(cellId: string, data: any) {
     const submissionTime =
       data.submissionTime === -1 ? new Date() : new Date(data.submissionTime);
-    const uniqueStageId = `${this.uniqueId}-stage-${data.stageId}`;
+    const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
     if (!this.stages[uniqueStageId]) {
       this.stages[uniqueStageId] = new SparkStage();
       this.stages[uniqueStageId].uniqueId = uniqueStageId;
@@ -159,7 +233,7 @@ export class NotebookStore {
   }
 
   onSparkStageCompleted(data: any) {
-    const uniqueStageId = `${this.uniqueId}-stage-${data.stageId}`;
+    const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
     const stage = this.stages[uniqueStageId];
     if (stage) {
       stage.status = data.status;
@@ -169,9 +243,14 @@ export class NotebookStore {
       stage.numCompletedTasks = data.numCompletedTasks;
       stage.numFailedTasks = data.numFailedTasks;
       stage.numTasks = data.numTasks;
+      stage.eta = undefined;
+      if (data.throughput) {
+        stage.throughput = data.throughput;
+      }
 
       const job = this.jobs[stage.uniqueJobId];
       if (job) {
+        this.updateJobEta(job, data);
         job.numActiveTasks = 0;
         job.numCompletedTasks = 0;
         job.numFailedTasks = 0;
@@ -192,23 +271,53 @@ export class NotebookStore {
   }
 
   onSparkExecutorAdded(data: any) {
-    this.numTotalCores = data.totalCores;
-    if (!this.numExecutors) {
-      this.numExecutors = 0;
+    const app = this.getApplication(data);
+    app.numTotalCores = data.totalCores;
+    if (!app.numExecutors) {
+      app.numExecutors = 0;
     }
-    this.numExecutors += 1;
+    app.numExecutors += 1;
   }
 
   onSparkExecutorRemoved(data: any) {
-    this.numTotalCores = data.totalCores;
-    if (!this.numExecutors) {
-      this.numExecutors = 0;
+    const app = this.getApplication(data);
+    app.numTotalCores = data.totalCores;
+    if (!app.numExecutors) {
+      app.numExecutors = 0;
     }
-    this.numExecutors -= 1;
+    app.numExecutors -= 1;
+    const executor = this.executors[`${app.uniqueId}-executor-${data.executorId}`];
+    if (executor) {
+      executor.removed = true;
+    }
+  }
+
+  private getExecutor(data: any): SparkExecutor {
+    const app = this.getApplication(data);
+    const uniqueId = `${app.uniqueId}-executor-${data.executorId}`;
+    let executor = this.executors[uniqueId];
+    if (!executor) {
+      executor = new SparkExecutor();
+      executor.uniqueId = uniqueId;
+      executor.appId = app.applicationId;
+      executor.executorId = String(data.executorId);
+      this.executors[uniqueId] = executor;
+    }
+    return executor;
+  }
+
+  /** Memory of an executor from its heartbeats, sampled by the listener */
+  onSparkExecutorMetrics(data: any) {
+    this.getExecutor(data).addSample(data);
+  }
+
+  /** The heap or the GC time of an executor crossed its limit or fell back, sent by the kernel */
+  onExecutorAlert(data: any) {
+    this.getExecutor(data).alerts[data.kind] = data;
   }
 
   onSparkTaskStart(data: any) {
-    const uniqueStageId = `${this.uniqueId}-stage-${data.stageId}`;
+    const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
     const stage = this.stages[uniqueStageId];
     if (stage) {
       const uniqueJobId = stage.uniqueJobId;
@@ -220,7 +329,7 @@ export class NotebookStore {
   }
 
   onSparkTaskEnd(data: any) {
-    const uniqueStageId = `${this.uniqueId}-stage-${data.stageId}`;
+    const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
     const stage = this.stages[uniqueStageId];
     if (stage) {
       const uniqueJobId = stage.uniqueJobId;
@@ -231,17 +340,210 @@ export class NotebookStore {
     }
   }
 
+  private getStageTaskChartStore(uniqueStageId: string): TaskChartStore | undefined {
+    const stage = this.stages[uniqueStageId];
+    return stage ? this.jobs[stage.uniqueJobId]?.cell?.taskChartStore : undefined;
+  }
+
+  /** Columnar batch of task start/end events, read directly from typed arrays */
+  onSparkTaskBatch(batch: TaskBatch) {
+    const appUniqueId = this.appUniqueId(batch);
+    const isEnd = batch.columns['isEnd'];
+    const stageIds = batch.columns['stageId'];
+    const launchTimes = batch.columns['launchTime'];
+    const finishTimes = batch.columns['finishTime'];
+    // Sent by kernels that support task sampling
+    const weights = batch.columns['weight'];
+    let lastStageId = -1;
+    let taskChartStore: TaskChartStore | undefined = undefined;
+    for (let i = 0; i < batch.count; i++) {
+      if (stageIds[i] !== lastStageId) {
+        lastStageId = stageIds[i];
+        taskChartStore = this.getStageTaskChartStore(`${appUniqueId}-stage-${lastStageId}`);
+      }
+      if (!taskChartStore) {
+        continue;
+      }
+      const weight = weights ? weights[i] : 1;
+      if (isEnd[i]) {
+        taskChartStore.onTaskFinished(finishTimes[i], weight);
+      } else {
+        taskChartStore.onTaskLaunched(launchTimes[i], weight);
+      }
+    }
+  }
+
+  /** Completion estimates of the jobs of a stage, sent by the kernel */
+  private updateJobEta(job: SparkJob, data: any) {
+    const eta = data.eta?.jobs?.[job.jobId];
+    if (eta !== undefined) {
+      job.eta = eta || undefined;
+    }
+  }
+
+  /** Cell of a kernel notice about a cell execution, found from its jobs */
+  private getNoticeCell(data: any): Cell | undefined {
+    for (const jobRef of data.jobIds || []) {
+      const job = this.jobs[`${this.appUniqueId(jobRef)}-job-${jobRef.jobId}`];
+      if (job?.cell) {
+        return job.cell;
+      }
+    }
+    return undefined;
+  }
+
+  /** The kernel found a cell execution slower than its previous runs */
+  onRegression(data: any) {
+    const cell = this.getNoticeCell(data);
+    if (cell) {
+      cell.regression = data;
+    }
+  }
+
+  /** Critical path of an ended job and the slack of its stages, sent by the kernel */
+  onCriticalPath(data: any) {
+    const appUniqueId = this.appUniqueId(data);
+    const job = this.jobs[`${appUniqueId}-job-${data.jobId}`];
+    if (!job) {
+      return;
+    }
+    job.bottlenecks = data.bottlenecks;
+    for (const stageData of data.stages || []) {
+      const stage = this.stages[`${appUniqueId}-stage-${stageData.stageId}`];
+      if (stage) {
+        stage.critical = stageData.critical;
+        stage.slack = stageData.slack;
+      }
+    }
+  }
+
+  /** A job sent too much data to the driver, sent by the kernel */
+  onDriverBottleneck(data: any) {
+    const job = this.jobs[`${this.appUniqueId(data)}-job-${data.jobId}`];
+    if (job) {
+      job.driverBottleneck = data;
+    }
+  }
+
+  /** The kernel changed the listener detail to stay within its CPU budget */
+  onGovernor(data: any) {
+    this.governor = data;
+  }
+
+  /** Core time allocated to and used by a cell execution, sent by the kernel */
+  onUtilisation(data: any) {
+    const cell = this.getNoticeCell(data);
+    if (cell) {
+      cell.utilisation = data;
+    }
+  }
+
+  /**
+   * Restores the display of a cell from the summary saved in its output,
+   * when a notebook is reopened and no events are replayed.
+   */
+  onCellSummary(cellId: string, summary: any) {
+    this.deleteCellData(cellId);
+    const cell = new Cell(cellId, this);
+    this.cells[cellId] = cell;
+
+    for (const appSummary of summary.applications || []) {
+      const app = this.getApplication(appSummary);
+      app.applicationName = app.applicationName || appSummary.appName;
+      app.applicationAttemptId = app.applicationAttemptId || appSummary.appAttemptId;
+      app.numExecutors = app.numExecutors ?? appSummary.numExecutors;
+      app.numTotalCores = app.numTotalCores ?? appSummary.totalCores;
+    }
+
+    for (const data of summary.stages || []) {
+      const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
+      const stage = new SparkStage();
+      stage.uniqueId = uniqueStageId;
+      stage.cellId = cellId;
+      stage.stageId = data.stageId;
+      stage.status = data.status;
+      stage.name = String(data.name).split(' ')[0];
+      if (data.submissionTime) {
+        stage.submissionTime = new Date(data.submissionTime);
+      }
+      if (data.completionTime) {
+        stage.completionTime = new Date(data.completionTime);
+      }
+      stage.numTasks = data.numTasks;
+      stage.numCompletedTasks = data.numCompletedTasks;
+      stage.numFailedTasks = data.numFailedTasks;
+      stage.throughput = data.throughput;
+      this.stages[uniqueStageId] = stage;
+    }
+
+    for (const data of summary.jobs || []) {
+      const appUniqueId = this.appUniqueId(data);
+      const job = new SparkJob(this);
+      job.uniqueId = `${appUniqueId}-job-${data.jobId}`;
+      job.appId = data.appId ? String(data.appId) : '';
+      job.jobId = data.jobId;
+      job.status = data.status;
+      job.cellId = cellId;
+      job.name = String(data.name).split(' ')[0];
+      job.startTime = new Date(data.submissionTime);
+      if (data.completionTime) {
+        job.endTime = new Date(data.completionTime);
+      }
+      job.stageIds = data.stageIds;
+      job.numStages = data.stageIds.length;
+      job.numTasks = data.numTasks;
+      job.numCompletedTasks = data.numCompletedTasks;
+      job.numFailedTasks = data.numFailedTasks;
+      data.stageIds.forEach((stageId: string) => {
+        const uniqueStageId = `${appUniqueId}-stage-${stageId}`;
+        if (this.stages[uniqueStageId]) {
+          this.stages[uniqueStageId].uniqueJobId = job.uniqueId;
+          job.uniqueStageIds.push(uniqueStageId);
+        }
+      });
+      if (job.name === 'null' && data.stageIds.length) {
+        const lastStageId = Math.max.apply(null, data.stageIds);
+        job.name = this.stages[`${appUniqueId}-stage-${lastStageId}`]?.name || job.name;
+      }
+      job.cell = cell;
+      cell.uniqueJobIds.push(job.uniqueId);
+      this.jobs[job.uniqueId] = job;
+    }
+
+    for (const data of summary.jobs || []) {
+      if (data.criticalPath) {
+        this.onCriticalPath(data.criticalPath);
+      }
+      if (data.driverBottleneck) {
+        this.onDriverBottleneck(data.driverBottleneck);
+      }
+    }
+    cell.taskChartStore.onSummary(summary);
+    cell.regression = summary.regression;
+    cell.utilisation = summary.utilisation;
+  }
+
+  /** Whether a cell has live data, which a summary must not replace */
+  hasCellData(cellId: string) {
+    return !!this.cells[cellId]?.numTotalJobs;
+  }
+
   // Periodic stage updates
   onSparkStageActive(data: any) {
-    const uniqueStageId = `${this.uniqueId}-stage-${data.stageId}`;
+    const uniqueStageId = `${this.appUniqueId(data)}-stage-${data.stageId}`;
     const stage = this.stages[uniqueStageId];
     if (stage && stage.status === 'RUNNING') {
       stage.numActiveTasks = data.numActiveTasks;
       stage.numCompletedTasks = data.numCompletedTasks;
       stage.numFailedTasks = data.numFailedTasks;
+      stage.eta = data.eta?.stage || undefined;
+      if (data.throughput) {
+        stage.throughput = data.throughput;
+      }
 
       const job = this.jobs[stage.uniqueJobId];
       if (job) {
+        this.updateJobEta(job, data);
         job.numActiveTasks = 0;
         job.numCompletedTasks = 0;
         job.numFailedTasks = 0;
@@ -0,0 +1,78 @@
+import { makeAutoObservable } from 'mobx';
+
+/** Samples kept per executor, about 10 minutes at the default listener rate */
+const MAX_SAMPLES = 120;
+
+/** Peak memory of an executor since its previous sample, in bytes, and its GC time in ms */
+export interface IExecutorMemorySample {
+  time: number;
+  heapMemory: number;
+  maxHeapMemory: number;
+  offHeapMemory: number;
+  executionMemory: number;
+  storageMemory: number;
+  /** Memory shared by execution and storage */
+  maxMemory: number;
+  /** Total GC time of the executor */
+  gcTime: number;
+  /** Fraction of the time spent in GC since the previous sample */
+  gcFraction?: number;
+}
+
+/** Alert of the kernel about the heap or the GC time of an executor */
+export interface IExecutorAlert {
+  appId: string;
+  executorId: string;
+  kind: 'heap' | 'gc';
+  active: boolean;
+  startTime: number;
+  time: number;
+  heapFraction: number | null;
+  gcFraction: number | null;
+  limit: number;
+}
+
+export class SparkExecutor {
+  uniqueId!: string;
+  appId!: string;
+  executorId!: string;
+  removed = false;
+  samples: IExecutorMemorySample[] = [];
+  /** Alerts by kind, kept once ended so that the cells which ran meanwhile show them */
+  alerts: { [kind: string]: IExecutorAlert } = {};
+
+  constructor() {
+    makeAutoObservable(this);
+  }
+
+  get latest(): IExecutorMemorySample | undefined {
+    return this.samples[this.samples.length - 1];
+  }
+
+  get activeAlerts() {
+    return Object.values(this.alerts).filter(alert => alert.active);
+  }
+
+  addSample(data: any) {
+    const previous = this.latest;
+    const gcTime = (data.minorGCTime || 0) + (data.majorGCTime || 0);
+    this.samples.push({
+      time: data.time,
+      heapMemory: data.jvmHeapMemory || 0,
+      maxHeapMemory: data.maxHeapMemory || 0,
+      offHeapMemory: data.jvmOffHeapMemory || 0,
+      executionMemory: (data.onHeapExecutionMemory || 0) + (data.offHeapExecutionMemory || 0),
+      storageMemory: (data.onHeapStorageMemory || 0) + (data.offHeapStorageMemory || 0),
+      maxMemory: data.maxMemory || 0,
+      gcTime,
+      gcFraction:
+        previous && data.time > previous.time
+          ? Math.max(0, gcTime - previous.gcTime) / (data.time - previous.time)
+          : undefined
+    });
+    if (this.samples.length > MAX_SAMPLES) {
+      this.samples.splice(0, this.samples.length - MAX_SAMPLES);
+    }
+    this.removed = false;
+  }
+}
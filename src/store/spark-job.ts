@@ -3,8 +3,16 @@ import { makeAutoObservable } from 'mobx';
 import type { Cell } from './cell';
 import type { NotebookStore } from './notebook';
 
+export interface IEta {
+  remaining: number;
+  low: number;
+  high: number;
+  completionTime: number;
+}
+
 export class SparkJob {
   uniqueId!: string;
+  appId?: string;
   cellId!: string;
   jobId!: string;
   status: 'RUNNING' | 'COMPLETED' | 'FAILED' = 'RUNNING';
@@ -21,6 +29,15 @@ export class SparkJob {
   numCompletedTasks = 0;
   numFailedTasks = 0;
 
+  /** Estimated time left in ms, with a confidence interval, sent by the kernel */
+  eta?: IEta;
+
+  /** Longest stages of the critical path of the ended job, sent by the kernel */
+  bottlenecks?: Array<{ stageId: number; name: string; duration: number; share: number }>;
+
+  /** Results of the job too large or too slow to get to the driver, sent by the kernel */
+  driverBottleneck?: any;
+
   cell?: Cell;
 
   get numActiveStages() {
@@ -1,5 +1,32 @@
 import { makeAutoObservable } from 'mobx';
 
+import type { IEta } from './spark-job';
+
+export interface IThroughputKind {
+  bytes: number;
+  records: number;
+  /** Per second of the stage, null before it has lasted */
+  bytesPerSecond: number | null;
+  recordsPerSecond?: number | null;
+  /** Per second of its tasks, the throughput of one task */
+  bytesPerTaskSecond?: number | null;
+}
+
+export interface IThroughput {
+  input: IThroughputKind;
+  output: IThroughputKind;
+  shuffleRead: IThroughputKind;
+  shuffleWrite: IThroughputKind;
+  /** Bytes read and written by each executor, not kept in saved notebooks */
+  executors?: {
+    [executorId: string]: {
+      bytesRead: number;
+      bytesWritten: number;
+      bytesPerTaskSecond: number | null;
+    };
+  };
+}
+
 export class SparkStage {
   uniqueId!: string;
   uniqueJobId!: string;
@@ -20,6 +47,13 @@ export class SparkStage {
   numFailedTasks = 0;
   submissionTime!: Date;
   completionTime?: Date;
+  /** Estimated time left in ms, with a confidence interval, sent by the kernel */
+  eta?: IEta;
+  /** Whether the stage set the duration of its job, and how long it could have been delayed in ms */
+  critical = false;
+  slack?: number;
+  /** Bytes and records read and written and their rates, computed by the kernel from the task summary */
+  throughput?: IThroughput;
 
   constructor() {
     makeAutoObservable(this);
@@ -9,6 +9,8 @@ export class TaskChartStore {
   taskDataX: Array<number> = [];
   taskDataY: Array<number> = [];
   numActiveTasks = 0;
+  /** True once sampled task events were received, counts are then estimates */
+  sampled = false;
 
   constructor(private notebookStore: NotebookStore) {}
   reset() {
@@ -20,6 +22,7 @@ export class TaskChartStore {
     this.taskDataX = [];
     this.taskDataY = [];
     this.numActiveTasks = 0;
+    this.sampled = false;
   }
 
   addExecutorData(time: number, numCores: number) {
@@ -52,15 +55,52 @@ export class TaskChartStore {
     this.jobDataText.push(`Job ${data.jobId} ended`);
   }
 
+  /** Rebuilds the chart from the downsampled series of a cell summary */
+  onSummary(summary: any) {
+    this.reset();
+    for (const job of summary.jobs || []) {
+      if (job.submissionTime) {
+        this.jobDataX.push(job.submissionTime);
+        this.jobDataY.push(0);
+        this.jobDataText.push(`Job ${job.jobId} started`);
+      }
+      if (job.completionTime) {
+        this.jobDataX.push(job.completionTime);
+        this.jobDataY.push(0);
+        this.jobDataText.push(`Job ${job.jobId} ended`);
+      }
+    }
+    const series = summary.taskSeries;
+    if (series) {
+      this.taskDataX = series.time.slice();
+      this.taskDataY = series.numActiveTasks.slice();
+      this.executorDataX = series.time.slice();
+      this.executorDataY = series.numCores.slice();
+    }
+  }
+
   onSparkTaskStart(data: any) {
-    this.addTaskData(data.launchTime, this.numActiveTasks);
-    this.numActiveTasks += 1;
-    this.addTaskData(data.launchTime, this.numActiveTasks);
+    this.onTaskLaunched(data.launchTime, data.weight || data.sampleWeight || 1);
   }
 
   onSparkTaskEnd(data: any) {
-    this.addTaskData(data.finishTime, this.numActiveTasks);
-    this.numActiveTasks -= 1;
-    this.addTaskData(data.finishTime, this.numActiveTasks);
+    this.onTaskFinished(data.finishTime, data.weight || data.sampleWeight || 1);
+  }
+
+  /**
+   * When task events are sampled, each event stands for `weight` tasks
+   * so that the number of active tasks remains an unbiased estimate.
+   */
+  onTaskLaunched(launchTime: number, weight = 1) {
+    this.addTaskData(launchTime, this.numActiveTasks);
+    this.numActiveTasks += weight;
+    this.sampled = this.sampled || weight !== 1;
+    this.addTaskData(launchTime, this.numActiveTasks);
+  }
+
+  onTaskFinished(finishTime: number, weight = 1) {
+    this.addTaskData(finishTime, this.numActiveTasks);
+    this.numActiveTasks = Math.max(0, this.numActiveTasks - weight);
+    this.addTaskData(finishTime, this.numActiveTasks);
   }
 }
@@ -0,0 +1,31 @@
+import { reaction, IReactionDisposer } from 'mobx';
+
+import type { NotebookStore } from './notebook';
+
+/**
+ * Reports the views shown by the cell displays to the kernel over the comm,
+ * so that the kernel only asks the Spark listener for the detail that is
+ * looked at: task records are only needed by an open task chart.
+ */
+export class ViewReporter {
+  private disposer: IReactionDisposer;
+
+  constructor(
+    private notebookStore: NotebookStore,
+    private send: (data: any) => void
+  ) {
+    this.disposer = reaction(
+      () => this.notebookStore.openViews.join(','),
+      () => this.report()
+    );
+  }
+
+  /** Send the open views, also called when a new comm is opened */
+  report() {
+    this.send({ msgtype: 'views', views: this.notebookStore.openViews });
+  }
+
+  dispose() {
+    this.disposer();
+  }
+}
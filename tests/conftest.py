@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+import pytest
+
+
+class Kernel:
+    """A ScalaMonitor fed listener messages without sockets, frontends or IPython"""
+
+    def __init__(self, kernelextension, monitor):
+        self.ke = kernelextension
+        self.monitor = monitor
+        self.server = kernelextension.SocketThread(monitor)
+        monitor.scalaSocket = self.server
+        self.connection = kernelextension.ListenerConnection(self.server, None)
+        self.displayed = []
+
+    def receive(self, data):
+        self.server.onrecv(json.dumps(data), self.connection)
+
+    def flush(self):
+        self.server.flush(self.connection)
+
+    def sent(self):
+        """Messages published to the frontend comms"""
+        return [msg for msg, _, _ in self.monitor.fanout.ring]
+
+
+@pytest.fixture
+def kernel(monkeypatch):
+    monkeypatch.setenv('SPARKMONITOR_HISTORY_FILE', '')
+    from sparkmonitor import kernelextension
+    monkeypatch.setattr(kernelextension, 'logger', logging.getLogger('sparkmonitor.tests'),
+                        raising=False)
+    monkeypatch.setattr(kernelextension, 'run_id', None, raising=False)
+    monitor = kernelextension.ScalaMonitor(None)
+    monkeypatch.setattr(kernelextension, 'monitor', monitor, raising=False)
+    kernel = Kernel(kernelextension, monitor)
+    monkeypatch.setattr(kernelextension, 'display',
+                        lambda data, **kwargs: kernel.displayed.append(
+                            data['application/vnd.sparkmonitor+json']))
+    return kernel
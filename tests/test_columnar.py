@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import math
+import sys
+from array import array
+
+from sparkmonitor.columnar import METRIC_COLUMNS, STRING_COLUMNS, TASK_COLUMNS, TaskBatch
+
+TYPECODES = {'Uint8Array': 'B', 'Int32Array': 'i', 'Float64Array': 'd'}
+
+
+def unpack(msg, buffers):
+    """Decode a packed batch into one dict per task, as the frontends do"""
+    columns = {}
+    for column, buf in zip(msg['columns'], buffers):
+        values = array(TYPECODES[column['type']])
+        values.frombytes(buf)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        columns[column['name']] = list(values)
+    tasks = []
+    for i in range(msg['count']):
+        task = dict((name, values[i]) for name, values in columns.items())
+        for name in msg['stringColumns']:
+            task[name] = msg['strings'][task[name]]
+        tasks.append(task)
+    return tasks
+
+
+def task(msgtype, taskId, **fields):
+    data = {
+        'msgtype': msgtype, 'taskId': taskId, 'stageId': 3, 'stageAttemptId': 0,
+        'index': taskId, 'attemptNumber': 0, 'launchTime': 1700000000123,
+        'executorId': '1', 'host': 'worker-1', 'status': 'RUNNING', 'taskType': 'ResultTask',
+    }
+    data.update(fields)
+    return data
+
+
+def test_round_trip():
+    batch = TaskBatch()
+    batch.add(task('sparkTaskStart', 7))
+    batch.add(task('sparkTaskEnd', 7, finishTime=1700000000456, status='SUCCESS', weight=10,
+                   metrics={'executorComputingTime': 300, 'resultSize': 2048}))
+    batch.add(task('sparkTaskEnd', 8, executorId='2', status='FAILED', errorMessage='boom'))
+    msg, buffers = batch.pack()
+
+    assert msg['msgtype'] == 'taskbatch'
+    assert len(buffers) == len(TASK_COLUMNS) + len(STRING_COLUMNS) + len(METRIC_COLUMNS)
+    start, end, failed = unpack(msg, buffers)
+    assert start['isEnd'] == 0 and end['isEnd'] == 1
+    assert start['taskId'] == 7 and failed['taskId'] == 8
+    # Millisecond timestamps are exact in float64
+    assert end['launchTime'] == 1700000000123 and end['finishTime'] == 1700000000456
+    assert start['weight'] == 1 and end['weight'] == 10
+    assert end['status'] == 'SUCCESS' and failed['executorId'] == '2'
+    assert end['executorComputingTime'] == 300 and end['resultSize'] == 2048
+    assert math.isnan(start['executorComputingTime'])
+    assert msg['errors'] == {2: 'boom'}
+
+
+def test_strings_are_interned():
+    batch = TaskBatch()
+    for taskId in range(100):
+        batch.add(task('sparkTaskEnd', taskId, status='SUCCESS'))
+    msg, _ = batch.pack()
+    assert sorted(msg['strings']) == sorted(['1', 'worker-1', 'SUCCESS', 'ResultTask'])
+
+
+def test_reset():
+    batch = TaskBatch()
+    batch.add(task('sparkTaskStart', 1))
+    batch.reset()
+    assert len(batch) == 0
+    msg, buffers = batch.pack()
+    assert msg['count'] == 0 and not any(buffers)
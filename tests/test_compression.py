@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+
+import pytest
+
+from sparkmonitor import compression
+from sparkmonitor.compression import choose_codec, compress_buffers
+
+
+def test_choose_codec():
+    assert choose_codec(None) is None
+    assert choose_codec(['deflate']) == 'deflate'
+    assert choose_codec(['lz4', 'deflate']) == ('lz4' if compression.lz4_imported else 'deflate')
+
+
+def test_deflate_round_trip():
+    buffers = [bytes(bytearray(range(256))) * 512, b'\x00' * 65536]
+    msg = {}
+    packed = compress_buffers(msg, list(buffers), 'deflate', threshold=1024)
+    assert msg['compression'] == 'deflate'
+    assert msg['compressed'] == [True, True]
+    assert [zlib.decompress(b) for b in packed] == buffers
+
+
+@pytest.mark.skipif(not compression.lz4_imported, reason='lz4 is not installed')
+def test_lz4_round_trip():
+    import lz4.frame
+    buffers = [b'task' * 20000]
+    msg = {}
+    packed = compress_buffers(msg, list(buffers), 'lz4', threshold=1024)
+    assert msg['compression'] == 'lz4'
+    assert [lz4.frame.decompress(b) for b in packed] == buffers
+
+
+def test_small_payloads_are_not_compressed():
+    msg = {}
+    buffers = [b'\x00' * 100]
+    assert compress_buffers(msg, buffers, 'deflate', threshold=1024) is buffers
+    assert 'compression' not in msg
+
+
+def test_incompressible_buffers_are_sent_as_they_are():
+    noise = os.urandom(65536)
+    zeros = b'\x00' * 65536
+    msg = {}
+    packed = compress_buffers(msg, [noise, zeros], 'deflate', threshold=1024)
+    assert msg['compressed'] == [False, True]
+    assert packed[0] == noise and zlib.decompress(packed[1]) == zeros
+
+    msg = {}
+    assert compress_buffers(msg, [noise], 'deflate', threshold=1024) == [noise]
+    assert 'compression' not in msg
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sparkmonitor.control import ListenerControl
+
+
+@pytest.fixture
+def control():
+    sent = []
+    control = ListenerControl(sent.append)
+    control.messages = sent
+    return control
+
+
+def test_task_records_follow_the_views(control):
+    control.on_views('client', ['jobtable'])
+    assert control.options()['taskDetail'] == 'aggregate'
+    control.on_views('client', ['jobtable', 'taskchart'])
+    assert control.options()['taskDetail'] == 'full'
+    control.forget_client('client')
+    assert control.messages[-1] == {'msgtype': 'control', 'taskDetail': 'full'}
+
+
+def test_kernel_consumers_keep_the_task_records(control):
+    control.on_views('client', ['jobtable'])
+    control.set_task_consumer('session', True)
+    assert control.options()['taskDetail'] == 'full'
+    control.set_task_consumer('tracing', True)
+    control.set_task_consumer('session', False)
+    assert control.options()['taskDetail'] == 'full'
+    control.set_task_consumer('tracing', False)
+    assert control.options()['taskDetail'] == 'aggregate'
+    assert [msg['taskDetail'] for msg in control.messages] == ['aggregate', 'full', 'aggregate']
+
+
+def test_governor_and_api_take_precedence(control):
+    control.set_task_consumer('events', True)
+    control.set_governed({'taskDetail': 'aggregate'})
+    assert control.options()['taskDetail'] == 'aggregate'
+    control.set_options(taskDetail='full')
+    assert control.options()['taskDetail'] == 'full'
+    with pytest.raises(ValueError):
+        control.set_options(taskDetail='some')
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sparkmonitor.eta import EtaEstimator, RunningStats
+
+
+def test_running_stats():
+    stats = RunningStats()
+    for value in (2, 4, 4, 4, 5, 5, 7, 9):
+        stats.add(value)
+    assert stats.mean == 5
+    assert stats.std == pytest.approx(2)
+
+
+def test_weighted_running_stats():
+    weighted = RunningStats()
+    weighted.add(1, 3)
+    weighted.add(5, 1)
+    repeated = RunningStats()
+    for value in (1, 1, 1, 5):
+        repeated.add(value)
+    assert weighted.mean == pytest.approx(repeated.mean)
+    assert weighted.std == pytest.approx(repeated.std)
+
+
+def stage_active(completed, active=0):
+    return {'msgtype': 'sparkStageActive', 'stageId': 0, 'stageAttemptId': 0, 'numTasks': 10,
+            'numCompletedTasks': completed, 'numActiveTasks': active, 'jobIds': [0]}
+
+
+def test_stage_and_job_estimates():
+    eta = EtaEstimator()
+    eta.on_message({'msgtype': 'sparkExecutorAdded', 'totalCores': 2}, 'app')
+    eta.on_message({'msgtype': 'sparkJobStart', 'jobId': 0,
+                    'stageInfos': {'0': {'numTasks': 10, 'completionTime': -1}}}, 'app')
+    eta.on_message({'msgtype': 'sparkStageSubmitted', 'stageId': 0, 'stageAttemptId': 0,
+                    'numTasks': 10, 'jobIds': [0]}, 'app')
+    assert eta.on_message(stage_active(0), 'app')['stage'] is None
+    for taskId in range(4):
+        eta.on_message({'msgtype': 'sparkTaskEnd', 'stageId': 0, 'launchTime': 0,
+                        'finishTime': 1000}, 'app')
+
+    estimates = eta.on_message(stage_active(4), 'app')
+    # 6 tasks of 1 s left on 2 cores, every task took 1 s so there is no spread
+    assert estimates['stage']['remaining'] == pytest.approx(3000)
+    assert estimates['stage']['low'] == estimates['stage']['high'] == pytest.approx(3000)
+    assert estimates['jobs'][0]['remaining'] == pytest.approx(3000)
+
+    estimates = eta.on_message({'msgtype': 'sparkStageCompleted', 'stageId': 0,
+                                'stageAttemptId': 0}, 'app')
+    assert estimates['stage'] is None
+    assert estimates['jobs'][0]['remaining'] == 0
+
+
+def test_sampled_task_weights():
+    eta = EtaEstimator()
+    eta.on_message({'msgtype': 'sparkTaskEnd', 'stageId': 0, 'launchTime': 0,
+                    'finishTime': 1000, 'weight': 3}, 'app')
+    eta.on_message({'msgtype': 'sparkTaskEnd', 'stageId': 0, 'launchTime': 0,
+                    'finishTime': 5000}, 'app')
+    assert eta.stages[('app', 0)].durations.mean == pytest.approx(2000)
+
+
+def test_aggregate_detail_uses_duration_sum():
+    eta = EtaEstimator()
+    data = stage_active(5)
+    data['taskDurationSum'] = 10000
+    estimate = eta.on_message(data, 'app')['stage']
+    # 5 tasks of 2 s left on a single slot
+    assert estimate['remaining'] == pytest.approx(10000)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from sparkmonitor.events import EventDispatcher
+from sparkmonitor.stats import Metrics
+
+
+def stage(stageId, status='COMPLETED'):
+    return {'msgtype': 'sparkStageCompleted', 'stageId': stageId, 'status': status}
+
+
+class Recorder:
+    """A callback recording the events"""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+
+def drain(dispatcher):
+    """Wait for the events queued so far to be handled"""
+    dispatcher.executor.submit(lambda: None).result()
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = EventDispatcher(Metrics(), cellOf=lambda runId: 'cell-' + runId)
+    yield dispatcher
+    dispatcher.executor.shutdown()
+
+
+def test_subscribe_and_unsubscribe(dispatcher):
+    recorder = Recorder()
+    subscription = dispatcher.subscribe('stageCompleted', recorder)
+    dispatcher.dispatch(stage(1), 'app', 'run')
+    dispatcher.dispatch({'msgtype': 'sparkJobEnd', 'jobId': 0}, 'app', 'run')
+    drain(dispatcher)
+    [event] = recorder.events
+    assert event.type == 'stageCompleted'
+    assert (event.stageId, event['status'], event.get('missing', 0)) == (1, 'COMPLETED', 0)
+    assert (event.appId, event.runId, event.cellId) == ('app', 'run', 'cell-run')
+
+    subscription.cancel()
+    dispatcher.dispatch(stage(2), 'app', 'run')
+    drain(dispatcher)
+    assert len(recorder.events) == 1
+    assert dispatcher.subscriptions == {}
+    assert dispatcher.dispatched.value == 1
+
+
+def test_events_are_copies(dispatcher):
+    recorder = Recorder()
+    dispatcher.subscribe('stageCompleted', recorder)
+    data = stage(1)
+    dispatcher.dispatch(data, 'app')
+    data['weight'] = 10
+    drain(dispatcher)
+    assert 'weight' not in recorder.events[0].data
+
+
+def test_filters(dispatcher):
+    by_fields = Recorder()
+    by_function = Recorder()
+    dispatcher.subscribe('sparkStageCompleted', by_fields,
+                         filter={'status': 'FAILED', 'appId': 'app'})
+    dispatcher.subscribe('stageCompleted', by_function, filter=lambda event: event.stageId > 1)
+    dispatcher.dispatch(stage(1, 'FAILED'), 'app')
+    dispatcher.dispatch(stage(2, 'FAILED'), 'other')
+    dispatcher.dispatch(stage(3), 'app')
+    drain(dispatcher)
+    assert [e.stageId for e in by_fields.events] == [1]
+    assert [e.stageId for e in by_function.events] == [2, 3]
+
+
+def test_callback_exceptions_are_counted(dispatcher):
+    recorder = Recorder()
+
+    def fail(event):
+        raise ValueError('boom')
+
+    dispatcher.subscribe('stageCompleted', fail)
+    dispatcher.subscribe('stageCompleted', recorder)
+    dispatcher.dispatch(stage(1), 'app')
+    drain(dispatcher)
+    # The next callbacks still run
+    assert len(recorder.events) == 1
+    assert dispatcher.failed.value == 1
+    assert dispatcher.pending == 0
+
+
+def test_invalid_subscriptions(dispatcher):
+    with pytest.raises(ValueError):
+        dispatcher.subscribe('stageDone', print)
+    with pytest.raises(TypeError):
+        dispatcher.subscribe('stageCompleted', None)
+    with pytest.raises(TypeError):
+        dispatcher.subscribe('stageCompleted', print, filter='COMPLETED')
+
+
+def test_events_are_dropped_when_callbacks_fall_behind():
+    dispatcher = EventDispatcher(Metrics(), maxPending=1)
+    release = threading.Event()
+    dispatcher.subscribe('stageCompleted', lambda event: release.wait(5))
+    dispatcher.dispatch(stage(1))
+    dispatcher.dispatch(stage(2))
+    release.set()
+    dispatcher.executor.shutdown()
+    assert dispatcher.dropped.value == 1
+
+
+def test_task_subscriptions_are_reported():
+    reported = []
+    dispatcher = EventDispatcher(Metrics(), onTaskSubscriptions=reported.append)
+    start = dispatcher.subscribe('taskStart', print)
+    dispatcher.subscribe('stageCompleted', print)
+    end = dispatcher.subscribe('taskEnd', print)
+    start.cancel()
+    end.cancel()
+    assert reported == [True, True, True, False]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from sparkmonitor.fanout import FanOut, Subscriber, state_key
+from sparkmonitor.stats import Metrics
+
+
+def publish(fanout, data, appId='app'):
+    key, keep = state_key(data, appId)
+    fanout.publish(data, key=key, keep=keep)
+
+
+def reader(fanout, cursor=0, codecs=()):
+    """A subscriber read directly, without its sender thread"""
+    return Subscriber(fanout, None, codecs, cursor)
+
+
+def test_state_key():
+    assert state_key({'msgtype': 'sparkJobStart', 'jobId': 1}, 'app') == \
+        (('sparkJobStart', 'app', 1), True)
+    assert state_key({'msgtype': 'sparkStageActive', 'stageId': 2, 'stageAttemptId': 0}) == \
+        (('stageStatus', None, 2, 0), True)
+    assert state_key({'msgtype': 'sparkExecutorRemoved', 'executorId': '1'}, 'app') == \
+        (('executor', 'app', '1'), False)
+    assert state_key({'msgtype': 'sparkTaskEnd'}) == (None, False)
+
+
+def test_read_in_order():
+    fanout = FanOut(Metrics(), capacity=10)
+    subscriber = reader(fanout)
+    for i in range(3):
+        fanout.publish({'i': i})
+    assert [msg['i'] for msg, _, _ in fanout.read(subscriber)] == [0, 1, 2]
+    assert subscriber.cursor == 3
+
+
+def test_ring_is_bounded():
+    fanout = FanOut(Metrics(), capacity=4)
+    for i in range(10):
+        fanout.publish({'i': i}, buffers=[b'x' * 10])
+    assert len(fanout.ring) == 4
+    assert fanout.start == 6 and fanout.end == 10
+    assert fanout.bytes == 40
+
+
+def test_ring_is_bounded_by_bytes():
+    fanout = FanOut(Metrics(), capacity=100, maxBytes=25)
+    for i in range(10):
+        fanout.publish({'i': i}, buffers=[b'x' * 10])
+    assert len(fanout.ring) == 2
+
+
+def test_snapshot_of_overwritten_messages():
+    fanout = FanOut(Metrics(), capacity=3)
+    subscriber = reader(fanout)
+    publish(fanout, {'msgtype': 'sparkApplicationStart'})
+    publish(fanout, {'msgtype': 'sparkExecutorAdded', 'executorId': '1'})
+    publish(fanout, {'msgtype': 'sparkJobStart', 'jobId': 0, 'status': 'RUNNING'})
+    publish(fanout, {'msgtype': 'sparkExecutorRemoved', 'executorId': '1'})
+    publish(fanout, {'msgtype': 'sparkTaskEnd', 'taskId': 1})
+    publish(fanout, {'msgtype': 'sparkJobStart', 'jobId': 0, 'status': 'SUCCEEDED'})
+
+    snapshot = [msg for msg, _, _ in fanout.read(subscriber)]
+    # Latest message of each state in the order they were sent, ended states and tasks left out
+    assert snapshot == [
+        {'msgtype': 'sparkApplicationStart'},
+        {'msgtype': 'sparkJobStart', 'jobId': 0, 'status': 'SUCCEEDED'},
+    ]
+    assert subscriber.cursor == fanout.end
+    assert fanout.dropped.value == 3
+    publish(fanout, {'msgtype': 'sparkApplicationEnd'})
+    assert [msg for msg, _, _ in fanout.read(subscriber)] == [{'msgtype': 'sparkApplicationEnd'}]
+
+
+def test_late_subscriber_reads_from_the_start():
+    fanout = FanOut(Metrics(), capacity=10)
+    fanout.publish({'i': 0})
+    fanout.publish({'i': 1})
+    subscriber = reader(fanout, cursor=fanout.start)
+    assert len(fanout.read(subscriber)) == 2
+    assert fanout.lag() == 0
+
+
+def test_compressed_messages_need_the_codec():
+    fanout = FanOut(Metrics())
+    assert reader(fanout, codecs=['deflate']).accepts({'compression': 'deflate'})
+    assert not reader(fanout).accepts({'compression': 'deflate'})
+    assert reader(fanout).accepts({})
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sparkmonitor import governor
+from sparkmonitor.governor import LEVELS, CpuGovernor
+from sparkmonitor.stats import Metrics
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(governor.time, 'monotonic', clock)
+    return clock
+
+
+def make_governor():
+    applied = []
+    notified = []
+    cpu = CpuGovernor(applied.append, Metrics(), notified.append, budget=0.05, window=5)
+    return cpu, applied, notified
+
+
+def window(cpu, clock, seconds):
+    """Account the CPU time of a window and close it"""
+    cpu.account(seconds)
+    clock.now += 5
+    cpu.account(0.0)
+
+
+def test_steps_down_over_budget(clock):
+    cpu, applied, notified = make_governor()
+    window(cpu, clock, 1.0)
+    assert cpu.level == 1 and applied == [LEVELS[1][1]]
+    window(cpu, clock, 1.0)
+    assert cpu.level == 2 and applied[-1] == LEVELS[2][1]
+    window(cpu, clock, 1.0)
+    assert cpu.level == 2 and len(applied) == 2
+    assert [state['detail'] for state in notified] == ['sampled', 'aggregate']
+
+
+def test_idle_windows_restore_the_detail(clock):
+    cpu, applied, _ = make_governor()
+    window(cpu, clock, 1.0)
+    assert cpu.level == 1
+    # Spark is idle, no thread reports CPU time, the timer closes the windows
+    for _ in range(3):
+        clock.now += 5
+        cpu.account(0.0)
+    assert cpu.level == 0 and applied[-1] == LEVELS[0][1]
+
+
+def test_restore_backs_off_when_flapping(clock):
+    cpu, _, _ = make_governor()
+    window(cpu, clock, 1.0)
+    for _ in range(3):
+        window(cpu, clock, 0.0)
+    assert cpu.level == 0
+    window(cpu, clock, 1.0)
+    assert cpu.level == 1 and cpu.restoreWindows == 6
+
+
+def test_changes_are_applied_in_order(clock):
+    cpu, applied, notified = make_governor()
+    cpu._apply(2, {'level': 2})
+    cpu._apply(1, {'level': 1})
+    assert applied == [LEVELS[2][1]]
+    assert notified == [{'level': 2}]
+
+
+def test_disabled_without_budget(clock):
+    applied = []
+    cpu = CpuGovernor(applied.append, Metrics(), budget=0, window=5)
+    window(cpu, clock, 10.0)
+    assert cpu.level == 0 and applied == []
+    assert cpu.lastFraction == pytest.approx(2.0)
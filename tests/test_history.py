@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from sparkmonitor.history import HistoryStore, RunHistory
+
+
+def stats(wallTime, startTime=0):
+    return {'startTime': startTime, 'wallTime': wallTime, 'numJobs': 1, 'numStages': 1,
+            'numTasks': 10, 'shuffleReadBytes': 0, 'bytesSpilled': 0}
+
+
+def run_cell(history, runId, stageName='count at <ipython-input-1-abc>:3', shuffleRead=100):
+    history.start_run(runId, 'cell')
+    history.on_message({'msgtype': 'sparkJobStart', 'jobId': 0, 'name': 'count',
+                        'stageInfos': {'0': {'name': stageName, 'parentIds': []}}},
+                       runId, 'app')
+    history.on_message({'msgtype': 'sparkStageCompleted', 'stageId': 0, 'numTasks': 10,
+                        'taskSummary': {'shuffleReadBytes': {'sum': shuffleRead}}}, runId, 'app')
+    history.on_message({'msgtype': 'sparkJobEnd', 'jobId': 0}, runId, 'app')
+    history.end_run(runId)
+
+
+def test_round_trip(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history' / 'runs.sqlite'))
+    history = RunHistory(store, notify=lambda notice: None)
+    run_cell(history, 'run-1')
+    # The cell file name and line numbers are left out of the fingerprint
+    run_cell(history, 'run-2', 'count at <ipython-input-7-def>:9')
+    runs = store.runs(history.lastFingerprint)
+    assert len(runs) == 2
+    assert runs[0]['numTasks'] == 10
+    assert runs[0]['shuffleReadBytes'] == 100
+    assert runs[0]['id'] > runs[1]['id']
+
+    # Another store on the same file reads the runs of the previous kernels
+    assert len(HistoryStore(store.path).runs(history.lastFingerprint)) == 2
+
+
+def test_keeps_the_latest_runs(tmp_path):
+    store = HistoryStore(str(tmp_path / 'runs.sqlite'), keep=3)
+    for i in range(5):
+        store.submit(store.insert, 'fingerprint', stats(i))
+    store.submit(store.insert, 'other', stats(10))
+    assert [run['wallTime'] for run in store.runs('fingerprint')] == [4, 3, 2]
+    assert len(store.runs('other')) == 1
+
+
+def test_regression_is_notified(tmp_path):
+    notices = []
+    store = HistoryStore(str(tmp_path / 'runs.sqlite'))
+    history = RunHistory(store, notices.append, minRuns=3)
+    run_cell(history, 'run-0')
+    for i in range(3):
+        store.submit(store.insert, history.lastFingerprint, stats(0))
+    run_cell(history, 'run-1', shuffleRead=10 * 1024 * 1024)
+    store.runs(history.lastFingerprint)  # Waits for the run to be recorded
+    assert len(notices) == 1
+    assert notices[0]['runId'] == 'run-1'
+    assert [r['metric'] for r in notices[0]['regressions']] == ['shuffleReadBytes']
+
+
+def test_unwritable_path(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a directory')
+    store = HistoryStore(str(blocker / 'runs.sqlite'))
+    store.submit(store.insert, 'fingerprint', stats(1)).result()
+    assert store.runs('fingerprint') == []
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import socket
+
+import pytest
+
+import sparkmonitor
+from sparkmonitor import kernelextension
+
+
+def task(msgtype, taskId, stageId=0):
+    return {'msgtype': msgtype, 'appId': 'app', 'stageId': stageId, 'stageAttemptId': 0,
+            'taskId': taskId, 'index': taskId, 'attemptNumber': 0, 'launchTime': 1000,
+            'finishTime': 2000 if msgtype == 'sparkTaskEnd' else 0, 'status': 'SUCCESS',
+            'executorId': '1', 'host': 'h'}
+
+
+def test_tasks_are_batched(kernel):
+    for taskId in range(50):
+        kernel.receive(task('sparkTaskStart', taskId))
+        kernel.receive(task('sparkTaskEnd', taskId))
+    assert kernel.sent() == [] and kernel.displayed == []
+    kernel.flush()
+
+    batches = kernel.sent()
+    assert [msg['msgtype'] for msg in batches] == ['taskbatch']
+    assert batches[0]['count'] == 100
+    # One display update for the VS Code renderer, not one per task
+    assert len(kernel.displayed) == 1
+    assert kernel.displayed[0]['msgtype'] == 'fromscalatasks'
+    assert [t['taskId'] for t in kernel.displayed[0]['tasks'][:4]] == [0, 0, 1, 1]
+
+    kernel.flush()
+    assert len(kernel.sent()) == 1 and len(kernel.displayed) == 1
+
+
+def test_other_messages_flush_the_batch(kernel):
+    kernel.receive(task('sparkTaskStart', 0))
+    kernel.receive({'msgtype': 'sparkStageActive', 'appId': 'app', 'stageId': 0,
+                    'stageAttemptId': 0, 'numTasks': 1})
+    assert [msg['msgtype'] for msg in kernel.sent()] == ['taskbatch', 'fromscala']
+    assert [msg['msgtype'] for msg in kernel.displayed] == ['fromscalatasks', 'fromscala']
+
+
+def test_stage_completed_forgets_the_sampled_stage(kernel):
+    kernel.monitor.sampler.configure(rate=10)
+    kernel.receive({'msgtype': 'sparkStageSubmitted', 'appId': 'app', 'stageId': 0,
+                    'stageAttemptId': 0, 'numTasks': 20, 'submissionTime': 1000})
+    for taskId in range(20):
+        kernel.receive(task('sparkTaskStart', taskId))
+        kernel.receive(task('sparkTaskEnd', taskId))
+    kernel.receive({'msgtype': 'sparkStageCompleted', 'appId': 'app', 'stageId': 0,
+                    'stageAttemptId': 0, 'numTasks': 20, 'status': 'COMPLETED',
+                    'submissionTime': 1000, 'completionTime': 3000,
+                    'taskSummary': {'duration': {'sum': 20000}, 'io': {'inputBytes': 100}}})
+
+    completed = kernel.sent()[-1]
+    assert completed['throughput']['input']['bytes'] == 100
+    assert 'taskStats' not in completed
+    assert completed['eta']['stage'] is None
+    assert ('app', 0, 0) not in kernel.monitor.sampler.stages
+
+
+def test_api_without_the_extension(monkeypatch):
+    monkeypatch.setattr(kernelextension, 'monitor', None)
+    with pytest.raises(RuntimeError):
+        sparkmonitor.on('jobEnd', print)
+
+
+@pytest.mark.parametrize('call', [
+    lambda: kernelextension.get_stats(),
+    lambda: kernelextension.get_stage_summary(0),
+    lambda: kernelextension.get_stage_throughput(0),
+    lambda: kernelextension.get_cell_utilisation(),
+    lambda: kernelextension.get_critical_path(),
+    lambda: kernelextension.get_driver_bottleneck(),
+    lambda: kernelextension.get_cpu_governor(),
+    lambda: kernelextension.get_executor_memory(),
+    lambda: kernelextension.get_run_history(),
+    lambda: kernelextension.set_task_sampling(2),
+    lambda: kernelextension.set_listener_options(taskDetail='full'),
+    lambda: kernelextension.get_listener_options(),
+    lambda: kernelextension.profile_cell('pass'),
+])
+def test_getters_without_the_extension(monkeypatch, call):
+    monkeypatch.setattr(kernelextension, 'monitor', None)
+    with pytest.raises(RuntimeError):
+        call()
+
+
+def test_serve_stats_restarts_on_another_port(kernel):
+    monitor = kernel.monitor
+    try:
+        port = monitor.serve_stats()
+        assert monitor.serve_stats() == port
+        assert monitor.serve_stats(port) == port
+        first = monitor.prometheus
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        free = probe.getsockname()[1]
+        probe.close()
+        assert monitor.serve_stats(free) == free
+        assert monitor.prometheus is not first
+        assert first.server.socket.fileno() == -1
+    finally:
+        monitor.stop_stats()
+
+
+def test_tracing_without_the_extension(monkeypatch, tmp_path):
+    monkeypatch.setattr(kernelextension, 'monitor', None)
+    with pytest.raises(RuntimeError):
+        kernelextension.start_tracing(str(tmp_path / 'spans.jsonl'))
+    kernelextension.stop_tracing()
+
+
+def test_export_without_the_extension(monkeypatch, tmp_path):
+    monkeypatch.setattr(kernelextension, 'monitor', None)
+    with pytest.raises(RuntimeError):
+        sparkmonitor.export(str(tmp_path / 'runs'))
+
+
+def test_session_log_is_opt_in(kernel, tmp_path):
+    kernel.receive(task('sparkTaskEnd', 0))
+    assert kernel.monitor.session is None
+    with pytest.raises(RuntimeError):
+        sparkmonitor.export(str(tmp_path / 'runs'))
+
+    sparkmonitor.start_session_log(str(tmp_path / 'session.jsonl'))
+    kernel.receive(task('sparkTaskEnd', 1))
+    path = str(tmp_path / 'app.eventlog')
+    assert sparkmonitor.export(path, format='eventlog', appId='app') == {'events': 1}
+
+
+def test_run_history_is_opt_in(kernel, monkeypatch, tmp_path):
+    monkeypatch.delenv('SPARKMONITOR_HISTORY_FILE')
+    assert kernelextension.ScalaMonitor(None).history is None
+    assert sparkmonitor.kernelextension.get_run_history() == []
+
+    monkeypatch.setenv('SPARKMONITOR_HISTORY_FILE', str(tmp_path / 'history.sqlite'))
+    assert kernelextension.ScalaMonitor(None).history.store.path == str(tmp_path / 'history.sqlite')
+
+
+def test_kernel_consumers_request_task_records(kernel, tmp_path):
+    control = kernel.monitor.control
+    control.on_views('client', ['jobtable'])
+    assert control.sent['taskDetail'] == 'aggregate'
+
+    subscription = sparkmonitor.on('taskEnd', print)
+    assert control.sent['taskDetail'] == 'full'
+    sparkmonitor.off(subscription)
+    assert control.sent['taskDetail'] == 'aggregate'
+
+    kernel.monitor.start_tracing(str(tmp_path / 'spans.jsonl'), taskRate=0.1)
+    assert control.sent['taskDetail'] == 'full'
+    kernel.monitor.stop_tracing()
+    assert control.sent['taskDetail'] == 'aggregate'
+
+    sparkmonitor.start_session_log(str(tmp_path / 'session.jsonl'))
+    assert control.sent['taskDetail'] == 'full'
+
+
+def test_profile_cell_runs_a_cell_execution(kernel, monkeypatch):
+    cells = []
+
+    class Shell:
+        def run_cell(self, cell):
+            # The pre_run_cell hook of the profiled execution
+            kernelextension.run_id = 'profiled'
+            kernel.monitor.start_profiled_run('profiled')
+            cells.append(cell)
+            assert kernel.monitor.control.sent['taskDetail'] == 'full'
+            assert kernel.monitor.profilers['profiled'].runId == 'profiled'
+
+    monkeypatch.setattr(kernelextension, 'ip', Shell(), raising=False)
+    monkeypatch.setattr(kernelextension, 'run_id', 'outer')
+    report = kernelextension.profile_cell('%time df.count()\n')
+    assert cells == ['%time df.count()\n']
+    assert report.runId == 'profiled'
+    assert kernel.monitor.profilers == {}
+    assert kernelextension.run_id == 'outer'
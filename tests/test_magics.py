@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sparkmonitor.magics import sparkmonitor_magic
+
+
+@pytest.mark.parametrize('port', ['abc', '-1', '70000'])
+def test_stats_serve_rejects_invalid_ports(kernel, capsys, port):
+    sparkmonitor_magic('stats serve %s' % port)
+    out = capsys.readouterr().out
+    assert 'Invalid port: %s' % port in out
+    assert 'Usage:' in out
+    assert kernel.monitor.prometheus is None
+
+
+def test_sampling(kernel, capsys):
+    sparkmonitor_magic('sampling rate 10')
+    assert kernel.monitor.sampler.rate == 10
+    sparkmonitor_magic('sampling rate 0')
+    assert 'Invalid sampling setting' in capsys.readouterr().out
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import json
+from collections import namedtuple
+
+import pytest
+
+from sparkmonitor.polling import StatusPoller
+from sparkmonitor.stats import Metrics
+
+JobInfo = namedtuple('JobInfo', 'jobId stageIds status')
+StageInfo = namedtuple('StageInfo', 'stageId currentAttemptId name numTasks numActiveTasks '
+                                    'numCompletedTasks numFailedTasks')
+
+
+class Tracker:
+    """A StatusTracker of jobs of one stage each, the stage id being the job id"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.stageInfos = {}
+
+    def run(self, jobId, completed=0, numTasks=4, status='RUNNING'):
+        self.jobs[jobId] = JobInfo(jobId, [jobId], status)
+        active = 0 if status != 'RUNNING' else numTasks - completed
+        self.stageInfos[jobId] = StageInfo(jobId, 0, 'count at <cell>:%d' % jobId, numTasks,
+                                           active, completed, 0)
+
+    def getActiveJobsIds(self):
+        return [jobId for jobId, info in self.jobs.items() if info.status == 'RUNNING']
+
+    def getJobIdsForGroup(self, group=None):
+        return list(self.jobs)
+
+    def getJobInfo(self, jobId):
+        return self.jobs.get(jobId)
+
+    def getStageInfo(self, stageId):
+        return self.stageInfos.get(stageId)
+
+
+class SparkContext:
+    applicationId = 'app'
+    defaultParallelism = 4
+    _jsc = None
+
+    def __init__(self):
+        self.tracker = Tracker()
+
+    def statusTracker(self):
+        return self.tracker
+
+
+@pytest.fixture
+def poller():
+    messages = []
+    poller = StatusPoller(SparkContext(), lambda msg: messages.append(json.loads(msg)), Metrics())
+    poller.messages = messages
+    return poller
+
+
+def sent(poller, msgtype):
+    return [msg for msg in poller.messages if msg['msgtype'] == msgtype]
+
+
+def test_ended_jobs_are_not_replayed(poller):
+    tracker = poller.sc.tracker
+    for jobId in range(3):
+        tracker.run(jobId, completed=4, status='SUCCEEDED')
+    tracker.run(3, completed=1)
+    tracker.run(4, completed=4, status='SUCCEEDED')
+    tracker.run(5, completed=2)
+
+    assert poller.poll()
+    assert [msg['jobId'] for msg in sent(poller, 'sparkJobStart')] == [3, 5]
+    assert sent(poller, 'sparkJobEnd') == []
+    assert poller.lastJobId == 5
+
+
+def test_nothing_sent_for_an_idle_application(poller):
+    tracker = poller.sc.tracker
+    tracker.run(0, completed=4, status='SUCCEEDED')
+    assert not poller.poll()
+    assert poller.messages == []
+
+    # Jobs started after the first poll are all found, even if they already ended
+    tracker.run(1, completed=4, status='SUCCEEDED')
+    tracker.run(2, completed=1)
+    assert poller.poll()
+    assert [msg['jobId'] for msg in sent(poller, 'sparkJobStart')] == [1, 2]
+    assert [msg['jobId'] for msg in sent(poller, 'sparkJobEnd')] == [1]
+
+
+def test_job_progress(poller):
+    tracker = poller.sc.tracker
+    assert not poller.poll()
+    tracker.run(0, completed=1)
+    assert poller.poll()
+    assert [msg['msgtype'] for msg in poller.messages] == [
+        'sparkJobStart', 'sparkStageSubmitted', 'sparkStageActive']
+
+    del poller.messages[:]
+    assert poller.poll()
+    assert poller.messages == []  # Unchanged stages are not sent again
+
+    tracker.run(0, completed=4, status='SUCCEEDED')
+    assert not poller.poll()
+    [completed] = sent(poller, 'sparkStageCompleted')
+    assert completed['status'] == 'COMPLETED'
+    [end] = sent(poller, 'sparkJobEnd')
+    assert end['status'] == 'SUCCEEDED'
+    assert poller.jobs == {}
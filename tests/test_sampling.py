@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import pytest
+
+from sparkmonitor.sampling import TaskSampler
+
+
+def run_stage(sampler, numTasks, listenerRate=1, stageId=0):
+    """Feed the tasks of a stage, sampled by index by the listener, return the forwarded weights"""
+    weights = []
+    for index in range(numTasks):
+        if index % listenerRate:
+            continue
+        data = {'stageId': stageId, 'stageAttemptId': 0, 'taskId': 5000 + index, 'index': index,
+                'launchTime': 0, 'finishTime': 10}
+        if listenerRate > 1:
+            data['sampleWeight'] = listenerRate
+        start = sampler.accept(dict(data, msgtype='sparkTaskStart'), 'app')
+        end = sampler.accept(dict(data, msgtype='sparkTaskEnd'), 'app')
+        assert start == end
+        if start:
+            weights.append(start)
+    return weights
+
+
+def test_disabled_forwards_all():
+    weights = run_stage(TaskSampler(), 100)
+    assert weights == [1] * 100
+
+
+def test_rate():
+    weights = run_stage(TaskSampler(rate=10), 100000)
+    assert set(weights) == {10}
+    assert sum(weights) == pytest.approx(100000, rel=0.05)
+
+
+def test_rate_is_independent_of_the_listener():
+    # The listener keeps the tasks whose index is a multiple of 10, the kernel
+    # must not keep all of them again
+    weights = run_stage(TaskSampler(rate=10), 100000, listenerRate=10)
+    assert set(weights) == {100}
+    assert len(weights) == pytest.approx(1000, rel=0.15)
+    assert sum(weights) == pytest.approx(100000, rel=0.15)
+
+
+def test_reservoir():
+    random.seed(1)
+    K = 100
+    n = 100000
+    weights = run_stage(TaskSampler(reservoir=K), n)
+    assert weights[:K] == [1] * K
+    # Nothing is evicted, about K * (1 + ln(n / K)) tasks are forwarded
+    assert len(weights) == pytest.approx(K * (1 + math.log(n / K)), rel=0.15)
+    assert sum(weights) == pytest.approx(n, rel=0.15)
+
+
+def test_stage_completed_forgets_the_stage():
+    sampler = TaskSampler(rate=10)
+    run_stage(sampler, 1000, listenerRate=4)
+    assert sampler.stages[('app', 0, 0)].numStarted == 1000
+    assert sampler.stages[('app', 0, 0)].running == {}
+    sampler.on_stage_completed({'stageId': 0, 'stageAttemptId': 0}, 'app')
+    assert ('app', 0, 0) not in sampler.stages
+
+
+def task(msgtype, taskId):
+    return {'msgtype': msgtype, 'stageId': 0, 'stageAttemptId': 0, 'taskId': taskId}
+
+
+def test_enabling_sampling_mid_stage():
+    sampler = TaskSampler()
+    assert [sampler.accept(task('sparkTaskStart', t), 'app') for t in range(100)] == [1] * 100
+    sampler.configure(rate=10)
+    # The tasks started before keep their weight
+    assert [sampler.accept(task('sparkTaskEnd', t), 'app') for t in range(100)] == [1] * 100
+    assert sampler.stages[('app', 0, 0)].running == {}
+
+
+def test_disabling_sampling_mid_stage():
+    sampler = TaskSampler(rate=10)
+    starts = [sampler.accept(task('sparkTaskStart', t), 'app') for t in range(100)]
+    assert set(starts) == {0, 10}
+    sampler.configure()
+    # Dropped starts have their ends dropped, forwarded ones keep their weight
+    assert [sampler.accept(task('sparkTaskEnd', t), 'app') for t in range(100)] == starts
+    assert sampler.accept(task('sparkTaskEnd', 1000), 'app') == 1
+
+
+def test_configure():
+    sampler = TaskSampler()
+    with pytest.raises(ValueError):
+        sampler.configure(rate=0)
+    sampler.configure(reservoir=10)
+    assert sampler.enabled
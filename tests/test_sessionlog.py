@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import warnings
+
+import pytest
+
+from sparkmonitor.sessionlog import SessionLog, export_session
+from sparkmonitor.stats import Metrics
+
+
+def test_size_cap_counts_encoded_bytes(tmp_path):
+    path = str(tmp_path / 'session.jsonl')
+    log = SessionLog(Metrics(), path, maxBytes=400)
+    msg = json.dumps({'msgtype': 'sparkTaskEnd', 'host': u'hôte-été'}, ensure_ascii=False)
+    for _ in range(10):
+        log.write(msg, 'sparkTaskEnd', 'app')
+    log.write(json.dumps({'msgtype': 'sparkJobEnd', 'jobId': 0}), 'sparkJobEnd', 'app')
+    log.write(json.dumps({'msgtype': 'sparkStageActive'}), 'sparkStageActive', 'app')
+    messages = list(log.messages())
+    with open(path, 'rb') as f:
+        size = len(f.read())
+    assert log.bytes == size
+    # Task events past the cap are skipped, the others are kept
+    line = (json.dumps('app') + '\t' + msg + '\n').encode('utf-8')
+    assert sum(1 for m in messages if m['msgtype'] == 'sparkTaskEnd') == 400 // len(line)
+    assert messages[-1] == {'msgtype': 'sparkJobEnd', 'jobId': 0, 'appId': 'app'}
+    assert log.skipped.value > 0
+
+
+def test_event_log_export(tmp_path):
+    log = SessionLog(Metrics(), str(tmp_path / 'session.jsonl'))
+    messages = [
+        {'msgtype': 'sparkApplicationStart', 'appId': 'app', 'appName': 'a', 'startTime': 1,
+         'sparkUser': 'u', 'appAttemptId': 'null'},
+        {'msgtype': 'sparkJobStart', 'jobId': 0, 'submissionTime': 2, 'stageIds': [0],
+         'stageInfos': {'0': {'attemptId': 0, 'name': 'count', 'numTasks': 1}}},
+        {'msgtype': 'sparkTaskEnd', 'stageId': 0, 'stageAttemptId': 0, 'taskId': 0, 'index': 0,
+         'attemptNumber': 0, 'status': 'SUCCESS', 'launchTime': 3, 'finishTime': 5,
+         'metrics': {'executorComputingTime': 1, 'shuffleWriteTime': 1}},
+        {'msgtype': 'sparkJobEnd', 'jobId': 0, 'status': 'SUCCEEDED', 'completionTime': 6},
+    ]
+    for data in messages:
+        log.write(json.dumps(data), data['msgtype'], 'app')
+    path = str(tmp_path / 'app.eventlog')
+    assert export_session(log, path, 'eventlog') == {'events': 4}
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+    assert [e['Event'] for e in events] == [
+        'SparkListenerApplicationStart', 'SparkListenerJobStart', 'SparkListenerTaskEnd',
+        'SparkListenerJobEnd']
+    metrics = events[2]['Task Metrics']
+    assert metrics['Executor Run Time'] == 2
+    assert metrics['Shuffle Write Metrics']['Shuffle Write Time'] == 1000000
+    assert events[3]['Job Result'] == {'Result': 'JobSucceeded'}
+
+
+def application(appId, tasks=True):
+    """Messages of an application running a job of one stage and two tasks"""
+    messages = [
+        {'msgtype': 'sparkApplicationStart', 'appId': appId, 'appName': appId, 'startTime': 1,
+         'sparkUser': 'u', 'appAttemptId': 'null'},
+        {'msgtype': 'sparkJobStart', 'jobId': 0, 'runId': 'run', 'submissionTime': 2,
+         'stageIds': [0], 'numTasks': 2, 'status': 'RUNNING', 'jobGroup': 'null',
+         'stageInfos': {'0': {'attemptId': 0, 'name': 'count', 'numTasks': 2}}},
+        {'msgtype': 'sparkStageSubmitted', 'stageId': 0, 'stageAttemptId': 0, 'name': 'count',
+         'numTasks': 2, 'parentIds': [], 'jobIds': [0], 'submissionTime': 2, 'runId': 'run'},
+    ]
+    if tasks:
+        for taskId in range(2):
+            messages.append({
+                'msgtype': 'sparkTaskEnd', 'stageId': 0, 'stageAttemptId': 0, 'taskId': taskId,
+                'index': taskId, 'attemptNumber': 0, 'status': 'SUCCESS', 'launchTime': 3,
+                'finishTime': 5.0, 'executorId': '1', 'host': 'h', 'sampleWeight': 2,
+                'metrics': {'executorComputingTime': 2, 'inputBytes': 10}})
+    messages += [
+        {'msgtype': 'sparkStageCompleted', 'stageId': 0, 'stageAttemptId': 0, 'status': 'COMPLETED',
+         'numTasks': 2, 'numCompletedTasks': 2, 'numFailedTasks': 0, 'submissionTime': 2,
+         'completionTime': 6, 'taskDurationSum': 4, 'taskSummary': {'io': {'inputBytes': 20}}},
+        {'msgtype': 'sparkJobEnd', 'jobId': 0, 'status': 'SUCCEEDED', 'completionTime': 6},
+        {'msgtype': 'sparkExecutorAdded', 'executorId': '1', 'time': 1, 'host': 'h', 'numCores': 4},
+    ]
+    return messages
+
+
+def session(tmp_path, *applications):
+    log = SessionLog(Metrics(), str(tmp_path / 'session.jsonl'))
+    for appId, messages in applications:
+        for data in messages:
+            log.write(json.dumps(data), data['msgtype'], appId)
+    return log
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_table_export(tmp_path, format):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    log = session(tmp_path, ('app-1', application('app-1')), ('app/2', application('app/2')))
+    path = str(tmp_path / 'runs')
+    rows = export_session(log, path, format, cellOf=lambda runId: 'cell', chunkSize=1)
+    assert rows == {'applications': 2, 'jobs': 2, 'stages': 2, 'tasks': 4, 'executors': 2}
+
+    directory = os.path.join(path, 'tasks', 'appId=app%2F2')
+    if format == 'parquet':
+        tasks = pq.read_table(os.path.join(directory, 'part-00000.parquet'))
+    else:
+        tasks = pa.ipc.open_file(os.path.join(directory, 'part-00000.arrow')).read_all()
+    # A record batch or row group per chunk
+    assert tasks.num_rows == 2
+    tasks = tasks.to_pydict()
+    assert tasks['taskId'] == [0, 1]
+    assert tasks['finishTime'] == [5, 5]
+    assert tasks['sampleWeight'] == [2.0, 2.0]
+    assert tasks['inputBytes'] == [10, 10]
+
+
+def test_table_export_of_one_application(tmp_path):
+    pytest.importorskip('pyarrow')
+    log = session(tmp_path, ('app-1', application('app-1')), ('app-2', application('app-2')))
+    path = str(tmp_path / 'runs')
+    rows = export_session(log, path, 'parquet', appId='app-2')
+    assert rows['tasks'] == 2
+    assert os.listdir(os.path.join(path, 'tasks')) == ['appId=app-2']
+
+
+def test_event_log_of_one_application(tmp_path):
+    log = session(tmp_path, ('app-1', application('app-1')), ('app-2', application('app-2')))
+    path = str(tmp_path / 'app.eventlog')
+    # The last application started by default
+    assert export_session(log, path, 'eventlog') == {'events': 8}
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+    assert events[0]['App ID'] == 'app-2'
+
+    assert export_session(log, path, 'eventlog', appId='app-1') == {'events': 8}
+    with open(path) as f:
+        assert json.loads(f.readline())['App ID'] == 'app-1'
+
+
+def test_export_warns_without_task_records(tmp_path):
+    log = session(tmp_path, ('app', application('app', tasks=False)))
+    with pytest.warns(UserWarning, match='no task records'):
+        export_session(log, str(tmp_path / 'app.eventlog'), 'eventlog')
+
+    other = tmp_path / 'other'
+    other.mkdir()
+    log = session(other, ('app', application('app')))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        export_session(log, str(tmp_path / 'app.eventlog'), 'eventlog')
+
+
+def test_export_warns_when_the_log_is_full(tmp_path):
+    log = SessionLog(Metrics(), str(tmp_path / 'session.jsonl'), maxBytes=1000)
+    for data in application('app'):
+        log.write(json.dumps(data), data['msgtype'], 'app')
+    assert log.skipped.value == 1
+    with pytest.warns(UserWarning, match='1 task events were not logged'):
+        export_session(log, str(tmp_path / 'app.eventlog'), 'eventlog')
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_session(session(tmp_path), str(tmp_path / 'out'), 'csv')
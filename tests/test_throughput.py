@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from sparkmonitor.throughput import StageThroughput, stage_throughput
+
+
+def completed(**fields):
+    data = {
+        'msgtype': 'sparkStageCompleted', 'stageId': 1, 'stageAttemptId': 0,
+        'submissionTime': 1000, 'completionTime': 5000,
+        'taskSummary': {
+            'duration': {'sum': 8000},
+            'io': {'inputBytes': 4000, 'inputRecords': 40, 'shuffleWriteBytes': 800},
+            'executors': {'1': {'durationSum': 2000, 'bytesRead': 1000, 'bytesWritten': 200}},
+        },
+    }
+    data.update(fields)
+    return data
+
+
+def test_stage_throughput():
+    throughput = stage_throughput(completed())
+    assert throughput['elapsed'] == 4
+    assert throughput['taskSeconds'] == 8
+    assert throughput['input']['bytesPerSecond'] == 1000
+    assert throughput['input']['recordsPerSecond'] == 10
+    assert throughput['input']['bytesPerTaskSecond'] == 500
+    assert throughput['shuffleWrite']['bytes'] == 800
+    assert throughput['output']['bytesPerSecond'] == 0
+    assert throughput['executors']['1']['bytesPerTaskSecond'] == 600
+
+
+def test_without_summary():
+    assert stage_throughput({'msgtype': 'sparkStageActive'}) is None
+
+
+def test_active_stage_uses_emit_time_and_submission_time():
+    data = completed(msgtype='sparkStageActive', emitTime=3000)
+    del data['submissionTime']
+    throughput = StageThroughput()
+    throughput.on_message({'msgtype': 'sparkStageSubmitted', 'stageId': 1, 'stageAttemptId': 0,
+                           'submissionTime': 1000}, 'app')
+    assert throughput.on_message(data, 'app')['elapsed'] == 2
+
+
+def test_get_returns_last_attempt():
+    throughput = StageThroughput()
+    throughput.on_message(completed(), 'app')
+    throughput.on_message(completed(stageAttemptId=1, completionTime=3000), 'app')
+    assert throughput.get(1)['elapsed'] == 2
+    assert throughput.get(1, attemptId=0)['elapsed'] == 4
+    assert throughput.get(1, appId='other') is None
@@ -15,6 +15,9 @@ import { Cell } from '../../src/store/cell';
 import { CellWidget } from '../../src/components';
 import '../style/vscode.css';
 
+// Store of the summaries of reopened notebooks, which are not tied to a cell
+const SUMMARY_NOTEBOOK_ID = 'sparkmonitor-saved-summaries';
+
 // VS Code renderer API: activation function returning renderOutputItem
 export const activate: ActivationFunction = (context) => {
   const requestIdToElement = new Map<string, HTMLElement>();
@@ -97,12 +100,59 @@ export const activate: ActivationFunction = (context) => {
       notebookStore.cells[cellId] = new Cell(cellId, notebookStore);
     }
 
+    if (data && data.msgtype === 'regression') {
+      notebookStore.onRegression(data);
+    }
+    if (data && data.msgtype === 'utilisation') {
+      notebookStore.onUtilisation(data);
+    }
+    if (data && data.msgtype === 'criticalPath') {
+      notebookStore.onCriticalPath(data);
+    }
+    if (data && data.msgtype === 'driverBottleneck') {
+      notebookStore.onDriverBottleneck(data);
+    }
+    if (data && data.msgtype === 'executorAlert') {
+      notebookStore.onExecutorAlert(data);
+    }
+    if (data && data.msgtype === 'governor') {
+      notebookStore.onGovernor(data);
+    }
+
+    // The live events of the cell are kept, the summary adds nothing to them
+    if (data && data.msgtype === 'summary' && !notebookStore.hasCellData(cellId)) {
+      notebookStore.onCellSummary(cellId, data);
+    }
+
+    // Task messages of a batch, published once per batch by the kernel
+    if (data && data.msgtype === 'fromscalatasks') {
+      for (const msg of data.tasks) {
+        if (msg.msgtype === 'sparkTaskStart') {
+          notebookStore.onSparkTaskStart(msg);
+        } else if (msg.msgtype === 'sparkTaskEnd') {
+          notebookStore.onSparkTaskEnd(msg);
+        }
+      }
+    }
+
     // --- Handle SparkMonitor events here, with correct IDs ---
     if (data && data.msgtype === 'fromscala') {
       let msg = data.msg;
       if (typeof msg === 'string') {
         msg = JSON.parse(msg);
       }
+      if (data.weight !== undefined) {
+        // Weight of a sampled task event, set by the kernel
+        msg.weight = data.weight;
+      }
+      if (data.eta !== undefined) {
+        // Completion estimates of a stage and its jobs, set by the kernel
+        msg.eta = data.eta;
+      }
+      if (data.throughput !== undefined) {
+        // I/O throughput of a stage, computed by the kernel
+        msg.throughput = data.throughput;
+      }
       switch (msg['msgtype']) {
         case 'sparkJobStart':
           if (isCellReexecuted) {
@@ -137,12 +187,32 @@ export const activate: ActivationFunction = (context) => {
         case 'sparkExecutorRemoved':
           notebookStore.onSparkExecutorRemoved(msg);
           break;
+        case 'sparkExecutorMetrics':
+          notebookStore.onSparkExecutorMetrics(msg);
+          break;
         default:
           // Unknown or unhandled message type
           break;
       }
     }
 
+    mountCellWidget(element, notebookId, cellId);
+  }
+
+  /**
+   * Renders the summary saved in the output of a reopened notebook. It has
+   * no display id to find its cell, the output is its own cell.
+   */
+  function renderSummary(element: HTMLElement, outputId: string, data: any) {
+    const notebookId = SUMMARY_NOTEBOOK_ID;
+    if (!store.notebooks[notebookId]) {
+      store.notebooks[notebookId] = new NotebookStore(notebookId);
+    }
+    store.notebooks[notebookId].onCellSummary(outputId, data);
+    mountCellWidget(element, notebookId, outputId);
+  }
+
+  function mountCellWidget(element: HTMLElement, notebookId: string, cellId: string) {
     let root = rootCache.get(cellId);
     if (!root) {
       const cellWidgetElement = React.createElement(CellWidget, { notebookId, cellId });
@@ -173,6 +243,10 @@ export const activate: ActivationFunction = (context) => {
         msg = JSON.parse(msg);
       }
       const display_id = outputItem?.metadata?.transient?.display_id || null;
+      if (!display_id && data.msgtype === 'summary') {
+        renderSummary(element, outputItem.id, data);
+        return;
+      }
       if (!display_id) {
         console.warn('No display_id found in outputItem metadata');
         return;